@@ -0,0 +1,262 @@
+"""
+Benchmark: time each stage of the modelling and visualization pipeline on
+synthetic data of increasing size, to see which stages break down first as the
+models get bigger.
+
+Run from the repo root, e.g.:
+    python benchmarks/benchPipeline.py --sizes 1000 10000 100000
+    python benchmarks/benchPipeline.py --stages griddata prism_mesh --repeat 5
+
+Results are written to ./working/benchmarks/ as JSON (with the machine and
+package versions) and CSV (one row per stage and size).
+A stage that can't run here (e.g. no triangle package or executable) is
+recorded as skipped with the reason, the rest still run.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.raster import read_esri_ascii
+from tools.prismMesh import build_prisms, prism_faces
+
+triExeName = './models/triangle.exe'
+out_dir = './working/benchmarks/'
+tmp_dir = tempfile.mkdtemp(prefix='flopyVedo-bench-')
+
+
+#################
+# synthetic data
+
+def surface(x, y):
+    """A smooth, hilly surface: something like a DEM or a geologic layer."""
+    return (300 + 40 * np.sin(x / 3000.) * np.cos(y / 2000.) +
+            15 * np.sin(x / 700. + y / 900.))
+
+
+def domain_for(ncells):
+    """Square domain with 50 m cells, that has about ncells raster cells."""
+    side = max(2, int(np.sqrt(ncells)))
+    return side, side * 50.
+
+
+def random_points(n, extent, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n, 2)) * extent
+
+
+def triangle_grid(ncells, extent):
+    """cell2d/vertices of a structured triangle mesh with ~ncells triangles."""
+    nside = max(1, int(np.sqrt(ncells / 2)))
+    v = np.linspace(0, extent, nside + 1)
+    vx, vy = np.meshgrid(v, v)
+    vertices = np.column_stack((np.arange(vx.size), vx.ravel(), vy.ravel()))
+    ids = np.arange(vx.size).reshape(vx.shape)
+    ll, lr = ids[:-1, :-1].ravel(), ids[:-1, 1:].ravel()
+    ul, ur = ids[1:, :-1].ravel(), ids[1:, 1:].ravel()
+    tris = np.vstack((np.column_stack((ll, ul, lr)), np.column_stack((lr, ul, ur))))
+    centres = vertices[tris, 1:3].mean(axis=1)
+    cell2d = np.column_stack((np.arange(len(tris)), centres, np.full(len(tris), 3), tris))
+    return cell2d, vertices
+
+
+#################
+# stages: each takes a size, does its setup and returns the function to time
+
+def stage_dem_load(size):
+    nside, extent = domain_for(size)
+    fname = os.path.join(tmp_dir, 'dem{}.txt'.format(nside))
+    if not os.path.exists(fname):
+        x = (np.arange(nside) + 0.5) * 50.
+        z = surface(x[None, :], x[::-1, None])
+        with open(fname, 'w') as f:
+            f.write('ncols {0}\nnrows {0}\nxllcorner 0\nyllcorner 0\n'
+                    'cellsize 50\nNODATA_value -9999\n'.format(nside))
+            np.savetxt(f, z, fmt='%.2f')
+    return lambda: read_esri_ascii(fname, use_cache=False).z
+
+
+def stage_triangle_mesh(size):
+    from tools.triangleMesh import Triangle, triangle_lib
+    if triangle_lib is None and not os.path.exists(triExeName):
+        raise RuntimeError('skipped: no triangle package or ' + triExeName)
+    _, extent = domain_for(size)
+    ws = os.path.join(tmp_dir, 'tri')
+    os.makedirs(ws, exist_ok=True)
+
+    def run():
+        # no cache, this times the meshing itself
+        tri = Triangle(angle=30, model_ws=ws, exe_name=triExeName, use_cache=False)
+        tri.add_polygon([(0, 0), (0, extent), (extent, extent), (extent, 0)])
+        tri.add_region((5, 5), 0, maximum_area=extent * extent / size)
+        tri.build()
+        return tri.get_cell2d()
+    return run
+
+
+def stage_griddata(size):
+    from scipy.interpolate import griddata
+    _, extent = domain_for(size)
+    src = random_points(size, extent)
+    zsrc = surface(src[:, 0], src[:, 1])
+    cell2d, vertices = triangle_grid(size, extent)
+
+    def run():
+        zc = griddata(src, zsrc, (cell2d[:, 1], cell2d[:, 2]), method='linear')
+        zv = griddata(src, zsrc, (vertices[:, 1], vertices[:, 2]), method='linear')
+        return zc, zv
+    return run
+
+
+def stage_prism_mesh(size, nlay=10):
+    _, extent = domain_for(size)
+    cell2d, vertices = triangle_grid(size, extent)
+    top = surface(cell2d[:, 1], cell2d[:, 2])
+    elevations = top[None, :] - 10. * np.arange(nlay + 1)[:, None]
+
+    def run():
+        points, prisms = build_prisms(cell2d, vertices, elevations)
+        return prism_faces(prisms, triangulate=True)
+    return run
+
+
+def stage_krige_3d(size, nsamples=300):
+    from pykrige.ok3d import OrdinaryKriging3D
+    rng = np.random.default_rng(0)
+    xyz = rng.random((nsamples, 3)) * [40., 40., 20.]
+    val = np.exp(-((xyz - [20, 20, 10]) ** 2).sum(axis=1) / 50.)
+    targets = rng.random((size, 3)) * [40., 40., 20.]
+
+    def run():
+        ok3d = OrdinaryKriging3D(xyz[:, 0], xyz[:, 1], xyz[:, 2], val,
+                                 variogram_model='spherical')
+        return ok3d.execute('points', targets[:, 0], targets[:, 1], targets[:, 2])
+    return run
+
+
+def plume_points(size):
+    from vedo import Points
+    rng = np.random.default_rng(0)
+    xyz = rng.random((size, 3)) * [40., 40., 20.]
+    val = np.exp(-((xyz - [20, 20, 10]) ** 2).sum(axis=1) / 50.)
+    return Points(xyz).addPointArray(val, name='val')
+
+
+def stage_interpolate_to_volume(size):
+    from vedo import interpolateToVolume
+    pts = plume_points(size)
+    return lambda: interpolateToVolume(pts, kernel='shepard', radius=3,
+                                       dims=(60, 60, 30))
+
+
+def stage_isosurface(size):
+    from vedo import Volume
+    n = max(4, int(round(size ** (1 / 3.))))
+    g = np.linspace(-1, 1, n)
+    xx, yy, zz = np.meshgrid(g, g, g, indexing='ij')
+    vol = Volume(np.exp(-(xx ** 2 + yy ** 2 + zz ** 2) * 3))
+    return lambda: vol.isosurface(0.3)
+
+
+def stage_x3d_export(size):
+    from vedo import Mesh, Plotter, exportWindow
+    _, extent = domain_for(size)
+    cell2d, vertices = triangle_grid(size, extent)
+    pts = np.column_stack((vertices[:, 1:3], surface(vertices[:, 1], vertices[:, 2])))
+    mesh = Mesh([pts, cell2d[:, 4:7].astype(int)])
+    plt = Plotter(offscreen=True)
+    plt.show(mesh, interactive=False)
+    fname = os.path.join(tmp_dir, 'bench.x3d')
+    return lambda: exportWindow(fname)
+
+
+stages = {
+    'dem_load': stage_dem_load,
+    'triangle_mesh': stage_triangle_mesh,
+    'griddata': stage_griddata,
+    'prism_mesh': stage_prism_mesh,
+    'krige_3d': stage_krige_3d,
+    'interpolate_to_volume': stage_interpolate_to_volume,
+    'isosurface': stage_isosurface,
+    'x3d_export': stage_x3d_export,
+}
+
+
+#################
+# running and reporting
+
+def versions():
+    out = {'python': platform.python_version()}
+    for name in ('numpy', 'scipy', 'flopy', 'triangle', 'pykrige', 'vedo', 'vtk'):
+        try:
+            out[name] = __import__(name).__version__
+        except Exception:
+            out[name] = None
+    return out
+
+
+def run_stage(name, size, repeat):
+    row = {'stage': name, 'size': size, 'status': 'ok', 'repeat': repeat,
+           'wall_min': None, 'wall_median': None, 'cpu_median': None, 'error': ''}
+    try:
+        func = stages[name](size)
+        walls, cpus = [], []
+        for _ in range(repeat):
+            t0, c0 = time.perf_counter(), time.process_time()
+            func()
+            walls.append(time.perf_counter() - t0)
+            cpus.append(time.process_time() - c0)
+        row.update(wall_min=min(walls), wall_median=float(np.median(walls)),
+                   cpu_median=float(np.median(cpus)))
+    except Exception as e:
+        msg = str(e)
+        row['status'] = 'skipped' if msg.startswith('skipped') else 'error'
+        row['error'] = '{}: {}'.format(type(e).__name__, msg)
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='data sizes (points/cells/targets) to run each stage at')
+    parser.add_argument('--stages', nargs='+', default=list(stages),
+                        choices=list(stages))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=out_dir)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for name in args.stages:
+        for size in args.sizes:
+            row = run_stage(name, size, args.repeat)
+            rows.append(row)
+            if row['status'] == 'ok':
+                print('{:<22}{:>10}{:>12.4f} s'.format(name, size, row['wall_median']))
+            else:
+                print('{:<22}{:>10}  {}'.format(name, size, row['error']))
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(args.out, 'bench-' + stamp)
+    with open(base + '.json', 'w') as f:
+        json.dump({'time': stamp, 'machine': platform.platform(),
+                   'cpu_count': os.cpu_count(), 'versions': versions(),
+                   'results': rows}, f, indent=2)
+    with open(base + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print('results written to ' + base + '.json/.csv')
+    return rows
+
+
+if __name__ == '__main__':
+    main()
@@ -10,9 +10,13 @@ import pandas as pd
 from vedo import Plotter, delaunay2D, Grid, Points
 from scipy.interpolate import griddata
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.offscreen import headless, SceneExporter
+
 # Create a plotter
 plt = Plotter(axes=dict(xtitle='m', ytitle='m', ztitle='m (vertical ex)', yzGrid=False),
-              bg2='lb', size=(1000, 700))  # screen size
+              bg2='lb', size=(1000, 700), offscreen=headless())  # screen size
 v_exag = 10
 
 #################
@@ -63,4 +67,8 @@ plt += dnovian_resampled_points
 
 for a in plt.actors:
     a.scale([1, 1, 1*v_exag])
-plt.show(viewup="z", interactorStyle=10)  # check out interactor style options
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(viewup="z", interactive=False)
+    SceneExporter(plt, name='01_makeGridOntoLayer').views(formats=('png', 'x3d'))
+else:
+    plt.show(viewup="z", interactorStyle=10)  # check out interactor style options
@@ -3,14 +3,18 @@ Example: Make a flowpy Triangular grid and interpolate it onto another surface.
 """
 import os
 import flopy
-from flopy.utils.triangle import Triangle as Triangle
-# import numpy as np
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as mplt
-from scipy.interpolate import griddata
 
 from vedo import *
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.surfaceSampler import SurfaceSampler
+from tools.triangleMesh import Triangle  # in-process, cached meshes (flopy API)
+from tools.offscreen import headless, SceneExporter
+
 #################
 xllcorner = 42991.5
 yllcorner = 43524.1  # this is the bottom left corner:
@@ -47,42 +51,29 @@ vertices = tri.get_vertices()  # verticy: [index, x, y]
 ncpl = tri.ncpl  # number of cells per layer
 nvert = tri.nvert  # number of vertex pairs
 
-plt = Plotter(axes=7,bg2='lb', size=(1000, 700))  # set up the plotter
+plt = Plotter(axes=7,bg2='lb', size=(1000, 700), offscreen=headless())  # set up the plotter
 
 # the data to interpolate off of:
 denovian = pd.read_csv('./input_files/DenovianGeologicLayer.csv', sep=',')
 denovian_s = delaunay2D(denovian.values - [0,0,100]).opacity(0.6).c('green')   #shift slightly for better rendering
 plt += denovian_s 
 
-# # first interpolate the cell centres onto the surface
-x = []
-y = []
-for f in cell2d:
-    x.append(f[1])
-    y.append(f[2])
-
-z = griddata(
-    denovian[["x", "y"]].values,  # the x,y pairs
-    denovian["z"].values,
-    (x, y), 
-    method='linear')
+# triangulate the surface once, then sample it at both the cell centres and the verticies:
+denovian_sampler = SurfaceSampler.from_dataframe(denovian)
+x = [f[1] for f in cell2d]
+y = [f[2] for f in cell2d]
+vx = [f[1] for f in vertices]
+vy = [f[2] for f in vertices]
+z, vz = denovian_sampler.sample_many([np.column_stack((x, y)),
+                                      np.column_stack((vx, vy))])
 
+# # the cell centres on the surface
 cell_centres = pd.DataFrame(data={'x': x, 'y': y, 'z': z})
 
 plt += Points(cell_centres.values, r=3).c('blue3')
 
-# # and/or interpolate the cell verticies onto the surface
-x = []
-y = []
-for f in vertices:
-    x.append(f[1])
-    y.append(f[2])
-z = griddata(
-    denovian[["x", "y"]].values, 
-    denovian["z"].values,
-    (x, y),
-    method='linear')
-vertices = pd.DataFrame(data={'x': x, 'y': y, 'z': z})
+# # and/or the cell verticies on the surface
+vertices = pd.DataFrame(data={'x': vx, 'y': vy, 'z': vz})
 
 plt += delaunay2D(vertices.values).lc('b').lw(1).opacity(0.8)
 
@@ -90,5 +81,9 @@ v_exag = 10
 
 for a in plt.actors:
     a.scale([1, 1, 1*v_exag])
-plt.show( viewup="z", interactorStyle=10, interactive=True)
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(viewup="z", interactive=False)
+    SceneExporter(plt, name='02_flopyTriangle').views(formats=('png', 'x3d'))
+else:
+    plt.show( viewup="z", interactorStyle=10, interactive=True)
 
@@ -12,6 +12,10 @@ import matplotlib.pyplot as mplt
 
 from vedo import *
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.offscreen import headless, SceneExporter
+
 # a coarse surface:
 denovian = pd.read_csv('./input_files/DenovianGeologicLayer.csv', sep=',')
 # shift slightly for better rendering
@@ -22,7 +26,7 @@ denovian_points = Points(denovian.values * [1, 1, 10], r=7).c('blue3')
 # denovian_s3 = denovian_s.clone().smoothWSinc(niter=20, passBand=0.1, edgeAngle=15, featureAngle=60)
 denovian_s3 = denovian_s.clone().subdivide(N=2, method=1).smoothWSinc().computeNormals()
 
-plt = Plotter(N=2, axes=1, bg2='lb', size=(1000, 700))  # set up the plotter
+plt = Plotter(N=2, axes=1, bg2='lb', size=(1000, 700), offscreen=headless())  # set up the plotter
 
 plt.show(denovian_s, 'input surface', at=0,viewup="z", interactorStyle=10)
 plt += denovian_points
@@ -30,4 +34,8 @@ plt += denovian_points
 plt.show(denovian_s3, 'input surface', at=1)
 plt += denovian_points
 
-plt.show(interactive=True, viewup="z",  interactorStyle=10)
\ No newline at end of file
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(viewup="z", interactive=False)
+    SceneExporter(plt, name='03_smoothGeoSurface').views(formats=('png', 'x3d'))
+else:
+    plt.show(interactive=True, viewup="z",  interactorStyle=10)
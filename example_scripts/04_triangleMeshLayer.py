@@ -6,21 +6,30 @@ Display the triangles and explode the surfaces.
 import numpy as np
 import pandas as pd
 import vedo as vd
-from scipy.interpolate import griddata
 import flopy
-from flopy.utils.triangle import Triangle as Triangle
 import matplotlib.pyplot as mplt
 
-
-# Domain:
-xllcorner = 42991.5
-yllcorner = 43524.1
-cellsize = 50
-total_x = 961*cellsize
-total_y = 885*cellsize
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.raster import read_esri_ascii
+from tools.demPyramid import DemPyramid
+from tools.surfaceSampler import SurfaceSampler
+from tools.rasterSampler import RasterSampler
+from tools.prismMesh import build_prisms, prism_faces
+from tools.triangleMesh import Triangle  # in-process, cached meshes (flopy API)
+from tools.offscreen import headless, SceneExporter
+from tools.webExport import export_glb
+
+# Ground surface: an ESRI Ascii grid, the header gives the domain:
+dem = read_esri_ascii("./input_files/dem50mEsriAscii.txt")
+xllcorner = dem.xllcorner
+yllcorner = dem.yllcorner
+cellsize = dem.cellsize
+total_x = dem.total_x
+total_y = dem.total_y
 
 plt = vd.Plotter(axes=dict(xtitle='m', ytitle='m', ztitle='m 10:1 (V:H)', yzGrid=False),
-                 bg2='lb', size=(1000, 700))  # screen size
+                 bg2='lb', size=(1000, 700), offscreen=headless())  # screen size
 v_exag = 10
 
 # the sufcace to interpolate onto:
@@ -28,25 +37,11 @@ denovian = pd.read_csv('./input_files/DenovianGeologicLayer.csv', sep=',')
 denovian_s = vd.delaunay2D(denovian.values  - [0,0,1800])
 plt += denovian_s.c('green2')
 
-# Ground surface: an ESRI Ascii grid. Here's how to convert it to something usable:
-dem = np.loadtxt("./input_files/dem50mEsriAscii.txt", skiprows=6)
-# instantiate coordinates
-x = []
-y = []
-z = []
-xcoord = xllcorner
-ycoord = yllcorner + total_y  # iterator will work through top letft to bottom right
-# # make lists for the df, note list appending is faster than df appending
-for row in dem:
-    xcoord = xllcorner
-    for col in row.T:
-        x.append(xcoord)
-        y.append(ycoord)
-        z.append(col)
-        xcoord += cellsize
-    ycoord -= cellsize
+# the picture doesn't need the full resolution, so use a block averaged level
+# of the DEM (cached in ./working/cache/) rather than every 20th point:
+dem_pyramid = DemPyramid(dem)
 land_surface = pd.DataFrame(
-    data={'x': x, 'y': y, 'z': z}).iloc[::20]  # note this last bit a crude resample to 1:20 points, because we really don't need huge resolution
+    dem_pyramid.for_max_points(20000).xyz(), columns=['x', 'y', 'z'])
 
 landSurface = vd.delaunay2D(land_surface.values + [0,0,1000]) # plot it
 zvals = landSurface.points()[:, 2] # get the z values to color it
@@ -75,76 +70,29 @@ nvert = tri.nvert  # number of vertex pairs
 # get the coordinates of the cell centers:
 x = cell2d[:, 1]
 y = cell2d[:, 2]
-# interpolate cell centers onto the Denovian:
-z = griddata(
-    denovian[["x", "y"]].values,  # the x,y pairs
-    denovian["z"].values,
-    (x, y),
-    method='linear')
-denovian_top_cells = pd.DataFrame(data={'x': x, 'y': y, 'z': z})
-
-vertices2 = []
-cellIndexs2 = []
-for idx, cell in enumerate(np.hstack((cell2d, denovian_top_cells))):
-    for vert in cell[4:7]:
-        vertices2.append(
-            [vertices[int(vert), 1],
-             vertices[int(vert), 2],
-             cell[9]])
-    cellIndexs2.append([idx*3, idx*3+1, idx*3+2])
-
-# interpolate points onto the land surface:
-z = griddata(
-    land_surface[["x", "y"]].values,  # the x,y pairs
-    land_surface["z"].values,
-    (x, y),
-    method='linear')
-land_surface_top_cells = pd.DataFrame(data={'x': x, 'y': y, 'z': z})
-
-vertices3 = []
-cellIndexs3 = []
-for idx, cell in enumerate(np.hstack((cell2d, land_surface_top_cells))):
-    for vert in cell[4:7]:
-        vertices3.append(
-            [vertices[int(vert), 1],
-             vertices[int(vert), 2],
-             cell[9]])
-    cellIndexs3.append([idx*3, idx*3+1, idx*3+2])
-
-
-layer_vert = np.vstack((vertices2, vertices3))
+# interpolate cell centers onto the Denovian (the triangulation is cached in ./working/cache/):
+denovian_z = SurfaceSampler.from_dataframe(denovian).sample(x, y)
 
-layer_cell = []
-length = len(vertices2)
+# interpolate points onto the land surface, bilinear straight off the DEM grid
+# (the thinned points above are only for the picture):
+land_surface_z = RasterSampler(dem).sample(x, y)
 
-for idx, cell in enumerate(cellIndexs2):
-    layer_cell.append([cell[0],
-                       cellIndexs3[idx][0]+length,
-                       cellIndexs3[idx][1]+length,
-                       cell[1]])
-    layer_cell.append([cell[2],
-                       cellIndexs3[idx][2]+length,
-                       cellIndexs3[idx][1]+length,
-                       cell[1]])
-    layer_cell.append([cell[0],
-                       cellIndexs3[idx][0]+length,
-                       cellIndexs3[idx][2]+length,
-                       cell[2]])
-    layer_cell.append([cell[0],
-                       cellIndexs3[idx][0]+length,
-                       cellIndexs3[idx][2]+length,
-                       cell[2]])
-    layer_cell.append([cell[0], cell[1], cell[2]])
-    layer_cell.append([cellIndexs3[idx][0]+length,
-                    cellIndexs3[idx][1]+length,
-                    cellIndexs3[idx][2]+length])
+# the layer is land surface down to the Denovian. More layers are just more
+# rows in this (nlay+1, ncpl) stack, like top and botm in the DISV package:
+elevations = np.vstack((land_surface_z, denovian_z))
+layer_vert, prisms = build_prisms(cell2d, vertices, elevations)
 
-layer_mesh = vd.Mesh([layer_vert, np.array(layer_cell,dtype=object)])
+layer_mesh = vd.Mesh([layer_vert, prism_faces(prisms)])
 plt += layer_mesh.c('yellow3').opacity(0.8)
 plt += layer_mesh.clone().wireframe().c('blue')
 
 for a in plt.actors:
     a.scale([1, 1, 1*v_exag])
-plt.show(viewup="z", interactorStyle=10)
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(viewup="z", interactive=False)
+    SceneExporter(plt, name='04_triangleMeshLayer').views(formats=('png', 'x3d'))
+else:
+    plt.show(viewup="z", interactorStyle=10)
 
 # vd.exportWindow('floPyTriangles.x3d') #Optional: export to html for embedding
+# export_glb(plt, './working/renders/floPyTriangles.glb')  # Optional: much smaller binary glTF + html viewer, see tools/webExport.py
@@ -13,6 +13,11 @@ import random
 from pykrige.ok3d import OrdinaryKriging3D
 from pykrige.uk3d import UniversalKriging3D
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.krigGrid import grid_points, krig_grid
+from tools.offscreen import headless, SceneExporter
+
 
 # here is the input data,
 x = [0, 2, 3, 7, 15, 8, 5, 20, 23, 30, 45, 38, 22,10]
@@ -35,18 +40,10 @@ opntx = np.arange(float(min(x)), max(x), 1)
 opnty = np.arange(float(min(y)), max(y), 1)
 opntz = np.arange(float(min(z)), max(z), 1)
 
-# this will make the point x,y,z lists needed:
-x1 = []
-y1 = []
-z1 = []
-for x in opntx:
-    for y in opnty:
-        for z in opntz:
-            x1.append(x)
-            y1.append(y)
-            z1.append(z)
-
-k3d1, ss3d = ok3d.execute("points", x1, y1, z1)
+# krig the whole grid in one call, then flatten it to the x,y,z points:
+k3d, ss3d = krig_grid(ok3d, opntx, opnty, opntz)
+x1, y1, z1 = grid_points(opntx, opnty, opntz)
+k3d1 = k3d.ravel()
 
 out_pnts = pd.DataFrame(data={'x': x1, 'y': y1, 'z': z1, 'val': k3d1})
 
@@ -61,13 +58,17 @@ outpts = Points(out_pnts[["x", "y", "z"]].values,
 
 
 
-plt = Plotter(axes=1, bg2='lb', size=(1000, 700))  # set up the plotter
+plt = Plotter(axes=1, bg2='lb', size=(1000, 700), offscreen=headless())  # set up the plotter
 
 plt += inpnts
 
 plt += outpts.addScalarBar3D(sy=30, title='Concentration') #output points
 
-plt.show(viewup="z", interactorStyle=10)
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(viewup="z", interactive=False)
+    SceneExporter(plt, name='05_simpleKrig').views(formats=('png', 'x3d'))
+else:
+    plt.show(viewup="z", interactorStyle=10)
 
 
 
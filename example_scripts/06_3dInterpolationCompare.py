@@ -14,6 +14,12 @@ import random
 from pykrige.ok3d import OrdinaryKriging3D
 from pykrige.uk3d import UniversalKriging3D
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.krigGrid import grid_points, krig_grid, grid_to_volume
+from tools.krigCache import krig_cache_key, cached_krig
+from tools.offscreen import headless, SceneExporter
+
 
 # here is the input data,
 x = [0, 2, 3, 7, 15, 8, 5, 20, 23, 30, 45, 38, 22, 10, 30, 20]
@@ -28,26 +34,21 @@ in_pts = pd.DataFrame(data={'x': x, 'y': y, 'z': z, 'val': val})
 inpnts = Points(in_pts[["x", "y", "z"]].values,
                 r=10).cmap("jet", in_pts[["val"]])
 
-ok3d = OrdinaryKriging3D(
-    x, y, z, val, variogram_model="linear", nlags=4)
+krig_settings = dict(variogram_model="linear", nlags=4)
 
 # next, use points not a grid. Could help with some grid nonsense later.
 opntx = np.arange(float(min(x))-5, max(x)+5, 1)  # note: must be float
 opnty = np.arange(float(min(y))-5, max(y)+5, 1)
 opntz = np.arange(float(min(z))-5, max(z)+5, 1)
 
-# this will make the point x,y,z lists needed:
-x1 = []
-y1 = []
-z1 = []
-for x in opntx:
-    for y in opnty:
-        for z in opntz:
-            x1.append(x)
-            y1.append(y)
-            z1.append(z)
-
-k3d1, ss3d = ok3d.execute("points", x1, y1, z1)
+# krig the whole grid in one call (or load it from ./working/cache/ if nothing
+# changed since the last run), then flatten it to the x,y,z points:
+krig_key = krig_cache_key(data=(x, y, z, val), grid=(opntx, opnty, opntz),
+                          **krig_settings)
+k3d, ss3d = cached_krig(krig_key, lambda: krig_grid(
+    OrdinaryKriging3D(x, y, z, val, **krig_settings), opntx, opnty, opntz))
+x1, y1, z1 = grid_points(opntx, opnty, opntz)
+k3d1 = k3d.ravel()
 
 out_pnts = pd.DataFrame(data={'x': x1, 'y': y1, 'z': z1, 'val': k3d1})
 
@@ -55,8 +56,8 @@ outpts = Points(out_pnts[["x", "y", "z"]].values,
                 r=4).cmap("jet", out_pnts[["val"]])
 
 
-krigVol = interpolateToVolume(outpts.addPointArray(
-    out_pnts[["val"]], name='val'), kernel='shepard', radius=1, dims=(60, 60, 20)).cmap("jet")
+# the krig is already on a regular grid, so it goes straight into a volume:
+krigVol = grid_to_volume(k3d, opntx, opnty, opntz).cmap("jet")
 
 shepardVol = interpolateToVolume(inpnts.addPointArray(
     in_pts[["val"]], name='val'), kernel='shepard', radius=3, dims=(60, 60, 20)).cmap("jet")
@@ -68,7 +69,7 @@ gaussianVol = interpolateToVolume(inpnts.addPointArray(
     in_pts[["val"]], name='val'), kernel='gaussian', radius=3, dims=(60, 60, 20)).cmap("jet")
 
 
-plt = Plotter(N=6, axes=1, bg2='lb', size=(1000, 700))  # set up the plotter
+plt = Plotter(N=6, axes=1, bg2='lb', size=(1000, 700), offscreen=headless())  # set up the plotter
 
 plt.show(outpts, 'Inputs, and krig grid', viewup="z", at=0, interactorStyle=10)
 plt += inpnts.addScalarBar3D(sy=30, title='Concentration')  # output points
@@ -88,4 +89,8 @@ plt += gaussianVol.isosurface(10)
 lego = krigVol.legosurface(vmin=10, cmap="jet")
 plt.show(lego,'lego of krig isosurface', at=5,)
 
-plt.show(interactive=True)
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(interactive=False)
+    SceneExporter(plt, name='06_3dInterpolationCompare').views(formats=('png', 'x3d'))
+else:
+    plt.show(interactive=True)
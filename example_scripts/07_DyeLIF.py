@@ -4,7 +4,8 @@ This script does what I would normally do in EVS, but with python
 It is based on this work: 
 https://ngwa.onlinelibrary.wiley.com/doi/abs/10.1111/gwmr.12296
 http://www.dakotatechnologies.com/services/dyelif
-It takes a few minutes to run
+The variogram is fitted on a subset of the readings and the kriging is done
+locally (nearest readings only), so it runs in seconds rather than minutes
 """
 
 from vedo import Plotter, Points, interpolateToVolume, Lines, exportWindow
@@ -18,6 +19,21 @@ import random
 from pykrige.ok3d import OrdinaryKriging3D
 from pykrige.uk3d import UniversalKriging3D
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.krigGrid import krig_grid, grid_to_volume
+from tools.localKrig import LocalKriging3D
+from tools.parallelKrig import ParallelKriging3D
+from tools.krigCache import krig_cache_key, cached_krig
+from tools.stageTimer import Trace
+from tools.offscreen import headless, SceneExporter
+from tools.webExport import export_glb
+
+# per stage timings, set FLOPYVEDO_TRACE=1 to write them to ./working/traces/
+trace = Trace('07_DyeLIF')
+
+trace.begin('load')
+
 dye_lif_in = pd.read_csv('./input_files/DyeLIF.csv', sep=",")
 # .iloc[::3] # downsample if it's slow for you
 
@@ -32,42 +48,49 @@ opntx = np.arange(float(min(x)), max(x), 1)
 opnty = np.arange(float(min(y)), max(y), 1)
 opntz = np.arange(float(min(z)), max(z), .5)
 
-# First step of the kriging model: calculate the kriging statistics:
-ok3d = OrdinaryKriging3D(
-    x, y, z, napl,
+trace.record(dye_lif_in=dye_lif_in)
+trace.begin('krige')
+
+# kriging settings, these (with the csv and the grid) are the cache key below:
+fit_every = 1  # fit the variogram on every Nth reading, e.g. 3 if the fit is too slow
+n_closest = 32
+krig_settings = dict(
     # the spherical model is used commonly in these interpolations
     variogram_model="spherical",
-    verbose=True,  # optional, I like to see the output
-    enable_plotting=False,
     anisotropy_scaling_z=10)  # note anisotropy in the Z direction
 
-# this will make the point x,y,z lists needed for the krigging output:
-x1 = []
-y1 = []
-z1 = []
-for x in opntx:
-    for y in opnty:
-        for z in opntz:
-            x1.append(x)
-            y1.append(y)
-            z1.append(z)
-
-# apply the kriging model over the points:
-k3d1, ss3d = ok3d.execute("points", x1, y1, z1)
-
-# apply the kriging model over the points:
-out_pnts = pd.DataFrame(data={'x': x1, 'y': y1, 'z': z1, 'val': k3d1})
-
-# process the kriging output: first make points then interpolate into a vedo grid:
-outpts = Points(out_pnts[["x", "y", "z"]].values,
-                r=6).cmap("jet", out_pnts[["val"]])
-
-krigVol = interpolateToVolume(
-    outpts.addPointArray(out_pnts[["val"]], name='val'),
-    kernel='linear',
-    dims=(len(opntx), len(opnty), len(opntz)),
-    radius=1)
-# note dims=() here is the using the same grid as the krig, so it looks nice. Not manditory, but pretty.
+
+def krige():
+    # First step of the kriging model: calculate the kriging statistics.
+    # pykrige's fit gets slow quickly with the number of readings, fit_every > 1
+    # fits the variogram on a subset (all of them are still used for the kriging):
+    ok3d = OrdinaryKriging3D(
+        x[::fit_every], y[::fit_every], z[::fit_every], napl[::fit_every],
+        verbose=True,  # optional, I like to see the output
+        enable_plotting=False,
+        **krig_settings)
+
+    # apply the kriging model over the whole output grid in one call, each grid
+    # point only uses its 32 nearest readings (in the anisotropy scaled space):
+    local_krig = LocalKriging3D(ok3d, n_closest=n_closest, x=x, y=y, z=z, values=napl)
+    # spread the grid over all the CPU cores. Threads, so this script doesn't need
+    # an if __name__ == '__main__': guard on Windows (see tools/parallelKrig.py)
+    parallel_krig = ParallelKriging3D(local_krig, backend='threads')
+    return krig_grid(parallel_krig, opntx, opnty, opntz)
+
+
+# the kriging only runs if the csv, settings or grid changed since the last run,
+# otherwise the results come from ./working/cache/
+krig_key = krig_cache_key('./input_files/DyeLIF.csv', grid=(opntx, opnty, opntz),
+                          fit_every=fit_every, n_closest=n_closest, **krig_settings)
+k3d, ss3d = cached_krig(krig_key, krige)
+
+trace.record(k3d=k3d)
+trace.begin('volumes')
+
+# the output is already a regular grid, so it goes straight into a vedo volume
+# with the same origin and spacing as the krig grid (no resampling needed):
+krigVol = grid_to_volume(k3d, opntx, opnty, opntz)
 
 # For reference, lets show a linear interpolation:
 dye_lif_in_pts = Points(
@@ -77,8 +100,10 @@ simpleInterpolate = interpolateToVolume(
     dims=(30, 30, 30),
     radius=1).cmap("jet")
 
+trace.begin('render')
+
 # Plotting and output:
-plt = Plotter(N=4, axes=1, bg2='lb', size=(1000, 800))  # set up the plotter
+plt = Plotter(N=4, axes=1, bg2='lb', size=(1000, 800), offscreen=headless())  # set up the plotter
 
 dye_lif_pnts_filt = dye_lif_in[dye_lif_in["napl"] > 0.3]
 
@@ -111,6 +136,13 @@ plt.show(borings, at=3,)
 plt += napl_detection
 plt += krigVol.isosurface(0.2).opacity(0.5).c("red")
 
-plt.show(interactive=True)
+trace.finish()
+
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    plt.show(interactive=False)
+    SceneExporter(plt, name='07_DyeLIF').views(formats=('png', 'x3d'))
+else:
+    plt.show(interactive=True)
 
 # exportWindow('DyeLif.x3d') #Optional: export to html for embedding
+# export_glb(plt, './working/renders/DyeLif.glb')  # Optional: much smaller binary glTF + html viewer, see tools/webExport.py
@@ -4,6 +4,12 @@ import matplotlib.pyplot as plt
 import flopy
 import numpy as np
 
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.binaryOutput import MappedHeadFile
+from tools.offscreen import headless
+from tools.scenarioRunner import ScenarioRunner
+from tools.simWriter import write_changed
+
 mf6exe = "./models/mf6.exe"
 exe_name_mf = "./models/mf2005.exe"
 exe_name_mt = "./models/mt3dms.exe"
@@ -305,7 +311,9 @@ def build_model(
             concentrationprintrecord=[
                 ("COLUMNS", 10, "WIDTH", 15, "DIGITS", 6, "GENERAL")
             ],
-            saverecord=[("CONCENTRATION", "LAST"), ("BUDGET", "LAST")],
+            # every step saved when animating, the animation plays the steps
+            saverecord=[("CONCENTRATION", "ALL" if animateModel else "LAST"),
+                        ("BUDGET", "LAST")],
             printrecord=[("CONCENTRATION", "LAST"), ("BUDGET", "LAST")],
         )
 
@@ -324,7 +332,7 @@ def build_model(
 
 
 def write_model(sim, silent=True):
-    sim.write_simulation(silent=silent)
+    write_changed(sim, silent=silent)
 
 
 def run_model(sim, silent=True):
@@ -344,7 +352,8 @@ def plot_results(mf6, idx, ax=None):
         fname_mf6 = os.path.join(
             mf6_out_path, list(mf6.model_names)[1] + ".ucn"
         )
-        ucnobj_mf6 = flopy.utils.HeadFile(
+        # memory-mapped: only the steps that get used are read off the disk
+        ucnobj_mf6 = MappedHeadFile(
             fname_mf6, precision="double", text="CONCENTRATION"
         )
 
@@ -358,7 +367,7 @@ def plot_results(mf6, idx, ax=None):
 
         ax.plot(
             np.linspace(0, l, ncol),
-            conc_mf6[0, 0, 0, :],
+            conc_mf6[-1, 0, 0, :],  # the last saved step
             "^",
             markeredgewidth=0.5,
             color="blue",
@@ -374,6 +383,71 @@ def plot_results(mf6, idx, ax=None):
         ax.legend()
 
 
+def animate_results(mf6):
+    # the plume moving down the column in 3D, one step per frame
+    import vedo
+    import vtk
+    from vtk.util import numpy_support
+    from tools.stepAnimation import StepAnimation
+
+    fname_mf6 = os.path.join(
+        mf6.simulation_data.mfpath.get_sim_path(),
+        list(mf6.model_names)[1] + ".ucn",
+    )
+    ucnobj_mf6 = MappedHeadFile(fname_mf6, text="CONCENTRATION")
+
+    # the same cells as the model, for a DISV model use
+    # tools.prismMesh.to_vtk_grid(*build_prisms(...)) instead
+    grid = vtk.vtkRectilinearGrid()
+    grid.SetDimensions(ncol + 1, nrow + 1, nlay + 1)
+    for axis, edges in zip(
+        ("X", "Y", "Z"),
+        (np.arange(ncol + 1) * delr, np.arange(nrow + 1) * delc, [botm, top]),
+    ):
+        coords = numpy_support.numpy_to_vtk(np.asarray(edges, dtype=float), deep=True)
+        getattr(grid, "Set{}Coordinates".format(axis))(coords)
+
+    vplt = vedo.Plotter(size=(1000, 400), offscreen=headless())
+    anim = StepAnimation(
+        vplt, grid, ucnobj_mf6, vmin=0.0, vmax=c0, hide_below=0.01,
+        time_units=time_units,
+    )
+    anim.actor.SetScale(1, 20, 20)  # the column is 1000 x 1 x 1 m
+    vplt.renderer.ResetCamera()
+    if headless():  # FLOPYVEDO_HEADLESS=1: PNG frames in ./working/renders/
+        anim.export_frames(fps=24, duration=8, name=mf6.name)
+    else:
+        anim.play(fps=24, duration=8)
+
+
+def final_concentration(sim):
+    # what the sweep keeps of each run: the last concentration profile
+    fname = os.path.join(sim.simulation_data.mfpath.get_sim_path(),
+                         list(sim.model_names)[1] + ".ucn")
+    return np.array(MappedHeadFile(fname, text="CONCENTRATION").get_data()[0, 0])
+
+
+def sweep(parameters, n_workers=None):
+    # all the cases at once, each in ./working/scenarios/<name>/
+    runner = ScenarioRunner(
+        build_model, postprocess=final_concentration, n_workers=n_workers,
+        backend="threads",  # no __main__ guard in this script
+    )
+    results = runner.run(parameters)
+    results.save()
+    print(results)
+    if len(results.failed):
+        print(results.failed[["status", "error"]])
+
+    fig, ax = plt.subplots(1, 1, tight_layout=True)
+    for name, conc in results.outputs.items():
+        ax.plot(np.linspace(0, l, ncol), conc, label=name)
+    ax.set_xlabel("Distance, in m")
+    ax.set_ylabel("Concentration")
+    ax.legend()
+    return results
+
+
 def scenario(idx, silent=False):
     key = list(parameters.keys())[idx]
     parameter_dict = parameters[key]
@@ -383,10 +457,18 @@ def scenario(idx, silent=False):
     success = run_model(sim, silent=silent)
     if success:
         plot_results(sim, idx)
+        if animateModel:
+            animate_results(sim)
 
 
 plotModel = True
 buildModel = True
+animateModel = False
+runSweep = False  # all of parameters at once instead of one scenario at a time
+
+if runSweep:
+    sweep(parameters)
+    plt.show()
 
 # advection
 scenario(0)
@@ -3,7 +3,14 @@ import pandas as pd
 import math
 # import vedo as vedo
 import flopy
-from flopy.utils.triangle import Triangle as Triangle
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.triangleMesh import Triangle  # in-process, cached meshes (flopy API)
+from tools.binaryOutput import MappedHeadFile
+from tools.boundaries import stress_period_data
+from tools.ensemble import Ensemble
+from tools.randomField import RandomField
+from tools.simWriter import write_changed
 import os as os
 import matplotlib.pyplot as mplt
 
@@ -50,61 +57,90 @@ botm = [0.]
 # properties
 k = 0.0001
 mean, sigma = -4, 1 # mean and standard deviation of the random k field
-k = 10**np.random.normal(mean, sigma, ncpl)
+# k = 10**np.random.normal(mean, sigma, ncpl)  # uncorrelated, cell by cell
+# log10 k correlated over ~20 m along 30 degrees, ~5 m across
+kField = RandomField(np.asarray(tri.get_xcyc()), model='exponential', len_scale=(20, 5),
+                     angle=30, mean=mean, sill=sigma**2, log10=True)
+k = kField(np.random.default_rng())
 
 name = 'mfsimple'
 
-sim = flopy.mf6.MFSimulation(sim_name=name, version="mf6",
-                             exe_name=mf6ExeName, sim_ws=workspace
-                             )
+# make boundaries, all the cells at once
+leftcells = np.unique(tri.get_edge_cells(4))  # zero based
+rightcells = np.unique(tri.get_edge_cells(2))
+chdList = stress_period_data('chd', np.concatenate((leftcells, rightcells)),
+                             head=np.repeat([30., 20.], [len(leftcells), len(rightcells)]))
 
-# time domain
-tdis = flopy.mf6.ModflowTdis(sim, time_units='SECONDS',
-                             perioddata=[[100.0, 1, 1.]])
 
-gwf = flopy.mf6.ModflowGwf(sim, modelname=name, save_flows=True)
+def build_model(name, k):
+    sim = flopy.mf6.MFSimulation(sim_name=name, version="mf6",
+                                 exe_name=mf6ExeName, sim_ws=workspace
+                                 )
 
-ims = flopy.mf6.ModflowIms(sim, print_option='SUMMARY', complexity='complex',
-                           outer_dvclose=0.0001, inner_dvclose=0.0001)
+    # time domain
+    tdis = flopy.mf6.ModflowTdis(sim, time_units='SECONDS',
+                                 perioddata=[[100.0, 1, 1.]])
 
+    gwf = flopy.mf6.ModflowGwf(sim, modelname=name, save_flows=True)
 
-# discretization:
-dis = flopy.mf6.ModflowGwfdisv(gwf, length_units='METERS',
-                               nlay=nlay, ncpl=ncpl, nvert=nvert,
-                               top=top, botm=botm,
-                               vertices=vertices, cell2d=cell2d)
+    ims = flopy.mf6.ModflowIms(sim, print_option='SUMMARY', complexity='complex',
+                               outer_dvclose=0.0001, inner_dvclose=0.0001)
 
-# Node property flow, requrired. Provides K, and what do to with saturation, at a minimum.
-npf = flopy.mf6.ModflowGwfnpf(gwf, k=k)
-# npf = flopy.mf6.ModflowGwfnpf(gwf, k=[1,2,3,4,4,3,2,1])
+    # discretization:
+    dis = flopy.mf6.ModflowGwfdisv(gwf, length_units='METERS',
+                                   nlay=nlay, ncpl=ncpl, nvert=nvert,
+                                   top=top, botm=botm,
+                                   vertices=vertices, cell2d=cell2d)
 
+    # Node property flow, requrired. Provides K, and what do to with saturation, at a minimum.
+    npf = flopy.mf6.ModflowGwfnpf(gwf, k=k)
+    # npf = flopy.mf6.ModflowGwfnpf(gwf, k=[1,2,3,4,4,3,2,1])
 
-ic = flopy.mf6.ModflowGwfic(gwf, strt=10.0)
+    ic = flopy.mf6.ModflowGwfic(gwf, strt=10.0)
 
-# make boundaries
-chdList = []
-leftcells = tri.get_edge_cells(4)  # not 0 indexed
-rightcells = tri.get_edge_cells(2)
+    chd = flopy.mf6.ModflowGwfchd(gwf, stress_period_data=chdList)
 
-for icpl in leftcells:
-    chdList.append([(0, icpl), 30])
-for icpl in rightcells:
-    chdList.append([(0, icpl), 20])
+    # output controls
+    oc = flopy.mf6.ModflowGwfoc(gwf,
+                                budget_filerecord='{}.cbc'.format(name),
+                                head_filerecord='{}.hds'.format(name),
+                                saverecord=[('HEAD', 'LAST'),
+                                            ('BUDGET', 'LAST')],
+                                printrecord=[('HEAD', 'LAST'),
+                                             ('BUDGET', 'LAST')])
+    return sim
 
-chd = flopy.mf6.ModflowGwfchd(gwf, stress_period_data=chdList)
 
-# output controls
-oc = flopy.mf6.ModflowGwfoc(gwf,
-                            budget_filerecord='{}.cbc'.format(name),
-                            head_filerecord='{}.hds'.format(name),
-                            saverecord=[('HEAD', 'LAST'),
-                                        ('BUDGET', 'LAST')],
-                            printrecord=[('HEAD', 'LAST'),
-                                         ('BUDGET', 'LAST')])
+def final_heads(sim):
+    gwf = sim.get_model(list(sim.model_names)[0])
+    fname = os.path.join(sim.simulation_data.mfpath.get_sim_path(), gwf.name + '.hds')
+    return np.array(MappedHeadFile(fname).get_data()[:, 0, :])  # (nlay, ncpl)
+
+
+# Monte Carlo: statistics of the heads over many K fields instead of one run
+# (nRealizations = 0 for the single run below)
+nRealizations = 0
+
+if nRealizations:
+    print('run {} realizations...'.format(nRealizations))
+    ens = Ensemble(build_model, kField, final_heads, seed=42, warm_start=True,
+                   backend='threads')  # no __main__ guard in this script
+    stats = ens.run(nRealizations)  # run again to carry on after an interruption
+    print(ens.iterations_saved()[['outer_saved', 'inner_saved']].mean())  # rough, vs. cold mean
+    fig, axes = mplt.subplots(1, 3, figsize=(15, 4))
+    for ax, a, title in zip(axes, (stats.mean[0], stats.std[0], stats.quantile(0.95)[0]),
+                            ('mean head', 'std head', '95% head')):
+        ax.set_aspect('equal')
+        ax.set_title(title)
+        mplt.colorbar(tri.plot(ax=ax, a=a, cmap='Spectral'), ax=ax, fraction=0.02)
+    mplt.show()
+    sys.exit()
+
+sim = build_model(name, k)
 
 # # Run the Mdoel
 print('run GWF model...')
-sim.write_simulation()
+write_changed(sim, silent=False)  # only the packages that changed since the last run
 success, buff = sim.run_simulation()
 
 
@@ -115,7 +151,7 @@ print('process outputs from GWF model...')
 
 fname = os.path.join(workspace, name + '.hds')  # TODO: Dict filepaths
 
-hdobj = flopy.utils.HeadFile(fname, precision='double')
+hdobj = MappedHeadFile(fname)  # memory-mapped, same get_data() as flopy's HeadFile
 head = hdobj.get_data()
 
 ax = mplt.subplot(1, 1, 1, aspect='equal')
@@ -3,55 +3,59 @@ import numpy as np
 import pandas as pd
 
 from vedo import *
-from scipy.interpolate import griddata
 
 import flopy
-from flopy.utils.triangle import Triangle as Triangle
 
 import matplotlib.pyplot as mplt
 
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.raster import read_esri_ascii
+from tools.demPyramid import DemPyramid
+from tools.terrainLod import TerrainLOD
+from tools.surfaceSampler import SurfaceSampler
+from tools.rasterSampler import RasterSampler
+from tools.zonalStats import ZonalStats
+from tools.stageTimer import Trace
+from tools.triangleMesh import Triangle  # in-process, cached meshes (flopy API)
+from tools.boundaries import CellLocator, stress_period_data
+from tools.simWriter import write_changed
+from tools.meshSizing import SizeFunction, size_to_area
+from tools.offscreen import headless, SceneExporter
+
+# per stage timings, set FLOPYVEDO_TRACE=1 to write them to ./working/traces/
+trace = Trace('minetteSite')
+
 # Create a plotter 
 plt = Plotter(axes=dict(xtitle='m', ytitle='m', ztitle='m (vertical ex)', yzGrid=False),
-              bg2='lb', size=(1000,700)) # screen size
+              bg2='lb', size=(1000,700), offscreen=headless()) # screen size
 v_exag = 10
 
 #################
 #  Make the land surface: based on the example from A. Pollack, SCRF
+trace.begin('load')
 print('load land surface...')
-dem  = np.loadtxt("./input_files/dem50mEsriAscii.txt", skiprows=6)
-# TODO: read in these values from the .txt
-xllcorner = 42991.5
-yllcorner = 43524.1 # this is the bottom left corner:
-cellsize = 50
-total_x = 961*cellsize
-total_y = 885*cellsize
-
-# instantiate coordinates
-x = []
-y = []
-z = []
-xcoord = xllcorner
-ycoord = yllcorner + total_y #iterator will work through top letft to bottom right
-# # make lists for the df, note list appending is faster than df appending
-for row in dem:
-    xcoord = xllcorner
-    for col in row.T:
-        x.append(xcoord)
-        y.append(ycoord)
-        z.append(col)
-        xcoord += cellsize
-    ycoord -= cellsize  
-land_surface = pd.DataFrame(data={'x': x, 'y': y, 'z': z}).iloc[::5] # make the x,y,z data frame
-#Note the iloc ::5 is taking every 5th row. A crude resample to lower run time
-print('interpolate mesh of land surface...')
-
-landSurface = delaunay2D(land_surface.values) # plot it 
-zvals = landSurface.points()[:, 2] # get the z values to color it
-landSurface.cmap("terrain", zvals) 
-landSurface.name = "Land Surface" # give the object a name
-
-# Plot it:
-plt += landSurface 
+dem = read_esri_ascii("./input_files/dem50mEsriAscii.txt")
+xllcorner = dem.xllcorner
+yllcorner = dem.yllcorner # this is the bottom left corner:
+cellsize = dem.cellsize
+total_x = dem.total_x
+total_y = dem.total_y
+
+# block averaged copies of the DEM, each stage picks the resolution it needs
+# (a lot less points to triangulate, and no striping like .iloc[::5] gave)
+dem_pyramid = DemPyramid(dem)
+trace.record(dem=dem.z)
+trace.begin('mesh_land_surface')
+print('decimate land surface...')
+
+# a few versions of the land surface, decimated to within 1, 4, 16 and 64 m
+# (cached), the one on screen is switched by how far away the camera is
+land_lod = TerrainLOD(dem, pyramid=dem_pyramid)
+land_lod.add_to(plt)
+
+# contours off the 4 m level, they only need to look right
+landSurface = land_lod.actors[1]
 plt += landSurface.isolines(5).lw(1).c('k').opacity(0.2)
 
 #################
@@ -65,6 +69,7 @@ plt += landSurface.isolines(5).lw(1).c('k').opacity(0.2)
 
 #################
 #  Make the denovian layer:
+trace.begin('load_denovian')
 print('load and plot denovian top...')
 denovian = pd.read_csv('./input_files/DenovianGeologicLayer.csv', sep=',')
 denovian_s = delaunay2D(denovian.values).opacity(0.6) # plot it 
@@ -75,6 +80,7 @@ plt += denovian_s
 ##############3#
 # Make the triangles:
 
+trace.begin('mesh')
 print('make triangles...')
 
 workspace = './working/'
@@ -88,12 +94,19 @@ active_domain = [(xllcorner, yllcorner),
 
 max_area = total_x*total_y/400  # hack for discretization to start
 
+# cells of max_area over most of the domain, refined down to 100 m cells at the
+# boreholes (growing by 30% of the distance away from them):
+boreholes = pd.read_csv('./input_files/SectionBHsGeothermalPaper.csv', sep=',')
+bh_cell_size = 100
+sizing = SizeFunction(base_size=np.sqrt(max_area / size_to_area(1)))
+sizing.add_points(boreholes[['x', 'y']].values, size=bh_cell_size, grading=0.3)
+
 # Tringle mesh creation
-tri = Triangle(angle=30, model_ws=workspace, exe_name=triExeName)
+tri = Triangle(angle=30, model_ws=workspace, exe_name=triExeName, size_function=sizing)
 tri.add_polygon(active_domain)
 tri.add_region((xllcorner+5, yllcorner+5), 0,
                maximum_area=max_area)
-tri.build()
+tri.build(verbose=True)
 
 
 # Configuration of the triangular discretization modflow DISV package
@@ -107,29 +120,26 @@ nvert = tri.nvert  # number of vertex pairs
 # mplt.show()
 
 # # first interpolate the cell centres onto the surface
+trace.record(cell2d=cell2d, vertices=vertices)
+trace.begin('interpolate')
 print('interpolate triangles onto denovian...')
 
-x = []
-y = []
-for f in cell2d:
-    x.append(f[1])
-    y.append(f[2])
+x = [f[1] for f in cell2d]
+y = [f[2] for f in cell2d]
 
-z = griddata(
-    denovian[["x", "y"]].values,  # the x,y pairs
-    denovian["z"].values,
-    (x, y), 
-    method='linear')
+# the triangulation of each surface is built once and cached in ./working/cache/
+z = SurfaceSampler.from_dataframe(denovian).sample(x, y)
 
 denovian_top_cells = pd.DataFrame(data={'x': x, 'y': y, 'z': z})
 plt += Points(denovian_top_cells.values, r=3).c('blue3')
 
 print('interpolate triangles onto ground surface...')
-z = griddata(
-    land_surface[["x", "y"]].values,  # the x,y pairs
-    land_surface["z"].values,
-    (x, y), 
-    method='linear')
+# cells bigger than a DEM pixel get the area weighted mean of the pixels in
+# them (weights cached per mesh, reused for any raster on the DEM's grid),
+# smaller ones bilinear straight off the DEM grid
+dem_zones = ZonalStats(cell2d, vertices, dem)
+z = np.where(dem_zones.cell_area > dem.cellsize ** 2, dem_zones.mean(dem),
+             RasterSampler(dem).sample(x, y))
 surface_cells = pd.DataFrame(data={'x': x, 'y': y, 'z': z})
 
 plt += Points(surface_cells.values, r=3).c('blue3')
@@ -137,6 +147,7 @@ plt += Points(surface_cells.values, r=3).c('blue3')
 
 ###############################33
 # set up simple model here
+trace.begin('build_model')
 print('build GWF model...')
 
 
@@ -181,26 +192,36 @@ npf = flopy.mf6.ModflowGwfnpf(gwf, k=k)
 # initial conditions, required. Simply the starting head for now.
 ic = flopy.mf6.ModflowGwfic(gwf, strt=10.0)
 
-chdList = []
-
 # print(tri.get_edge_cells(1))
 # print(tri.get_edge_cells(2))
 # print(tri.get_edge_cells(3))
 # print(tri.get_edge_cells(4))
 
-leftcells = tri.get_edge_cells(4) # not 0 indexed
-rightcells = tri.get_edge_cells(2)
+# boundary cells picked by geometry (lines, polygons, raster masks), all at once
+cells = CellLocator(cell2d, vertices)
+inset = 0.01  # the cells along the south and north edges, just inside the domain
+
+
+def edge_cells(y):
+    found, length = cells.along_polyline([(xllcorner, y), (xllcorner + total_x, y)],
+                                         lengths=True)
+    return found[length > 1.]  # not the ones only touching it at a corner
+
 
-for icpl in leftcells: chdList.append([(0, icpl), 30])
-for icpl in rightcells: chdList.append([(0, icpl), 20])
+# the same cells as triangle's edge markers 4 (south) and 2 (north)
+southcells = edge_cells(yllcorner + inset)
+northcells = edge_cells(yllcorner + total_y - inset)
+chdList = stress_period_data('chd', np.concatenate((southcells, northcells)),
+                             head=np.repeat([30., 20.], [len(southcells), len(northcells)]))
 
 chd = flopy.mf6.ModflowGwfchd(gwf, stress_period_data=chdList)
 
-# # # drain nodes from the example:
-# # drnCells = tri.get_edge_cells(5) + tri.get_edge_cells(7)
-# # drnList = []
-# # for icpl in drnCells: drnList.append([(0, icpl), 7.5, 0.10])
-# # chd = flopy.mf6.ModflowGwfdrn(gwf, stress_period_data=drnList)
+# # # drain cells along a line, e.g. a creek, conductance by length in each cell:
+# # drnCells, drnLength = cells.along_polyline(creek_xy, lengths=True)
+# # drnList = stress_period_data('drn', drnCells, elev=7.5, cond=0.10 * drnLength)
+# # drn = flopy.mf6.ModflowGwfdrn(gwf, stress_period_data=drnList)
+# # # or the cells where the land is low:
+# # drnCells = cells.in_raster(dem, dem.z < 250)
 
 # oc = flopy.mf6.ModflowGwfoc(gwf,
 #                             budget_filerecord='{}.cbc'.format(name),
@@ -210,16 +231,25 @@ chd = flopy.mf6.ModflowGwfchd(gwf, stress_period_data=chdList)
 #                             printrecord=[('HEAD', 'LAST'),
 #                                          ('BUDGET', 'LAST')])
 
-sim.write_simulation()
+trace.begin('write_changed')
+write_changed(sim, silent=False)  # only the packages that changed since the last run
 
+trace.begin('run_simulation')
 success, buff = sim.run_simulation()
+trace.end()
 
 
 ##############################
 
 #################
 # #### Vertical Ex and plot:
+trace.begin('render')
 for a in plt.actors:
       a.scale([1, 1, 1*v_exag])
-plt.show(viewup="z",interactorStyle=10) #check out interactor style options
+plt.show(viewup="z",interactorStyle=10, interactive=False) #check out interactor style options
+trace.finish()
+if headless():  # FLOPYVEDO_HEADLESS=1: pictures in ./working/renders/ instead of a window
+    SceneExporter(plt, name='minetteSite').views(formats=('png', 'x3d'))
+else:
+    interactive()
 
@@ -2,7 +2,11 @@ import numpy as np
 import pandas as pd
 # import vedo as vedo
 import flopy
-from flopy.utils.triangle import Triangle as Triangle
+import sys
+sys.path.append('.')  # scripts run from the repo root, this finds ./tools/
+from tools.triangleMesh import Triangle  # in-process, cached meshes (flopy API)
+from tools.binaryOutput import MappedHeadFile
+from tools.boundaries import stress_period_data
 import os as os
 import matplotlib.pyplot as mplt
 
@@ -76,15 +80,11 @@ npf = flopy.mf6.ModflowGwfnpf(gwf, k=k)
 
 ic = flopy.mf6.ModflowGwfic(gwf, strt=10.0)
 
-# make boundaries
-chdList = []
-leftcells = tri.get_edge_cells(4)  # not 0 indexed
-rightcells = tri.get_edge_cells(2)
-
-for icpl in leftcells:
-    chdList.append([(0, icpl), 30])
-for icpl in rightcells:
-    chdList.append([(0, icpl), 20])
+# make boundaries, all the cells at once
+leftcells = np.unique(tri.get_edge_cells(4))  # zero based
+rightcells = np.unique(tri.get_edge_cells(2))
+chdList = stress_period_data('chd', np.concatenate((leftcells, rightcells)),
+                             head=np.repeat([30., 20.], [len(leftcells), len(rightcells)]))
 
 chd = flopy.mf6.ModflowGwfchd(gwf, stress_period_data=chdList)
 
@@ -113,7 +113,7 @@ print('process outputs from GWF model...')
 
 fname = os.path.join(workspace, name + '.hds')  # TODO: Dict filepaths
 
-hdobj = flopy.utils.HeadFile(fname, precision='double')
+hdobj = MappedHeadFile(fname)  # memory-mapped, same get_data() as flopy's HeadFile
 head = hdobj.get_data()
 
 ax = mplt.subplot(1, 1, 1, aspect='equal')
@@ -0,0 +1,10 @@
+"""
+Reusable bits shared by the example and scratch scripts.
+
+The scripts are run from the repo root (they read ./input_files/ and write
+./working/), so add the root to the path before importing, e.g.:
+
+    import sys
+    sys.path.append('.')
+    from tools.raster import read_esri_ascii
+"""
@@ -0,0 +1,185 @@
+"""
+Memory-mapped reading of MODFLOW binary head / concentration files (.hds, .ucn).
+
+flopy's HeadFile.get_alldata() reads every record into one new array, which
+for thousands of transport steps on 100k+ cells is more RAM than we have.
+MappedHeadFile maps the file instead and indexes the records once: in the
+usual case (every record the same size) the file is viewed as an array of
+[header, values] records, so the values of all the records are one strided
+numpy view over the file, nothing is read until it's used:
+
+    hds = MappedHeadFile('./working/gwf-p01-mf6.hds')
+    hds.get_data(kstpkper=(0, 0))     # (nlay, nrow, ncol) view of one step
+    hds.get_data(step=-1)             # the last saved step
+    hds.get_alldata()[::10]           # every 10th step, still a view
+    hds.get_ts((0, 0, 50))            # [[totim, value], ...] of one cell
+    hds.series((0, 0, 50))            # the same values as a view
+
+One record per layer per saved step, like flopy's HeadFile (MODFLOW 6 and
+the older MODFLOW heads, header kstp, kper, pertim, totim, text, ncol, nrow,
+ilay) and UcnFile (MT3DMS / MT3D-USGS .ucn, header ntrans, kstp, kper,
+totim, text, ...), which one is worked out from the first header. DISV
+files have nrow = 1 and ncol = ncpl, so the arrays are (nlay, 1, ncpl) like
+flopy's. get_data's idx is a record number like flopy's (the step that
+record is in), step= is the saved step number.
+"""
+import numpy as np
+
+
+layouts = ('modflow', 'mt3d')
+
+
+def header_dtype(precision, layout='modflow'):
+    real = '<f8' if precision == 'double' else '<f4'
+    if layout == 'mt3d':
+        steps = [('ntrans', '<i4'), ('kstp', '<i4'), ('kper', '<i4'), ('totim', real)]
+    else:
+        steps = [('kstp', '<i4'), ('kper', '<i4'), ('pertim', real), ('totim', real)]
+    return np.dtype(steps + [('text', 'S16'), ('ncol', '<i4'), ('nrow', '<i4'),
+                             ('ilay', '<i4')])
+
+
+def _is_label(text):
+    return bool(text.strip()) and all(32 <= c < 127 for c in text.strip())
+
+
+def detect_format(raw):
+    """
+    (precision, layout) of a file, from where the text label of the first
+    header sits. Single precision MODFLOW and MT3D headers have it in the
+    same place, there the third number tells them apart: MODFLOW's pertim
+    is a real, MT3D's kper a small integer.
+    """
+    for precision in ('double', 'single'):
+        for layout in layouts:
+            hdr = header_dtype(precision, layout)
+            if len(raw) < hdr.itemsize or not _is_label(raw[:hdr.itemsize].view(hdr)[0]['text']):
+                continue
+            if precision == 'single':
+                third = int(raw[8:12].view('<i4')[0])
+                layout = 'mt3d' if 0 < third < 2 ** 23 else 'modflow'
+            return precision, layout
+    raise ValueError('not a MODFLOW / MT3D binary head or concentration file')
+
+
+class MappedHeadFile:
+    """
+    precision: 'double', 'single' or 'auto'.
+    layout: 'modflow' (.hds, MODFLOW 6 .ucn), 'mt3d' (MT3DMS / MT3D-USGS .ucn)
+    or 'auto'.
+    text: only use records with this label (e.g. 'CONCENTRATION'), by default all.
+    """
+
+    def __init__(self, fname, precision='auto', text=None, layout='auto'):
+        self.fname = fname
+        raw = np.memmap(fname, dtype=np.uint8, mode='r')
+        if precision == 'auto' or layout == 'auto':
+            found_precision, found_layout = detect_format(raw)
+            precision = found_precision if precision == 'auto' else precision
+            layout = found_layout if layout == 'auto' else layout
+        self.precision = precision
+        self.layout = layout
+        self.header_dtype = header_dtype(precision, layout)
+        self.real = np.dtype('<f8' if precision == 'double' else '<f4')
+        self._index(raw, text)
+
+    def _index(self, raw, text):
+        first = raw[:self.header_dtype.itemsize].view(self.header_dtype)[0]
+        record = np.dtype([('header', self.header_dtype),
+                           ('data', self.real, (int(first['nrow']), int(first['ncol'])))])
+        regular = raw.size % record.itemsize == 0
+        if regular:
+            records = np.memmap(self.fname, dtype=record, mode='r')
+            headers = records['header']
+            regular = (np.all(headers['ncol'] == first['ncol']) and
+                       np.all(headers['nrow'] == first['nrow']))
+        if regular:
+            self.headers = np.array(headers)
+            self._values = records['data']  # (nrecords, nrow, ncol) view of the file
+            self.offsets = None
+        else:
+            # records of different sizes (e.g. several models or labels): walk the
+            # headers once and keep the offsets
+            headers, offsets, pos = [], [], 0
+            while pos < raw.size:
+                hdr = raw[pos:pos + self.header_dtype.itemsize].view(self.header_dtype)[0]
+                headers.append(hdr)
+                offsets.append(pos + self.header_dtype.itemsize)
+                pos += self.header_dtype.itemsize + int(hdr['ncol']) * int(hdr['nrow']) * self.real.itemsize
+            self.headers = np.array(headers, dtype=self.header_dtype)
+            self.offsets = np.array(offsets)
+            self._values = None
+        self._raw = raw
+
+        self.records = np.arange(len(self.headers))
+        if text is not None:
+            labels = np.char.strip(self.headers['text']).astype(str)
+            self.records = self.records[labels == text.upper()]
+            if len(self.records) == 0:
+                raise ValueError('no {} records in {}'.format(text, self.fname))
+        hdrs = self.headers[self.records]
+        self.nlay = int(hdrs['ilay'].max())
+        self.nrow = int(hdrs['nrow'][0])
+        self.ncol = int(hdrs['ncol'][0])
+        # one step per block of nlay records
+        steps = hdrs[::self.nlay]
+        self.times = steps['totim'].astype(float)
+        self.kstpkper = [(int(k) - 1, int(p) - 1) for k, p in zip(steps['kstp'], steps['kper'])]
+        self.nsteps = len(steps)
+
+    def _record_values(self, i):
+        if self._values is not None:
+            return self._values[i]
+        n = self.nrow * self.ncol
+        start = self.offsets[i]
+        return self._raw[start:start + n * self.real.itemsize].view(self.real).reshape(
+            self.nrow, self.ncol)
+
+    def get_times(self):
+        return self.times.tolist()
+
+    def get_kstpkper(self):
+        """Zero based (kstp, kper) of each saved step, like flopy."""
+        return list(self.kstpkper)
+
+    def step_index(self, idx=None, kstpkper=None, totim=None, step=None):
+        """Saved step number from a record number idx (like flopy), kstpkper, totim or step."""
+        if kstpkper is not None:
+            return self.kstpkper.index(tuple(kstpkper))
+        if totim is not None:
+            return int(np.argmin(np.abs(self.times - totim)))
+        if idx is not None:
+            if not -len(self.records) <= idx < len(self.records):
+                raise IndexError('record {} of {}'.format(idx, len(self.records)))
+            return (idx % len(self.records)) // self.nlay
+        return self.nsteps - 1 if step is None else step % self.nsteps
+
+    def get_alldata(self):
+        """(nsteps, nlay, nrow, ncol), a view of the file when the records are regular."""
+        if self._values is not None and np.array_equal(
+                self.records, np.arange(self.records[0], self.records[0] + len(self.records))):
+            v = self._values[self.records[0]:self.records[0] + len(self.records)]
+            return v.reshape(self.nsteps, self.nlay, self.nrow, self.ncol)
+        return np.stack([self.get_data(step=i) for i in range(self.nsteps)])
+
+    def get_data(self, idx=None, kstpkper=None, totim=None, step=None):
+        """
+        (nlay, nrow, ncol) of one step (the last one by default), like flopy.
+        idx: record number, as in flopy (all the layers of that record's step).
+        step: saved step number instead (nlay records each).
+        """
+        i = self.step_index(idx, kstpkper, totim, step)
+        recs = self.records[i * self.nlay:(i + 1) * self.nlay]
+        if self._values is not None and recs[-1] - recs[0] == self.nlay - 1:
+            return self._values[recs[0]:recs[-1] + 1]
+        return np.stack([self._record_values(r) for r in recs])
+
+    def series(self, cell):
+        """Values of one cell, (k, i, j) or (k, icell) for DISV, at every step."""
+        k, rest = cell[0], cell[1:]
+        i, j = (0, rest[0]) if len(rest) == 1 else rest
+        return self.get_alldata()[:, k, i, j]
+
+    def get_ts(self, cell):
+        """[[totim, value], ...] of one cell, like flopy's get_ts for a single cell."""
+        return np.column_stack((self.times, self.series(cell)))
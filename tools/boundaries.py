@@ -0,0 +1,217 @@
+"""
+Boundary conditions for triangle (DISV) grids in bulk: pick the cells by
+geometry and get flopy's stress period data as numpy record arrays, instead
+of chdList.append([(0, icpl), 30]) one cell at a time.
+
+    cells = CellLocator(tri.get_cell2d(), tri.get_vertices())
+    left = cells.along_polyline([(0, 0), (0, 100)])
+    river, length = cells.along_polyline(river_xy, lengths=True)
+    lake = cells.in_polygon(lake_xy)
+    wet = cells.in_raster(dem, dem.z < 250)        # a tools.raster.Raster mask
+    wells = cells.at_points(well_xy)
+
+    chd = flopy.mf6.ModflowGwfchd(gwf, stress_period_data=stress_period_data(
+        'chd', left, head=30))
+    riv = flopy.mf6.ModflowGwfriv(gwf, stress_period_data=stress_period_data(
+        'riv', river, stage=stage, cond=k_bed * width * length / 1.0, rbot=stage - 2))
+
+Values can be a number, one per cell, or one row per stress period
+(nper, ncells) for transient stresses. Stress periods with the same values
+as the period before are left out, MODFLOW 6 keeps the last ones. layers is
+one layer or a list of them (the cells repeated in each), or give the cells
+as (n, 2) (layer, cell) pairs.
+
+The cells are zero based cell2d numbers, the same as tri.get_edge_cells().
+For very long lists period_files() writes them as OPEN/CLOSE files instead
+(20k cells x 10 periods: 5.5 s in flopy as arrays or lists, 1.4 s this way).
+"""
+import os
+
+import numpy as np
+from matplotlib.path import Path
+from matplotlib.tri import Triangulation
+from scipy.spatial import cKDTree
+
+from tools.meshSizing import densify
+from tools.prismMesh import cell_vertices
+
+# the value fields of each package, in flopy's order
+fields = {
+    'chd': ('head',),
+    'drn': ('elev', 'cond'),
+    'riv': ('stage', 'cond', 'rbot'),
+    'ghb': ('bhead', 'cond'),
+    'wel': ('q',),
+}
+
+
+class CellLocator:
+    """
+    Spatial index of a triangle grid: a trapezoid map to find the triangle a
+    point is in, and a KD-tree of the cell centres.
+    """
+
+    def __init__(self, cell2d, vertices):
+        self.triangles, self.xy = cell_vertices(cell2d, vertices)
+        self.ncpl = len(self.triangles)
+        self.centres = self.xy[self.triangles].mean(axis=1)
+        self._finder = None
+        self._tree = None
+
+    @property
+    def finder(self):
+        if self._finder is None:  # built when first needed, a few s for 300k cells
+            self._finder = Triangulation(self.xy[:, 0], self.xy[:, 1],
+                                         self.triangles).get_trifinder()
+        return self._finder
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = cKDTree(self.centres)
+        return self._tree
+
+    def at_points(self, xy):
+        """Cell of each point, -1 outside the grid."""
+        xy = np.atleast_2d(np.asarray(xy, dtype=float))
+        return np.asarray(self.finder(xy[:, 0], xy[:, 1]), dtype=int)
+
+    def in_polygon(self, polygon, holes=()):
+        """Cells with their centre inside the polygon (and not in a hole)."""
+        inside = Path(np.asarray(polygon, dtype=float)).contains_points(self.centres)
+        for hole in holes:
+            inside &= ~Path(np.asarray(hole, dtype=float)).contains_points(self.centres)
+        return np.flatnonzero(inside)
+
+    def in_raster(self, raster, mask):
+        """Cells with their centre on a True pixel of mask (a boolean array like raster.z)."""
+        mask = np.asarray(mask, dtype=bool)
+        col = np.floor((self.centres[:, 0] - raster.xllcorner) / raster.cellsize).astype(int)
+        row = raster.nrows - 1 - np.floor(
+            (self.centres[:, 1] - raster.yllcorner) / raster.cellsize).astype(int)
+        on = (row >= 0) & (row < raster.nrows) & (col >= 0) & (col < raster.ncols)
+        hit = np.zeros(self.ncpl, dtype=bool)
+        hit[on] = mask[row[on], col[on]]
+        return np.flatnonzero(hit)
+
+    def near(self, xy, distance):
+        """Cells with their centre within distance of any of the points."""
+        found = self.tree.query_ball_point(np.atleast_2d(xy), distance)
+        return np.unique(np.concatenate([np.asarray(f, dtype=int) for f in found]))
+
+    def along_polyline(self, polyline, buffer=None, lengths=False, step=None):
+        """
+        Cells the polyline goes through, in order along it (or, with buffer,
+        all the cells with their centre within buffer of it).
+
+        lengths: also return the length of polyline in each cell (for a
+        RIV/DRN conductance). It's worked out on points every step along the
+        line, by default a tenth of the smallest cell's size.
+        """
+        polyline = np.asarray(polyline, dtype=float)
+        if step is None:
+            edge = np.linalg.norm(self.xy[self.triangles[:, 0]] - self.xy[self.triangles[:, 1]],
+                                  axis=1)
+            step = edge.min() / 10.
+        points = densify(polyline, step)
+        if buffer is not None:
+            return self.near(points, buffer)
+        # each short piece belongs to the cell its middle is in
+        middles = (points[1:] + points[:-1]) / 2.
+        pieces = np.linalg.norm(np.diff(points, axis=0), axis=1)
+        cell = self.at_points(middles)
+        pieces, cell = pieces[cell >= 0], cell[cell >= 0]
+        cells, first = np.unique(cell, return_index=True)
+        order = np.argsort(first)
+        if not lengths:
+            return cells[order]
+        length = np.bincount(np.searchsorted(cells, cell), weights=pieces, minlength=len(cells))
+        return cells[order], length[order]
+
+
+def cellids(cells, layers=0):
+    """
+    flopy's cellid column (an object array of (layer, cell) tuples).
+    cells: cell numbers, in each of layers (one or a list), or (n, 2) (layer, cell).
+    """
+    cells = np.asarray(cells, dtype=int)
+    if cells.ndim == 2:
+        layer, cell = cells[:, 0], cells[:, 1]
+    else:
+        layers = np.atleast_1d(np.asarray(layers, dtype=int))
+        layer, cell = np.repeat(layers, len(cells)), np.tile(cells, len(layers))
+    return np.fromiter(zip(layer.tolist(), cell.tolist()), dtype=object, count=len(cell))
+
+
+def stress_period_data(package, cells, layers=0, **values):
+    """
+    {kper: recarray} for flopy's stress_period_data of package ('chd', 'drn',
+    'riv', 'ghb' or 'wel'), values by field name (see fields).
+    """
+    if package not in fields:
+        raise ValueError('package should be one of {}'.format(sorted(fields)))
+    missing = set(fields[package]) - set(values)
+    extra = set(values) - set(fields[package])
+    if missing or extra:
+        raise ValueError('{} needs the values {}'.format(package, fields[package]))
+    ids = cellids(cells, layers)
+    ncells = len(np.asarray(cells))
+    nrep = len(ids) // max(ncells, 1)  # the cells repeated for each layer
+
+    # every field as (nper, len(ids))
+    columns = {}
+    nper = 1
+    for name in fields[package]:
+        v = np.asarray(values[name], dtype=float)
+        if v.ndim == 0:
+            v = np.full((1, ncells), float(v))
+        elif v.ndim == 1:
+            v = v[None, :]
+        if v.shape[1] != ncells:
+            raise ValueError('{}: {} values for {} cells'.format(name, v.shape[1], ncells))
+        columns[name] = np.tile(v, (1, nrep))
+        nper = max(nper, len(v))
+    for name, v in columns.items():
+        if len(v) not in (1, nper):
+            raise ValueError('{}: {} stress periods, others have {}'.format(name, len(v), nper))
+
+    dtype = np.dtype([('cellid', object)] + [(name, float) for name in fields[package]])
+    data = {}
+    previous = None
+    for kper in range(nper):
+        rows = np.column_stack([columns[name][min(kper, len(columns[name]) - 1)]
+                                for name in fields[package]])
+        if previous is not None and np.array_equal(rows, previous):
+            continue  # MODFLOW 6 carries the last period's list on
+        rec = np.empty(len(ids), dtype=dtype).view(np.recarray)
+        rec['cellid'] = ids
+        for j, name in enumerate(fields[package]):
+            rec[name] = rows[:, j]
+        data[kper] = rec
+        previous = rows
+    return data
+
+
+def period_files(data, sim_ws, name, fmt='%.10g'):
+    """
+    Write each period's list of stress_period_data() to sim_ws/<name>.<kper+1>.txt
+    and return (stress_period_data, maxbound) for flopy that point at them
+    (OPEN/CLOSE). flopy then doesn't take in every row, which for big lists
+    is where most of the time goes:
+
+        spd, maxbound = period_files(stress_period_data('riv', ...), sim_ws, 'riv')
+        flopy.mf6.ModflowGwfriv(gwf, stress_period_data=spd, maxbound=maxbound)
+
+    sim_ws has to be the simulation's workspace (the files aren't moved with it).
+    """
+    files = {}
+    maxbound = 0
+    for kper, rec in data.items():
+        fname = '{}.{}.txt'.format(name, kper + 1)
+        ids = np.array(rec['cellid'].tolist(), dtype=int).reshape(len(rec), -1) + 1  # one based
+        values = [rec[field] for field in rec.dtype.names if field != 'cellid']
+        np.savetxt(os.path.join(sim_ws, fname), np.column_stack([ids] + values),
+                   fmt=['%d'] * ids.shape[1] + [fmt] * len(values))
+        files[kper] = {'filename': fname}
+        maxbound = max(maxbound, len(rec))
+    return files, maxbound
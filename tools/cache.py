@@ -0,0 +1,44 @@
+"""
+Small helpers for the on-disk caches that live in ./working/cache/
+"""
+import hashlib
+import os
+
+import numpy as np
+
+cache_dir = './working/cache/'
+
+
+def cache_path(name, key, ext):
+    """Path of a cache file: <cache_dir>/<name>-<key>.<ext>, creating the folder."""
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, '{}-{}.{}'.format(name, key, ext))
+
+
+def file_stamp(path):
+    """Cheap identity of a file: absolute path, size and modified time."""
+    st = os.stat(path)
+    return '{}|{}|{}'.format(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def hash_key(*parts):
+    """Short hex digest of any mix of arrays, strings and numbers."""
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            h.update(str((part.dtype.str, part.shape)).encode())
+            h.update(part.tobytes())
+        else:
+            h.update(repr(part).encode())
+        h.update(b'|')
+    return h.hexdigest()[:16]
+
+
+def file_hash(path, blocksize=1 << 20):
+    """Hex digest of a file's contents (for keys that must follow the data itself)."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,105 @@
+"""
+Multi-resolution pyramid of a DEM, to use instead of thinning the flattened
+points with .iloc[::N] (which drops whole columns in stripes).
+
+Each level is the DEM block-averaged (or block min/max) by a factor of 2, 4, 8...
+so every stage can pick the resolution it needs: a coarse level for meshing
+and triangulating, a finer one for sampling cell tops, etc.
+The levels are cached to ./working/cache/ as a compressed .npz.
+"""
+import warnings
+
+import numpy as np
+
+from tools.cache import cache_path, hash_key
+from tools.raster import Raster
+
+methods = ('mean', 'min', 'max')
+
+
+def block_reduce(z, factor, method='mean'):
+    """
+    Reduce a 2D array by factor x factor blocks, ignoring NaN. The array is
+    padded with NaN at the bottom and right if it doesn't divide evenly.
+    """
+    if method not in methods:
+        raise ValueError('method must be one of {}'.format(methods))
+    nrows, ncols = z.shape
+    nr = -(-nrows // factor)  # ceil
+    nc = -(-ncols // factor)
+    padded = np.full((nr * factor, nc * factor), np.nan)
+    padded[:nrows, :ncols] = z
+    blocks = padded.reshape(nr, factor, nc, factor)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all NaN blocks stay NaN
+        if method == 'mean':
+            return np.nanmean(blocks, axis=(1, 3))
+        if method == 'min':
+            return np.nanmin(blocks, axis=(1, 3))
+        return np.nanmax(blocks, axis=(1, 3))
+
+
+class DemPyramid:
+    """
+    Block reduced copies of a Raster. levels[factor] is a Raster with
+    cellsize = factor * the original cellsize, level 1 is the original.
+    """
+
+    def __init__(self, raster, factors=(2, 4, 8, 16, 32), method='mean',
+                 use_cache=True):
+        self.raster = raster
+        self.method = method
+        self.factors = tuple(sorted(set((1,) + tuple(factors))))
+        self.levels = {1: raster}
+
+        z = np.asarray(raster.z)
+        top = raster.yllcorner + raster.total_y
+
+        reduced = None
+        if use_cache:
+            key = hash_key(z, raster.xllcorner, raster.yllcorner,
+                           raster.cellsize, self.factors, method)
+            fname = cache_path('pyramid', key, 'npz')
+            try:
+                with np.load(fname) as cached:
+                    reduced = {f: cached[str(f)] for f in self.factors[1:]}
+            except (OSError, KeyError):
+                reduced = None
+        if reduced is None:
+            reduced = {f: block_reduce(z, f, method) for f in self.factors[1:]}
+            if use_cache:
+                np.savez_compressed(fname, **{str(f): a for f, a in reduced.items()})
+
+        for f, zf in reduced.items():
+            cellsize = raster.cellsize * f
+            # keep the top left corner where it is, padding was added at the bottom
+            yll = top - zf.shape[0] * cellsize
+            self.levels[f] = Raster(zf, raster.xllcorner, yll, cellsize,
+                                    raster.nodata)
+
+    def level(self, factor):
+        return self.levels[factor]
+
+    def deviation(self, factor):
+        """Largest |original - level value| of the original cells in each block of a level."""
+        z = np.asarray(self.raster.z, dtype=float)
+        up = np.repeat(np.repeat(np.asarray(self.levels[factor].z), factor, axis=0),
+                       factor, axis=1)[:z.shape[0], :z.shape[1]]
+        d = np.abs(z - up)
+        return float(np.nanmax(d)) if not np.isnan(d).all() else 0.
+
+    def for_max_points(self, npoints):
+        """Finest level with no more than npoints valid (non NaN) cells."""
+        for f in self.factors:
+            if np.count_nonzero(~np.isnan(self.levels[f].z)) <= npoints:
+                return self.levels[f]
+        return self.levels[self.factors[-1]]
+
+    def for_cellsize(self, cellsize):
+        """Coarsest level whose cells are no bigger than cellsize."""
+        best = self.levels[1]
+        for f in self.factors:
+            if self.levels[f].cellsize <= cellsize:
+                best = self.levels[f]
+        return best
@@ -0,0 +1,350 @@
+"""
+Monte Carlo ensembles of random K fields: many seeded realizations run in
+parallel, the heads reduced on the fly to per-cell statistics.
+
+No realization's heads are kept: each one is added to a running mean and
+variance (Welford) and to P-square quantile estimates (5 markers per
+quantile per cell, Jain & Chlamtac 1985) as soon as it's back. Each worker
+reuses one workspace, where only the package files that changed (the NPF
+k) are rewritten (tools.simWriter). So memory and disk stay the same for
+100 or 10000 realizations. Realization i always gets the same random
+numbers (seeded from (seed, i)), whatever worker runs it and in what order.
+
+    ens = Ensemble(build, LognormalK(-4, 1, ncpl), postprocess=final_heads,
+                   seed=42, ws='./working/ensemble/')
+    stats = ens.run(1000)
+    stats.mean, stats.std, stats.quantile(0.95)   # (ncells,) each
+
+The field can also be spatially correlated, a tools.randomField.RandomField
+with log10=True. build(name, k) returns a flopy MFSimulation using that K field,
+postprocess(sim) the heads (any array, the same shape every time), see
+flopyRandomK.py. The workers are the ones of tools.scenarioRunner (same
+backends and Windows notes).
+
+The statistics are checkpointed to ws/ensemble.npz, with the realizations
+already in them. Run again after an interruption and it carries on with the
+missing ones (resume=False starts over). Failed realizations aren't added,
+they're retried on the next run.
+"""
+import os
+import threading
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from tools.scenarioRunner import run_case
+from tools.warmStart import iterations_saved
+
+
+def realization_rng(seed, i):
+    """Random generator of realization i, independent of the others."""
+    return np.random.default_rng([seed, i])
+
+
+class LognormalK:
+    """Uncorrelated lognormal K per cell, 10**normal(mean, sigma), like flopyRandomK.py."""
+
+    def __init__(self, mean, sigma, n):
+        self.mean = mean
+        self.sigma = sigma
+        self.n = n
+
+    def __call__(self, rng):
+        return 10 ** rng.normal(self.mean, self.sigma, self.n)
+
+
+class P2Quantiles:
+    """
+    Streaming estimate of some quantiles of every cell, 5 markers each (P-square).
+    Exact (np.quantile) until 5 values have been added.
+    """
+
+    def __init__(self, ncells, quantiles=(0.05, 0.5, 0.95)):
+        self.quantiles = np.asarray(quantiles, dtype=float)
+        nq = len(self.quantiles)
+        self.count = 0
+        self.heights = np.zeros((nq, 5, ncells))  # marker values
+        self.positions = np.tile(np.arange(5.)[None, :, None], (nq, 1, ncells))
+        p = self.quantiles[:, None]
+        self.desired = np.broadcast_to(
+            np.hstack([0 * p, 2 * p, 4 * p, 2 + 2 * p, 4 + 0 * p])[:, :, None],
+            (nq, 5, ncells)).copy()
+        self.increments = np.hstack([0 * p, p / 2, p, (1 + p) / 2, 1 + 0 * p])[:, :, None]
+
+    def add(self, x):
+        x = np.ravel(x)
+        if self.count < 5:
+            self.heights[:, self.count] = x
+            self.count += 1
+            if self.count == 5:
+                self.heights.sort(axis=1)
+            return
+        self.count += 1
+        q, n = self.heights, self.positions
+        # the cell k (marker k to k+1) x falls in, stretching the ends if needed
+        q[:, 0] = np.minimum(q[:, 0], x)
+        q[:, 4] = np.maximum(q[:, 4], x)
+        above = x[None, None, :] >= q[:, 1:4]  # markers 1..3 that are <= x
+        n[:, 1:4] += ~above
+        n[:, 4] += 1
+        self.desired += self.increments
+
+        for i in (1, 2, 3):
+            d = self.desired[:, i] - n[:, i]
+            move = (((d >= 1) & (n[:, i + 1] - n[:, i] > 1)) |
+                    ((d <= -1) & (n[:, i - 1] - n[:, i] < -1)))
+            if not move.any():
+                continue
+            d = np.sign(d) * move
+            qp = q[:, i] + d / (n[:, i + 1] - n[:, i - 1]) * (
+                (n[:, i] - n[:, i - 1] + d) * (q[:, i + 1] - q[:, i]) / (n[:, i + 1] - n[:, i]) +
+                (n[:, i + 1] - n[:, i] - d) * (q[:, i] - q[:, i - 1]) / (n[:, i] - n[:, i - 1]))
+            parabolic = (q[:, i - 1] < qp) & (qp < q[:, i + 1])
+            # linear towards the neighbour in the direction of d
+            qn = np.where(d > 0, q[:, i + 1], q[:, i - 1])
+            nn = np.where(d > 0, n[:, i + 1], n[:, i - 1])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                linear = q[:, i] + d * (qn - q[:, i]) / (nn - n[:, i])
+            q[:, i] = np.where(move, np.where(parabolic, qp, linear), q[:, i])
+            n[:, i] += d
+
+    def estimate(self):
+        """(nquantiles, ncells)"""
+        if self.count < 5:
+            if self.count == 0:
+                return np.full(self.heights[:, 0].shape, np.nan)
+            return np.quantile(self.heights[:, :self.count][0], self.quantiles, axis=0)
+        return self.heights[:, 2].copy()
+
+    def state(self):
+        return {'q_count': self.count, 'q_heights': self.heights,
+                'q_positions': self.positions, 'q_desired': self.desired}
+
+    def set_state(self, state):
+        self.count = int(state['q_count'])
+        self.heights = np.array(state['q_heights'])
+        self.positions = np.array(state['q_positions'])
+        self.desired = np.array(state['q_desired'])
+
+
+class RunningStats:
+    """Per-cell count, mean, variance, min, max and quantiles of the arrays added."""
+
+    def __init__(self, shape, quantiles=(0.05, 0.5, 0.95)):
+        self.shape = tuple(shape)
+        ncells = int(np.prod(self.shape))
+        self.count = 0
+        self._mean = np.zeros(ncells)
+        self._m2 = np.zeros(ncells)
+        self._min = np.full(ncells, np.inf)
+        self._max = np.full(ncells, -np.inf)
+        self.sketch = P2Quantiles(ncells, quantiles)
+
+    def add(self, values):
+        x = np.ravel(np.asarray(values, dtype=float))
+        if x.size != self._mean.size:
+            raise ValueError('expected {} values, got {}'.format(self._mean.size, x.size))
+        self.count += 1
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+        np.minimum(self._min, x, out=self._min)
+        np.maximum(self._max, x, out=self._max)
+        self.sketch.add(x)
+
+    @property
+    def mean(self):
+        return self._mean.reshape(self.shape)
+
+    @property
+    def var(self):
+        """Sample variance (n - 1)."""
+        return (self._m2 / max(self.count - 1, 1)).reshape(self.shape)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def min(self):
+        return self._min.reshape(self.shape)
+
+    @property
+    def max(self):
+        return self._max.reshape(self.shape)
+
+    @property
+    def quantiles(self):
+        return self.sketch.quantiles
+
+    def quantile(self, q):
+        """Estimate of one of the tracked quantiles."""
+        i = int(np.argmin(np.abs(self.sketch.quantiles - q)))
+        if not np.isclose(self.sketch.quantiles[i], q):
+            raise ValueError('quantile {} is not tracked, only {}'.format(q, self.sketch.quantiles))
+        return self.sketch.estimate()[i].reshape(self.shape)
+
+    def state(self):
+        return dict(shape=self.shape, count=self.count, mean=self._mean, m2=self._m2,
+                    min=self._min, max=self._max, quantiles=self.sketch.quantiles,
+                    **self.sketch.state())
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls(tuple(state['shape']), state['quantiles'])
+        stats.count = int(state['count'])
+        stats._mean, stats._m2 = np.array(state['mean']), np.array(state['m2'])
+        stats._min, stats._max = np.array(state['min']), np.array(state['max'])
+        stats.sketch.set_state(state)
+        return stats
+
+
+def _build_realization(build, field, seed, name, i):
+    return build(name, field(realization_rng(seed, i)))
+
+
+class Ensemble:
+    """
+    build: build(name, k) -> MFSimulation.
+    field: field(rng) -> K array, e.g. LognormalK(mean, sigma, ncpl).
+    postprocess: postprocess(sim) -> the array to get statistics of (heads).
+    keep_runs: a workspace per realization, and keep them (the successful ones).
+    checkpoint_every: write ws/ensemble.npz every so many realizations.
+    warm_start: start each realization from the heads of the last one solved
+    (by the same worker, tools.warmStart), the iterations are in self.solves.
+    """
+
+    def __init__(self, build, field, postprocess, seed=0, ws='./working/ensemble/',
+                 quantiles=(0.05, 0.5, 0.95), n_workers=None, backend='processes',
+                 keep_runs=False, checkpoint_every=20, progress=True,
+                 warm_start=False):
+        if backend not in ('processes', 'threads'):
+            raise ValueError("backend should be 'processes' or 'threads'")
+        self.build = build
+        self.field = field
+        self.postprocess = postprocess
+        self.seed = seed
+        self.ws = ws
+        self.quantiles = tuple(quantiles)
+        self.n_workers = n_workers or os.cpu_count()
+        self.backend = backend
+        self.keep_runs = keep_runs
+        self.checkpoint_every = checkpoint_every
+        self.progress = progress
+        self.warm_start = warm_start
+        self.stats = None
+        self.done = set()
+        self.failed = {}  # realization: error
+        self.solves = []  # realization, warm_from, outer, inner of each run
+        self._last_heads = None
+
+    @property
+    def state_file(self):
+        return os.path.join(self.ws, 'ensemble.npz')
+
+    def load(self):
+        """Pick up the checkpoint in ws, if there's one (True if so)."""
+        if not os.path.exists(self.state_file):
+            return False
+        with np.load(self.state_file) as f:
+            state = dict(f)
+        if int(state['seed']) != self.seed or not np.allclose(state['quantiles'], self.quantiles):
+            raise ValueError('{} is of another ensemble (seed or quantiles differ), '
+                             'use resume=False or another ws'.format(self.state_file))
+        self.stats = RunningStats.from_state(state)
+        self.done = set(state['done'].tolist())
+        return True
+
+    def checkpoint(self):
+        if self.stats is None:
+            return
+        tmp = self.state_file + '.tmp.npz'
+        np.savez(tmp, seed=self.seed, done=np.array(sorted(self.done), dtype=int),
+                 **self.stats.state())
+        os.replace(tmp, self.state_file)  # never a half written checkpoint
+
+    def _add(self, i, result):
+        self.solves.append({'realization': i, 'warm_from': result.get('warm_from', ''),
+                            'outer': result.get('outer', np.nan),
+                            'inner': result.get('inner', np.nan)})
+        if result['status'] != 'ok':
+            self.failed[i] = result['error']
+            return
+        if self.stats is None:
+            self.stats = RunningStats(np.shape(result['output']), self.quantiles)
+        self.stats.add(result['output'])
+        self.done.add(i)
+        self.failed.pop(i, None)
+        self._last_heads = result['heads'] or self._last_heads
+
+    def iterations_saved(self):
+        """
+        The solves table with roughly the iterations each warm start saved:
+        compared with the mean of the cold started realizations, which have
+        other K fields too.
+        """
+        return iterations_saved(pd.DataFrame(self.solves).set_index('realization'))
+
+    def run(self, nreal, resume=True):
+        """Realizations 0 .. nreal-1 (those not done yet), returns the RunningStats."""
+        os.makedirs(self.ws, exist_ok=True)
+        if not (resume and self.load()):
+            self.stats, self.done = None, set()
+        todo = [i for i in range(nreal) if i not in self.done]
+        if self.progress and self.done:
+            print('ensemble: {} realizations done already'.format(len(self.done)))
+
+        build = partial(_build_realization, self.build, self.field, self.seed)
+        if self.backend == 'processes':
+            pool, lock = ProcessPoolExecutor(self.n_workers), None
+        else:
+            pool, lock = ThreadPoolExecutor(self.n_workers), threading.Lock()
+        start = time.time()
+        running = {}
+        todo = iter(todo)
+        with pool:
+            # at most 2 per worker submitted at a time, so the finished results
+            # don't pile up in memory
+            while True:
+                for i in todo:
+                    if self.keep_runs:
+                        name = 'real-{:05d}'.format(i)
+                        ws = os.path.join(self.ws, name)
+                        warm_start = self.warm_start and self._last_heads
+                    else:  # the same model names every time, so the files can be reused
+                        name = 'real'
+                        ws = os.path.join(self.ws, 'worker-{worker}')
+                        warm_start = self.warm_start  # from the heads in ws
+                    future = pool.submit(run_case, build, name, {'i': i}, ws,
+                                         self.postprocess, True, lock, not self.keep_runs,
+                                         warm_start)
+                    running[future] = i
+                    if len(running) >= 2 * self.n_workers:
+                        break
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:  # e.g. a worker process died
+                        result = {'status': 'error', 'error': repr(e)}
+                    self._add(i, result)
+                    if self.progress:
+                        print('ensemble: {}/{} ({:.1f} s) realization {} {}'.format(
+                            len(self.done), nreal, time.time() - start, i, result['status']))
+                    if len(self.done) % self.checkpoint_every == 0:
+                        self.checkpoint()
+        self.checkpoint()
+        if self.failed and self.progress:
+            print('ensemble: {} realizations failed: {}'.format(
+                len(self.failed), sorted(self.failed)))
+        if self.stats is None:
+            raise RuntimeError('no realization ran, the first error:\n{}'.format(
+                next(iter(self.failed.values()), '')))
+        return self.stats
@@ -0,0 +1,57 @@
+"""
+Keep kriging results (estimates and variances) in ./working/cache/ so tweaking
+colours, isosurface levels or the camera doesn't mean fitting and running the
+kriging again.
+
+The key covers everything that changes the result: the input data (the CSV
+contents, or the arrays), the variogram/anisotropy settings and the target
+grid. Change any of them and the key changes, so the old result is simply
+not found and the kriging runs again.
+"""
+import numpy as np
+import pykrige
+
+from tools.cache import cache_path, file_hash, hash_key
+
+
+def krig_cache_key(csv=None, data=None, grid=None, **settings):
+    """
+    csv: path of the input file (its contents are hashed), and/or
+    data: the input arrays, e.g. (x, y, z, val)
+    grid: the target grid axes (gridx, gridy, gridz)
+    settings: anything else passed to the kriger, e.g. variogram_model,
+        anisotropy_scaling_z, n_closest...
+    """
+    parts = [pykrige.__version__]
+    if csv is not None:
+        parts.append(file_hash(csv))
+    for arr in (data or ()):
+        parts.append(np.asarray(arr, dtype=float))
+    for axis in (grid or ()):
+        parts.append(np.asarray(axis, dtype=float))
+    for name in sorted(settings):
+        value = settings[name]
+        parts.append(name)
+        parts.append(np.asarray(value) if isinstance(value, (list, tuple, np.ndarray))
+                     else value)
+    return hash_key(*parts)
+
+
+def cached_krig(key, krige, verbose=True):
+    """
+    Load the (k3d, ss3d) stored under key, or call krige() to make them and
+    store them (compressed) for next time.
+    """
+    fname = cache_path('krig', key, 'npz')
+    try:
+        with np.load(fname) as cached:
+            if verbose:
+                print('kriging results loaded from ' + fname)
+            return cached['k3d'], cached['ss3d']
+    except (OSError, KeyError):
+        pass
+    k3d, ss3d = krige()
+    k3d = np.ma.filled(k3d, np.nan)
+    ss3d = np.ma.filled(ss3d, np.nan)
+    np.savez_compressed(fname, k3d=k3d, ss3d=ss3d)
+    return k3d, ss3d
@@ -0,0 +1,82 @@
+"""
+Krige onto a regular 3D grid and put the result straight into a vedo Volume.
+
+The kriging targets are built with a meshgrid instead of nested loops, the
+kriger is called once for the whole grid, and since the targets already are
+a regular grid there's no need to re-interpolate them with interpolateToVolume.
+
+Arrays here are indexed [ix, iy, iz], which is what vedo.Volume expects.
+"""
+import numpy as np
+
+
+def grid_axes(x, y, z, spacing, pad=0.0):
+    """
+    1D grid axes covering the data, e.g. grid_axes(x, y, z, (1, 1, .5)).
+    Same as np.arange(min - pad, max + pad, step) on each axis.
+    """
+    spacing = np.broadcast_to(spacing, 3)
+    return tuple(np.arange(float(np.min(v)) - pad, np.max(v) + pad, step)
+                 for v, step in zip((x, y, z), spacing))
+
+
+def grid_points(gridx, gridy, gridz):
+    """
+    Flat x, y, z of every grid node, x slowest and z fastest (the same order
+    as looping for x: for y: for z:), matching values.ravel() of an
+    [ix, iy, iz] array.
+    """
+    xx, yy, zz = np.meshgrid(gridx, gridy, gridz, indexing='ij')
+    return xx.ravel(), yy.ravel(), zz.ravel()
+
+
+class PointsKriger:
+    """
+    pykrige's execute('grid' or 'points', x, y, z) for a kriger that has an
+    execute_points(x, y, z) -> (kvalues, sigmasq). 'grid' results are [iz, iy, ix]
+    like pykrige's.
+    """
+
+    def execute(self, style, xpoints, ypoints, zpoints):
+        if style == 'points':
+            return self.execute_points(xpoints, ypoints, zpoints)
+        if style != 'grid':
+            raise ValueError("style argument must be 'grid' or 'points'")
+        xpts, ypts, zpts = (np.atleast_1d(np.asarray(v, dtype=float))
+                            for v in (xpoints, ypoints, zpoints))
+        grid_z, grid_y, grid_x = np.meshgrid(zpts, ypts, xpts, indexing='ij')
+        kvalues, sigmasq = self.execute_points(grid_x, grid_y, grid_z)
+        shape = (zpts.size, ypts.size, xpts.size)
+        return kvalues.reshape(shape), sigmasq.reshape(shape)
+
+
+def krig_grid(krig, gridx, gridy, gridz, **kwargs):
+    """
+    Run krig.execute('grid', ...) once (any pykrige 3D kriger, or anything with
+    the same execute) and return the estimates and variances as [ix, iy, iz]
+    arrays.
+    """
+    k3d, ss3d = krig.execute('grid', gridx, gridy, gridz, **kwargs)
+    # pykrige gives [iz, iy, ix], as masked arrays
+    k3d = np.ma.filled(k3d, np.nan).transpose(2, 1, 0)
+    ss3d = np.ma.filled(ss3d, np.nan).transpose(2, 1, 0)
+    return np.ascontiguousarray(k3d), np.ascontiguousarray(ss3d)
+
+
+def grid_spacing(gridx, gridy, gridz):
+    spacing = []
+    for axis in (gridx, gridy, gridz):
+        steps = np.diff(axis)
+        if len(steps) and not np.allclose(steps, steps[0]):
+            raise ValueError('grid axes need to be evenly spaced for a Volume')
+        spacing.append(steps[0] if len(steps) else 1.0)
+    return spacing
+
+
+def grid_to_volume(values, gridx, gridy, gridz):
+    """vedo Volume of [ix, iy, iz] values, placed at the grid origin and spacing."""
+    from vedo import Volume
+
+    return Volume(np.asarray(values),
+                  origin=(gridx[0], gridy[0], gridz[0]),
+                  spacing=grid_spacing(gridx, gridy, gridz))
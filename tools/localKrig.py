@@ -0,0 +1,99 @@
+"""
+Moving neighbourhood 3D kriging, for big LIF datasets.
+
+OrdinaryKriging3D.execute() solves against every sample for every target (and
+even with n_closest_points it still builds the full targets x samples distance
+matrix, then loops in python). Here each target only uses its n closest
+samples, found with a KD-tree in the same anisotropy adjusted coordinates
+pykrige uses (so anisotropy_scaling_z etc. are respected), and the small
+kriging systems are solved in batches with numpy. Cost grows about linearly
+with the number of targets.
+
+The variogram is the one already fitted by the pykrige object. Fitting that
+object is itself slow for thousands of samples (pykrige works out its cross
+validation statistics as it goes), so it can be fitted on a subset of the
+readings and the kriging done with all of them, see x, y, z, values below.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pykrige.core import _adjust_for_anisotropy
+
+from tools.krigGrid import PointsKriger
+
+
+class LocalKriging3D(PointsKriger):
+    """
+    Wrap a fitted pykrige OrdinaryKriging3D, e.g.
+
+        ok3d = OrdinaryKriging3D(x, y, z, napl, variogram_model="spherical",
+                                 anisotropy_scaling_z=10)
+        k3d, ss3d = LocalKriging3D(ok3d, n_closest=32).execute("grid", gx, gy, gz)
+
+    execute() takes and returns the same things as pykrige's ("grid" results
+    are [iz, iy, ix]), so it can be used anywhere the pykrige object is.
+
+    x, y, z, values: optional samples to krige with, if krig was only fitted
+    on some of them. By default the samples krig was built with are used.
+    """
+
+    def __init__(self, krig, n_closest=32, batch_size=2000,
+                 x=None, y=None, z=None, values=None):
+        self.krig = krig
+        if values is None:
+            self.data = np.column_stack((krig.X_ADJUSTED, krig.Y_ADJUSTED,
+                                         krig.Z_ADJUSTED))
+            self.values = np.asarray(krig.VALUES, dtype=float)
+        else:
+            self.data = self.adjust(x, y, z)
+            self.values = np.asarray(values, dtype=float)
+        self.n_closest = max(2, min(int(n_closest), len(self.values)))
+        self.batch_size = batch_size
+        self.eps = getattr(krig, 'eps', 1.e-10)
+        self.exact_values = getattr(krig, 'exact_values', True)
+        self.tree = cKDTree(self.data)
+
+    def _variogram(self, d):
+        return self.krig.variogram_function(self.krig.variogram_model_parameters, d)
+
+    def adjust(self, x, y, z):
+        """Target coordinates in the anisotropy adjusted space of the samples."""
+        k = self.krig
+        return _adjust_for_anisotropy(
+            np.vstack((x, y, z)).T.astype(float),
+            [k.XCENTER, k.YCENTER, k.ZCENTER],
+            [k.anisotropy_scaling_y, k.anisotropy_scaling_z],
+            [k.anisotropy_angle_x, k.anisotropy_angle_y, k.anisotropy_angle_z])
+
+    def _solve_batch(self, pts):
+        """Ordinary kriging of a batch of (adjusted) points, same system as pykrige."""
+        n = self.n_closest
+        bd, idx = self.tree.query(pts, k=n)
+        m = len(pts)
+
+        nb = self.data[idx]  # (m, n, 3)
+        dd = np.linalg.norm(nb[:, :, None, :] - nb[:, None, :, :], axis=-1)
+        a = np.ones((m, n + 1, n + 1))
+        a[:, :n, :n] = -self._variogram(dd)
+        diag = np.arange(n)
+        a[:, diag, diag] = 0.0
+        a[:, n, n] = 0.0
+
+        b = np.ones((m, n + 1))
+        b[:, :n] = -self._variogram(bd)
+        if self.exact_values:
+            b[:, :n][np.abs(bd) <= self.eps] = 0.0
+
+        x = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+        kvalues = np.sum(x[:, :n] * self.values[idx], axis=1)
+        sigmasq = -np.sum(x * b, axis=1)
+        return kvalues, sigmasq
+
+    def execute_points(self, x, y, z):
+        pts = self.adjust(np.ravel(x), np.ravel(y), np.ravel(z))
+        kvalues = np.empty(len(pts))
+        sigmasq = np.empty(len(pts))
+        for start in range(0, len(pts), self.batch_size):
+            sl = slice(start, start + self.batch_size)
+            kvalues[sl], sigmasq[sl] = self._solve_batch(pts[sl])
+        return kvalues, sigmasq
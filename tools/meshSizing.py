@@ -0,0 +1,135 @@
+"""
+Size functions for local mesh refinement around features.
+
+Instead of one max_area for the whole domain, the cell size is set by the
+features we care about (boreholes, borings, wells, a river or a plume outline):
+small at the feature, growing with distance at the grading rate, and never
+bigger than the base size. E.g. cells of 100 m at the boreholes that grow by
+30% of the distance out to 2 km cells:
+
+    sizing = SizeFunction(base_size=2000)
+    sizing.add_points(bhs[['x', 'y']].values, size=100, grading=0.3)
+    sizing.add_polyline(river_xy, size=250, grading=0.5)
+
+    tri = Triangle(angle=30, size_function=sizing)  # tools.triangleMesh
+    tri.add_polygon(active_domain)
+    tri.build()
+
+The mesh is first built with the base size, then refined (Triangle's -r
+switch, with a maximum area for each triangle) until every triangle is
+small enough for the size at its corners and centre.
+"""
+import warnings
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from tools.cache import hash_key
+
+
+def densify(xy, spacing):
+    """Points along a polyline, no further apart than spacing (ends included)."""
+    xy = np.asarray(xy, dtype=float)[:, :2]
+    out = [xy[:1]]
+    for a, b in zip(xy[:-1], xy[1:]):
+        n = max(1, int(np.ceil(np.hypot(*(b - a)) / spacing)))
+        t = np.arange(1, n + 1)[:, None] / n
+        out.append(a + t * (b - a))
+    return np.vstack(out)
+
+
+def size_to_area(size):
+    """Area of an equilateral triangle with sides of size."""
+    return np.sqrt(3) / 4. * np.asarray(size) ** 2
+
+
+class SizeFunction:
+    """
+    Target cell size (triangle side length) anywhere in the domain:
+    min(base_size, min over features of size + grading * distance).
+    """
+
+    def __init__(self, base_size):
+        self.base_size = float(base_size)
+        self.features = []  # (kind, xy, size, grading)
+        self._trees = None
+
+    def add_points(self, xy, size, grading=0.3):
+        """Refine around points, e.g. boreholes or wells."""
+        xy = np.atleast_2d(np.asarray(xy, dtype=float))[:, :2]
+        self.features.append(('points', xy, float(size), float(grading)))
+        self._trees = None
+
+    def add_polyline(self, xy, size, grading=0.3):
+        """Refine along a line, e.g. a river, a section or a plume outline."""
+        xy = np.asarray(xy, dtype=float)[:, :2]
+        self.features.append(('polyline', xy, float(size), float(grading)))
+        self._trees = None
+
+    def _feature_trees(self):
+        if self._trees is None:
+            # polylines as points closer together than their size, so the
+            # distance to the nearest point is the distance to the line to
+            # within a fraction of the cell size
+            self._trees = [cKDTree(xy if kind == 'points' else densify(xy, size / 4.))
+                           for kind, xy, size, grading in self.features]
+        return self._trees
+
+    def __call__(self, x, y):
+        """Target size at points x, y."""
+        pts = np.column_stack((np.ravel(x), np.ravel(y)))
+        h = np.full(len(pts), self.base_size)
+        for tree, (kind, xy, size, grading) in zip(self._feature_trees(), self.features):
+            d, _ = tree.query(pts)
+            h = np.minimum(h, size + grading * d)
+        return h.reshape(np.shape(x))
+
+    def key(self):
+        """Identity of the size function, for the mesh cache."""
+        return hash_key(self.base_size, *[part for kind, xy, size, grading in self.features
+                                          for part in (kind, xy, size, grading)])
+
+
+def triangle_areas(vertices, triangles):
+    p = vertices[triangles]
+    return 0.5 * np.abs((p[:, 1, 0] - p[:, 0, 0]) * (p[:, 2, 1] - p[:, 0, 1]) -
+                        (p[:, 2, 0] - p[:, 0, 0]) * (p[:, 1, 1] - p[:, 0, 1]))
+
+
+def max_areas(size_function, vertices, triangles):
+    """Largest area allowed for each triangle, from the size at its corners and centre."""
+    h = size_function(vertices[:, 0], vertices[:, 1])[triangles].min(axis=1)
+    centres = vertices[triangles].mean(axis=1)
+    h = np.minimum(h, size_function(centres[:, 0], centres[:, 1]))
+    return size_to_area(h)
+
+
+def refine(triangulate, mesh, size_function, switches, max_iter=12, verbose=False):
+    """
+    Refine mesh (the dict tools.triangleMesh builds) until no triangle is bigger
+    than the size function allows. triangulate is triangle.triangulate.
+    """
+    for it in range(max_iter):
+        allowed = max_areas(size_function, mesh['vertices'], mesh['triangles'])
+        too_big = triangle_areas(mesh['vertices'], mesh['triangles']) > allowed
+        if verbose:
+            print('refine {}: {} cells, {} too big'.format(
+                it, len(mesh['triangles']), too_big.sum()))
+        if not too_big.any():
+            break
+        boundary = mesh['edges'][mesh['edges'][:, 2] != 0]
+        out = triangulate(dict(
+            vertices=mesh['vertices'], triangles=mesh['triangles'],
+            segments=boundary[:, :2], segment_markers=boundary[:, 2:],
+            triangle_attributes=mesh['attributes'][:, None],
+            triangle_max_area=np.where(too_big, allowed, -1.)), 'r' + switches)
+        mesh = dict(vertices=out['vertices'], triangles=out['triangles'],
+                    attributes=out['triangle_attributes'][:, 0],
+                    edges=np.column_stack((out['edges'], out['edge_markers'][:, 0])))
+    else:
+        allowed = max_areas(size_function, mesh['vertices'], mesh['triangles'])
+        too_big = triangle_areas(mesh['vertices'], mesh['triangles']) > allowed
+        if too_big.any():
+            warnings.warn('refine: {} of {} cells still too big after {} iterations, '
+                          'raise max_iter'.format(too_big.sum(), len(too_big), max_iter))
+    return mesh
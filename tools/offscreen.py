@@ -0,0 +1,151 @@
+"""
+Headless rendering: write the scenes the scripts build to disk instead of
+opening a window, for render nodes, batch jobs and ensemble runs.
+
+Set FLOPYVEDO_HEADLESS=1 and the example scripts make their Plotter off-screen
+and, instead of plt.show(interactive=True), write PNG (and X3D + HTML) files of
+a few standard viewpoints to ./working/renders/. In a script:
+
+    plt = Plotter(..., offscreen=headless())
+    ...  # build the scene and plt.show(..., interactive=False) as usual
+    if headless():
+        SceneExporter(plt, name='minetteSite').views(formats=('png', 'x3d'))
+    else:
+        plt.show(interactive=True)
+
+All the viewpoints (and orbit frames for a video) are rendered from the same
+Plotter, only the camera moves, so the actors are built once. Plotters aren't
+shared between processes: for many figures in parallel each process makes its
+own (see e.g. concurrent.futures.ProcessPoolExecutor).
+
+Only VTK calls are used for the output (vtkWindowToImageFilter, vtkX3DExporter)
+so it doesn't depend on which vedo version has which export function.
+"""
+import os
+
+import numpy as np
+import vtk
+
+out_dir = './working/renders/'
+
+# azimuth is where the camera is, counter clockwise from south seen from above
+# (0: on the south side looking north, 90: east, -45: south west), elevation
+# up from horizontal
+standard_views = {
+    'iso': dict(azimuth=-45, elevation=30),
+    'top': dict(azimuth=0, elevation=90),
+    'south': dict(azimuth=0, elevation=10),
+    'east': dict(azimuth=90, elevation=10),
+}
+
+x3d_page = """<html>
+<head>
+<title>{title}</title>
+<script type="text/javascript" src="https://www.x3dom.org/download/x3dom.js"></script>
+<link rel="stylesheet" type="text/css" href="https://www.x3dom.org/download/x3dom.css"/>
+</head>
+<body>
+<x3d width="{width}px" height="{height}px">
+<scene><inline url="{x3d}"></inline></scene>
+</x3d>
+</body>
+</html>
+"""
+
+
+def headless():
+    """True if FLOPYVEDO_HEADLESS is set (and not '0')."""
+    return os.environ.get('FLOPYVEDO_HEADLESS', '0') not in ('', '0')
+
+
+def set_camera(renderer, azimuth=0, elevation=30, zoom=1.0, focal_point=None):
+    """Point the renderer's camera at the scene from azimuth/elevation (degrees)."""
+    bounds = renderer.ComputeVisiblePropBounds()
+    centre = np.array(focal_point if focal_point is not None else
+                      [(bounds[0] + bounds[1]) / 2, (bounds[2] + bounds[3]) / 2,
+                       (bounds[4] + bounds[5]) / 2])
+    az, el = np.radians(azimuth), np.radians(elevation)
+    direction = np.array([np.cos(el) * np.sin(az), -np.cos(el) * np.cos(az), np.sin(el)])
+    cam = renderer.GetActiveCamera()
+    cam.SetFocalPoint(*centre)
+    cam.SetPosition(*(centre + direction))
+    # looking straight down, north is up instead of z
+    cam.SetViewUp(*((0, 1, 0) if abs(elevation) > 89 else (0, 0, 1)))
+    renderer.ResetCamera()
+    cam.Zoom(zoom)
+    renderer.ResetCameraClippingRange()
+
+
+class SceneExporter:
+    """
+    Write the scene of a vedo Plotter to files. The plotter should have been
+    made with offscreen=True and shown once (plt.show(..., interactive=False))
+    so its actors are in the renderers.
+    """
+
+    def __init__(self, plt, name='scene', folder=out_dir):
+        self.plt = plt
+        self.name = name
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    @property
+    def renderers(self):
+        return list(getattr(self.plt, 'renderers', None) or [self.plt.renderer])
+
+    def path(self, *parts):
+        return os.path.join(self.folder, '-'.join((self.name,) + parts))
+
+    def camera(self, **view):
+        """Same viewpoint in every renderer (each sub-window of Plotter(N=...))."""
+        for renderer in self.renderers:
+            set_camera(renderer, **view)
+        self.plt.window.Render()
+
+    def png(self, fname, scale=1):
+        """Screenshot of the whole window, scale > 1 for a higher resolution."""
+        self.plt.window.Render()
+        grab = vtk.vtkWindowToImageFilter()
+        grab.SetInput(self.plt.window)
+        grab.SetScale(scale)
+        grab.ReadFrontBufferOff()
+        grab.Update()
+        writer = vtk.vtkPNGWriter()
+        writer.SetFileName(fname)
+        writer.SetInputConnection(grab.GetOutputPort())
+        writer.Write()
+        return fname
+
+    def x3d(self, fname):
+        """The scene as X3D, plus an .html page next to it that shows it with x3dom."""
+        exporter = vtk.vtkX3DExporter()
+        exporter.SetRenderWindow(self.plt.window)
+        exporter.SetFileName(fname)
+        exporter.SetBinary(0)
+        exporter.Write()
+        width, height = self.plt.window.GetSize()
+        with open(os.path.splitext(fname)[0] + '.html', 'w') as f:
+            f.write(x3d_page.format(title=self.name, width=width, height=height,
+                                    x3d=os.path.basename(fname)))
+        return fname
+
+    def views(self, views=None, formats=('png',), scale=1):
+        """Write each viewpoint (name: set_camera kwargs) in each format, returns the files."""
+        files = []
+        for view, camera in (views or standard_views).items():
+            self.camera(**camera)
+            if 'png' in formats:
+                files.append(self.png(self.path(view) + '.png', scale))
+            if 'x3d' in formats or 'html' in formats:
+                files.append(self.x3d(self.path(view) + '.x3d'))
+        return files
+
+    def orbit(self, nframes=72, elevation=30, zoom=1.0, scale=1):
+        """PNG frames of a full turn around the scene, for a video (e.g. ffmpeg)."""
+        folder = self.path('frames')
+        os.makedirs(folder, exist_ok=True)
+        files = []
+        for i, azimuth in enumerate(np.linspace(0, 360, nframes, endpoint=False)):
+            self.camera(azimuth=azimuth, elevation=elevation, zoom=zoom)
+            files.append(self.png(os.path.join(folder, '{:04d}.png'.format(i)), scale))
+        return files
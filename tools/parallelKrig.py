@@ -0,0 +1,103 @@
+"""
+Run a kriging execute() over many CPU cores.
+
+The targets are split into spatially compact chunks, each chunk is kriged by
+a worker that holds its own copy of the fitted kriger (variogram + samples,
+sent once when the worker starts), and the results are put back in the
+original order. Every target is kriged independently, so the output is the
+same as the serial execute(), it just comes back sooner.
+
+Works with the pykrige 3D krigers and with tools.localKrig.LocalKriging3D.
+
+Note: with backend='processes' on Windows the worker processes re-import the
+script that started them, so the script needs an if __name__ == '__main__':
+guard. backend='threads' doesn't, and does well with LocalKriging3D since
+most of its time is spent in numpy/scipy calls that release the GIL.
+"""
+import os
+import time
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+
+import numpy as np
+
+from tools.krigGrid import PointsKriger
+
+_worker_krig = None
+
+
+def _init_worker(krig):
+    global _worker_krig
+    _worker_krig = krig
+
+
+def _krig_chunk(krig, idx, x, y, z):
+    k, ss = krig.execute('points', x, y, z)
+    return idx, np.ma.filled(k, np.nan), np.ma.filled(ss, np.nan)
+
+
+def _process_chunk(idx, x, y, z):
+    return _krig_chunk(_worker_krig, idx, x, y, z)
+
+
+def spatial_order(x, y, z, nblocks=8):
+    """
+    Order of the points, sorted block by block on a coarse nblocks^3 grid,
+    so consecutive points (and so each chunk) are close together.
+    """
+    keys = []
+    for v in (x, y, z):
+        span = np.ptp(v)
+        b = np.zeros(len(v), dtype=int) if span == 0 else \
+            np.minimum(((v - v.min()) / span * nblocks).astype(int), nblocks - 1)
+        keys.append(b)
+    # lexsort uses the last key first: blocks in z, then y, then x, then point order
+    return np.lexsort((np.arange(len(x)), keys[0], keys[1], keys[2]))
+
+
+class ParallelKriging3D(PointsKriger):
+    """
+    e.g. ParallelKriging3D(ok3d, n_workers=32).execute('grid', gx, gy, gz)
+
+    execute() takes and returns the same things as the kriger it wraps
+    ('grid' results are [iz, iy, ix]).
+    """
+
+    def __init__(self, krig, n_workers=None, chunk_size=20000,
+                 backend='processes', progress=True):
+        if backend not in ('processes', 'threads'):
+            raise ValueError("backend should be 'processes' or 'threads'")
+        self.krig = krig
+        self.n_workers = n_workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.backend = backend
+        self.progress = progress
+
+    def execute_points(self, x, y, z):
+        x, y, z = (np.ravel(np.asarray(v, dtype=float)) for v in (x, y, z))
+        order = spatial_order(x, y, z)
+        chunks = [order[i:i + self.chunk_size]
+                  for i in range(0, len(order), self.chunk_size)]
+
+        kvalues = np.empty(len(x))
+        sigmasq = np.empty(len(x))
+        start = time.time()
+
+        if self.backend == 'processes':
+            pool = ProcessPoolExecutor(self.n_workers, initializer=_init_worker,
+                                       initargs=(self.krig,))
+            submit = lambda idx: pool.submit(_process_chunk, idx, x[idx], y[idx], z[idx])
+        else:
+            pool = ThreadPoolExecutor(self.n_workers)
+            submit = lambda idx: pool.submit(_krig_chunk, self.krig, idx,
+                                             x[idx], y[idx], z[idx])
+        with pool:
+            futures = [submit(idx) for idx in chunks]
+            for done, future in enumerate(as_completed(futures), 1):
+                idx, k, ss = future.result()
+                kvalues[idx] = k
+                sigmasq[idx] = ss
+                if self.progress:
+                    print('kriging: {}/{} chunks ({:.1f} s)'.format(
+                        done, len(chunks), time.time() - start))
+        return kvalues, sigmasq
@@ -0,0 +1,120 @@
+"""
+Extrude a triangular DISV grid (tri.get_cell2d() / tri.get_vertices()) into
+layers of prisms, for any number of layers, with numpy instead of per-cell loops.
+
+The elevations are a (nlay+1, ncpl) stack: the top of layer 1 then the bottom
+of every layer, i.e. np.vstack((top, botm)) from the DISV package. Vertices are
+shared between layers: the bottom of layer k is the top of layer k+1.
+"""
+import numpy as np
+
+
+def cell_vertices(cell2d, vertices):
+    """
+    (ncpl, 3) vertex numbers of each triangle, ordered clockwise (seen from
+    above) like MODFLOW wants, plus the (nvert, 2) vertex x, y.
+    """
+    cell2d = np.asarray(cell2d, dtype=float)
+    vertices = np.asarray(vertices, dtype=float)
+    if not np.all(cell2d[:, 3] == 3):
+        raise ValueError('prisms can only be built from triangular cells')
+    iverts = cell2d[:, 4:7].astype(int)
+    xy = vertices[:, 1:3]
+
+    # flip any counter clockwise triangles
+    p0, p1, p2 = xy[iverts[:, 0]], xy[iverts[:, 1]], xy[iverts[:, 2]]
+    area2 = ((p1[:, 0] - p0[:, 0]) * (p2[:, 1] - p0[:, 1]) -
+             (p2[:, 0] - p0[:, 0]) * (p1[:, 1] - p0[:, 1]))
+    ccw = area2 > 0
+    iverts[ccw] = iverts[ccw][:, [0, 2, 1]]
+    return iverts, xy
+
+
+def build_prisms(cell2d, vertices, elevations, at='cells'):
+    """
+    Build the prisms for all layers at once.
+
+    elevations: (nlay+1, ncpl) when at='cells' (flat cell tops like DISV, each
+    cell gets its own corner points), or (nlay+1, nvert) when at='vertices'
+    (a continuous surface, corner points are shared with the neighbours too).
+
+    Returns points (npoints, 3) and prisms (nlay*ncpl, 6) point numbers, layer
+    by layer. Each prism is the top triangle then the bottom triangle, in the
+    same (clockwise) order, which is the VTK_WEDGE ordering.
+    """
+    iverts, xy = cell_vertices(cell2d, vertices)
+    ncpl = len(iverts)
+    elevations = np.atleast_2d(np.asarray(elevations, dtype=float))
+    nlev = elevations.shape[0]
+    if nlev < 2:
+        raise ValueError('need at least a top and one bottom')
+
+    if at == 'cells':
+        if elevations.shape[1] != ncpl:
+            raise ValueError('elevations should be (nlay+1, ncpl)')
+        # 3 corner points per cell per level: point = (level*ncpl + cell)*3 + corner
+        corner_xy = xy[iverts].reshape(-1, 2)
+        z = np.repeat(elevations, 3, axis=1)
+        points = np.column_stack((np.tile(corner_xy, (nlev, 1)), z.ravel()))
+        level_tri = np.arange(ncpl * 3).reshape(ncpl, 3)
+        npts_level = ncpl * 3
+    elif at == 'vertices':
+        if elevations.shape[1] != len(xy):
+            raise ValueError('elevations should be (nlay+1, nvert)')
+        points = np.column_stack((np.tile(xy, (nlev, 1)), elevations.ravel()))
+        level_tri = iverts
+        npts_level = len(xy)
+    else:
+        raise ValueError("at should be 'cells' or 'vertices'")
+
+    offsets = np.arange(nlev - 1)[:, None, None] * npts_level
+    top = level_tri[None, :, :] + offsets
+    prisms = np.concatenate((top, top + npts_level), axis=2).reshape(-1, 6)
+    return points, prisms
+
+
+def prism_faces(prisms, triangulate=False):
+    """
+    Faces for a surface mesh (e.g. vd.Mesh([points, faces])): the top and
+    bottom triangle and the three side quads of every prism. With
+    triangulate=True the quads are split so everything fits in one
+    (nfaces, 3) int array.
+    """
+    prisms = np.asarray(prisms)
+    # ordered so the normals point out of the prism
+    tris = np.vstack((prisms[:, [0, 2, 1]], prisms[:, [3, 4, 5]]))
+    quads = np.vstack((prisms[:, [0, 1, 4, 3]],
+                       prisms[:, [1, 2, 5, 4]],
+                       prisms[:, [2, 0, 3, 5]]))
+    if triangulate:
+        return np.vstack((tris, quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]))
+    return tris.tolist() + quads.tolist()
+
+
+def to_vtk_grid(points, prisms, cell_data=None):
+    """
+    vtkUnstructuredGrid of VTK_WEDGE cells, built from the arrays in one go.
+    cell_data: optional dict of name -> (ncells,) array, e.g. {'layer': ...}
+    """
+    import vtk
+    from vtk.util import numpy_support
+
+    ncells = len(prisms)
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(
+        np.ascontiguousarray(points, dtype=float), deep=True))
+
+    # legacy cell array layout: [6, p0..p5, 6, p0..p5, ...]
+    conn = np.hstack((np.full((ncells, 1), 6), prisms)).astype(np.int64).ravel()
+    cells = vtk.vtkCellArray()
+    cells.SetCells(ncells, numpy_support.numpy_to_vtkIdTypeArray(conn, deep=True))
+
+    grid = vtk.vtkUnstructuredGrid()
+    grid.SetPoints(vtk_points)
+    grid.SetCells(vtk.VTK_WEDGE, cells)
+
+    for name, values in (cell_data or {}).items():
+        arr = numpy_support.numpy_to_vtk(np.ascontiguousarray(values), deep=True)
+        arr.SetName(name)
+        grid.GetCellData().AddArray(arr)
+    return grid
@@ -0,0 +1,155 @@
+"""
+Spatially correlated Gaussian random fields (e.g. log10 K) at any points,
+cell centres of a triangle mesh included, fast enough for big ensembles.
+
+A Cholesky factor of the covariance matrix is O(n^3), out of the question for
+100k+ cells. Instead the field is simulated on a regular background grid by
+circulant embedding (the covariance on a padded periodic grid is diagonal in
+Fourier space, so a field costs two FFTs) and linearly interpolated to the
+points, with the interpolation weights worked out once:
+
+    xy = np.asarray(tri.get_xcyc())
+    logk = RandomField(xy, model='exponential', len_scale=(30, 10), angle=30,
+                       mean=-4, sill=1, log10=True)
+    k = logk(np.random.default_rng(1))   # (ncells,), 10**field as log10=True
+    k = logk(rng, nreal=100)             # (100, ncells)
+
+It's a field(rng) for tools.ensemble.Ensemble as it is.
+
+model: 'exponential' exp(-h), 'gaussian' exp(-h^2) or 'spherical', with h
+the anisotropic lag: len_scale is one length or one per axis (the first
+along angle, degrees counter clockwise from x, the second across it, a third
+vertical for 3D points). For the spherical model len_scale is the range.
+
+spacing: background grid spacing (one, or per axis), by default a quarter of
+the shortest horizontal len_scale (and of the vertical one in z). The interpolation smooths out variability at scales smaller than
+that (the point variance is kept right, the weights are scaled for it), make
+it smaller for rough (exponential) fields on fine meshes.
+"""
+import warnings
+
+import numpy as np
+from scipy import fft
+
+models = ('exponential', 'gaussian', 'spherical')
+
+
+def covariance(model, h):
+    """Correlation at the (already scaled) lag h."""
+    if model == 'exponential':
+        return np.exp(-h)
+    if model == 'gaussian':
+        return np.exp(-h ** 2)
+    if model == 'spherical':
+        return np.where(h < 1, 1 - 1.5 * h + 0.5 * h ** 3, 0.)
+    raise ValueError('model should be one of {}'.format(models))
+
+
+def scaled_lags(offsets, len_scale, angle):
+    """Anisotropic lag length of offset vectors (..., ndim)."""
+    offsets = np.asarray(offsets, dtype=float)
+    a = np.radians(angle)
+    u = offsets[..., 0] * np.cos(a) + offsets[..., 1] * np.sin(a)
+    v = -offsets[..., 0] * np.sin(a) + offsets[..., 1] * np.cos(a)
+    h2 = (u / len_scale[0]) ** 2 + (v / len_scale[1]) ** 2
+    if offsets.shape[-1] == 3:
+        h2 = h2 + (offsets[..., 2] / len_scale[2]) ** 2
+    return np.sqrt(h2)
+
+
+class RandomField:
+    """
+    points: (n, 2) or (n, 3) coordinates to have values at.
+    sill: variance of the field, mean: its mean.
+    log10: return 10**field (K from a log10 K field).
+    padding: the background grid is padded by this many of the longest
+    horizontal (and the vertical) len_scale, the periodic copies must be that
+    far apart to not correlate.
+    """
+
+    def __init__(self, points, model='exponential', len_scale=1., angle=0., sill=1.,
+                 mean=0., spacing=None, padding=4., log10=False, max_grid=2e8):
+        if model not in models:
+            raise ValueError('model should be one of {}'.format(models))
+        self.points = np.atleast_2d(np.asarray(points, dtype=float))
+        ndim = self.points.shape[1]
+        if ndim not in (2, 3):
+            raise ValueError('points should be (n, 2) or (n, 3)')
+        self.model = model
+        self.len_scale = np.broadcast_to(np.asarray(len_scale, dtype=float), (ndim,)).copy()
+        self.angle = angle
+        self.sill = sill
+        self.mean = mean
+        self.log10 = log10
+        # horizontal and vertical lengths (the horizontal axes can be rotated)
+        lengths = np.full(ndim, self.len_scale[:2].min())
+        reach = np.full(ndim, self.len_scale[:2].max())
+        if ndim == 3:
+            lengths[2] = reach[2] = self.len_scale[2]
+        self.spacing = np.broadcast_to(
+            np.asarray(spacing if spacing else lengths / 4., dtype=float), (ndim,)).copy()
+
+        # background grid over the points, and its padded periodic version
+        self.origin = self.points.min(axis=0)
+        self.shape = tuple((np.ceil(np.ptp(self.points, axis=0) / self.spacing)
+                            ).astype(int) + 2)
+        pad = np.ceil(padding * reach / self.spacing).astype(int)
+        self.padded_shape = tuple(fft.next_fast_len(int(m + p), real=True)
+                                  for m, p in zip(self.shape, pad))
+        if np.prod(self.padded_shape, dtype=float) > max_grid:
+            raise ValueError('background grid of {} cells, use a larger spacing'.format(
+                self.padded_shape))
+
+        self.sqrt_eigenvalues = self._spectrum()
+        self._interpolation_weights()
+
+    def _spectrum(self):
+        # covariance of every grid node with node 0 on the torus, diagonalised by the FFT
+        # (signed offsets, a rotated anisotropy isn't symmetric in each axis)
+        lags = np.meshgrid(*[np.where(np.arange(m) <= m // 2, np.arange(m), np.arange(m) - m) * h
+                             for m, h in zip(self.padded_shape, self.spacing)],
+                           indexing='ij', sparse=True)
+        offsets = np.stack(np.broadcast_arrays(*lags), axis=-1)
+        c = self.sill * covariance(self.model, scaled_lags(offsets, self.len_scale, self.angle))
+        eigenvalues = fft.rfftn(c).real
+        negative = -eigenvalues[eigenvalues < 0].sum() / np.abs(eigenvalues).sum()
+        if negative > 1e-2:
+            warnings.warn('circulant embedding is {:.1%} off (negative eigenvalues set '
+                          'to 0), use more padding'.format(negative))
+        return np.sqrt(np.maximum(eigenvalues, 0))
+
+    def _interpolation_weights(self):
+        # the 2^ndim grid nodes around each point, and their (multi)linear weights
+        ndim = self.points.shape[1]
+        rel = (self.points - self.origin) / self.spacing
+        i0 = np.minimum(np.floor(rel).astype(int), np.array(self.shape) - 2)
+        frac = rel - i0
+        corners = np.array(np.meshgrid(*[[0, 1]] * ndim, indexing='ij')).reshape(ndim, -1).T
+        self.nodes = np.empty((len(corners), len(self.points)), dtype=np.int64)
+        self.weights = np.empty((len(corners), len(self.points)))
+        for c, corner in enumerate(corners):
+            idx = i0 + corner
+            self.nodes[c] = np.ravel_multi_index(tuple(idx.T), self.padded_shape)
+            self.weights[c] = np.prod(np.where(corner, frac, 1 - frac), axis=1)
+        # a weighted mean of the nodes varies less than the field does, scale the
+        # weights back up so every point has exactly sill variance
+        corr = covariance(self.model, scaled_lags(
+            (corners[:, None] - corners[None, :]) * self.spacing, self.len_scale, self.angle))
+        variance = np.einsum('ip,ij,jp->p', self.weights, corr, self.weights)
+        self.weights /= np.sqrt(variance)
+
+    def grid(self, rng=None):
+        """One field on the whole (padded) background grid, zero mean and sill variance."""
+        rng = np.random.default_rng(rng)
+        z = rng.standard_normal(self.padded_shape)
+        return fft.irfftn(self.sqrt_eigenvalues * fft.rfftn(z), s=self.padded_shape)
+
+    def __call__(self, rng=None, nreal=None):
+        """Values at the points, (n,) or (nreal, n)."""
+        rng = np.random.default_rng(rng)
+        fields = []
+        for _ in range(1 if nreal is None else nreal):
+            g = self.grid(rng).ravel()
+            v = self.mean + np.einsum('ij,ij->j', g[self.nodes], self.weights)
+            fields.append(10 ** v if self.log10 else v)
+        return fields[0] if nreal is None else np.array(fields)
@@ -0,0 +1,140 @@
+"""
+Load ESRI ASCII grids (like ./input_files/dem50mEsriAscii.txt) without walking
+every cell in Python.
+
+The header is parsed for the grid geometry, the values are read in one go and
+NODATA cells become NaN. The parsed grid is saved as a .npy next to the other
+caches in ./working/cache/ so later runs just memory-map it.
+"""
+import numpy as np
+
+from tools.cache import cache_path, file_stamp, hash_key
+
+_header_keys = ('ncols', 'nrows', 'xllcorner', 'yllcorner', 'xllcenter',
+                'yllcenter', 'cellsize', 'nodata_value')
+
+
+class Raster:
+    """
+    A regular grid of values. Row 0 is the top (north) row, same as the
+    ESRI file, and x/y are the cell centres.
+    """
+
+    def __init__(self, z, xllcorner, yllcorner, cellsize, nodata=None):
+        self.z = z
+        self.xllcorner = float(xllcorner)
+        self.yllcorner = float(yllcorner)
+        self.cellsize = float(cellsize)
+        self.nodata = nodata
+
+    @property
+    def nrows(self):
+        return self.z.shape[0]
+
+    @property
+    def ncols(self):
+        return self.z.shape[1]
+
+    @property
+    def total_x(self):
+        return self.ncols * self.cellsize
+
+    @property
+    def total_y(self):
+        return self.nrows * self.cellsize
+
+    @property
+    def extent(self):
+        """(xmin, xmax, ymin, ymax) of the outside edges of the grid."""
+        return (self.xllcorner, self.xllcorner + self.total_x,
+                self.yllcorner, self.yllcorner + self.total_y)
+
+    @property
+    def x(self):
+        """x of the column centres, west to east."""
+        return self.xllcorner + (np.arange(self.ncols) + 0.5) * self.cellsize
+
+    @property
+    def y(self):
+        """y of the row centres, north to south (same order as the rows)."""
+        return self.yllcorner + (self.nrows - np.arange(self.nrows) - 0.5) * self.cellsize
+
+    def coords(self):
+        """
+        Lazy (nrows, ncols) views of the x and y of every cell. These are
+        broadcast views, so no memory is used for them.
+        """
+        shape = self.z.shape
+        return (np.broadcast_to(self.x[None, :], shape),
+                np.broadcast_to(self.y[:, None], shape))
+
+    def xyz(self, skip_nodata=True):
+        """(n, 3) array of cell x, y, z, top left to bottom right."""
+        xx, yy = self.coords()
+        z = np.asarray(self.z)
+        if skip_nodata:
+            keep = ~np.isnan(z)
+            return np.column_stack((xx[keep], yy[keep], z[keep]))
+        return np.column_stack((xx.ravel(), yy.ravel(), z.ravel()))
+
+
+def read_header(fh):
+    """Read the ESRI ASCII header off an open (binary) file, returns a dict."""
+    header = {}
+    while True:
+        pos = fh.tell()
+        line = fh.readline()
+        parts = line.split()
+        if not parts or parts[0].decode().lower() not in _header_keys:
+            fh.seek(pos)  # that was data, put it back
+            break
+        header[parts[0].decode().lower()] = float(parts[1])
+
+    for key in ('ncols', 'nrows', 'cellsize'):
+        if key not in header:
+            raise ValueError('ESRI ASCII header is missing ' + key)
+    # the grid can be registered at the corner or the centre of the lower left cell
+    half = header['cellsize'] / 2.
+    if 'xllcorner' not in header:
+        header['xllcorner'] = header['xllcenter'] - half
+    if 'yllcorner' not in header:
+        header['yllcorner'] = header['yllcenter'] - half
+    header['ncols'] = int(header['ncols'])
+    header['nrows'] = int(header['nrows'])
+    return header
+
+
+def read_esri_ascii(fname, use_cache=True):
+    """
+    Read an ESRI ASCII grid into a Raster. NODATA values are NaN.
+
+    With use_cache the values are saved once as a .npy and then memory mapped
+    (read only) on the next run, the cache is refreshed if the .txt changes.
+    """
+    with open(fname, 'rb') as fh:
+        header = read_header(fh)
+        shape = (header['nrows'], header['ncols'])
+        z = None
+        if use_cache:
+            npy = cache_path('esri', hash_key(file_stamp(fname)), 'npy')
+            try:
+                z = np.load(npy, mmap_mode='r')
+                if z.shape != shape:
+                    z = None
+            except (OSError, ValueError):
+                z = None
+        if z is None:
+            # one bulk parse of the whole body, newlines count as whitespace
+            z = np.fromfile(fh, dtype=float, sep=' ')
+            if z.size != shape[0] * shape[1]:
+                raise ValueError('{}: expected {} values, read {}'.format(
+                    fname, shape[0] * shape[1], z.size))
+            z = z.reshape(shape)
+            if 'nodata_value' in header:
+                z[z == header['nodata_value']] = np.nan
+            if use_cache:
+                np.save(npy, z)
+                z = np.load(npy, mmap_mode='r')
+
+    return Raster(z, header['xllcorner'], header['yllcorner'],
+                  header['cellsize'], header.get('nodata_value'))
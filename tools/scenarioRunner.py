@@ -0,0 +1,224 @@
+"""
+Run many MODFLOW 6 simulations (a parameter sweep) at the same time.
+
+Each case is built by your own function, e.g. build_model in ex-gwt.py, gets
+its own workspace ./working/scenarios/<case name>/, is written and run, and
+optionally post-processed, all in a worker of a bounded pool (mf6 uses one
+core, so by default one worker per core). A case that fails (an exception in
+the build, or mf6 not terminating normally) is recorded and the others carry
+on.
+
+    runner = ScenarioRunner(build_model, postprocess=final_concentration)
+    results = runner.run(parameters)   # {name: {param: value}}, a DataFrame
+                                       # (one row per case) or a list of dicts
+    results.table                      # one row per case: parameters, status,
+                                       # seconds, workspace, error
+    results.outputs['ex-gwt-mt3dms-p01b']
+    results.failed                     # the rows that didn't work
+    results.save()                     # scenarios.csv + outputs.npz in ws
+
+ScenarioRunner(..., warm_start=True) starts each case from the heads of the
+nearest case solved before it (tools.warmStart), fewer IMS iterations for
+steady state models. The table has the outer / inner iterations of every
+case, and about how many of them the warm start saved (compared with the
+nearest cold started case, named in saved_vs).
+
+build(name, **params) returns a flopy MFSimulation, the runner moves it to
+the case's workspace. postprocess(sim) returns whatever you want to keep
+from a successful run (read it into memory, e.g. np.array(...) of a
+MappedHeadFile view, it goes back through a pipe).
+
+Like tools.parallelKrig: with backend='processes' on Windows the script that
+starts the runner needs an if __name__ == '__main__': guard, and build and
+postprocess have to be module-level functions. backend='threads' needs
+neither, mf6 runs in its own process either way, but building flopy
+simulations is then done one at a time.
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait)
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from tools.simWriter import write_changed
+from tools.warmStart import (head_files, iterations_saved, nearest_case, parameter_scale,
+                             seed_heads, solver_iterations)
+
+
+def case_table(parameters):
+    """(name, params dict) of each case from a dict, a DataFrame or a list of dicts."""
+    if isinstance(parameters, pd.DataFrame):
+        if 'name' in parameters.columns:
+            parameters = parameters.set_index('name')
+        return [(str(name), row.dropna().to_dict()) for name, row in parameters.iterrows()]
+    if isinstance(parameters, dict):
+        return [(str(name), dict(params)) for name, params in parameters.items()]
+    return [('case-{:04d}'.format(i), dict(params)) for i, params in enumerate(parameters)]
+
+
+def run_case(build, name, params, ws, postprocess=None, silent=True, lock=None,
+             incremental=False, warm_start=None):
+    """
+    Build, write, run (and post-process) one case, never raises: returns a result dict.
+    lock: held while building and writing (flopy isn't meant to be used from threads).
+    ws can have a {worker} in it, for one workspace per worker (process and thread).
+    incremental: only write the package files that changed (tools.simWriter), for
+    workspaces that get reused.
+    warm_start: head files to take the initial heads from (tools.warmStart.seed_heads),
+    or True for the ones in ws from the last run there.
+    """
+    ws = ws.format(worker='{}-{}'.format(os.getpid(), threading.get_ident()))
+    result = {'name': name, 'workspace': ws, 'status': 'error', 'error': '',
+              'seconds': 0., 'output': None, 'heads': [], 'warm_from': '',
+              'outer': np.nan, 'inner': np.nan}
+    start = time.time()
+    try:
+        with lock or nullcontext():
+            sim = build(name, **params)
+            sim.set_sim_path(ws)
+            if warm_start:
+                result['warm_from'] = ', '.join(seed_heads(sim, warm_start))
+            if incremental:
+                write_changed(sim)
+            else:
+                sim.write_simulation(silent=silent)
+        success, buff = sim.run_simulation(silent=silent, report=True)
+        result.update(solver_iterations(ws))
+        if success:
+            result['status'] = 'ok'
+            result['heads'] = [f for f in head_files(sim) if f is not None]
+            if postprocess is not None:
+                result['output'] = postprocess(sim)
+        else:
+            result['status'] = 'failed'
+            result['error'] = '\n'.join(str(line) for line in buff[-10:])
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.time() - start
+    return result
+
+
+class ScenarioResults:
+    """What ScenarioRunner.run() gives back, see the module docstring."""
+
+    def __init__(self, results, parameters, ws):
+        self.ws = ws
+        rows = []
+        self.outputs = {}
+        for name, params in parameters:
+            r = results[name]
+            rows.append(dict(name=name, **params, status=r['status'],
+                             seconds=r['seconds'], workspace=r['workspace'],
+                             error=r['error'], warm_from=r.get('warm_from', ''),
+                             outer=r.get('outer', np.nan), inner=r.get('inner', np.nan)))
+            if r['output'] is not None:
+                self.outputs[name] = r['output']
+        self.table = iterations_saved(pd.DataFrame(rows).set_index('name'), parameters)
+
+    @property
+    def ok(self):
+        return self.table[self.table['status'] == 'ok']
+
+    @property
+    def failed(self):
+        return self.table[self.table['status'] != 'ok']
+
+    def __repr__(self):
+        return '{} cases, {} ok, {} failed'.format(len(self.table), len(self.ok), len(self.failed))
+
+    def save(self, folder=None):
+        """scenarios.csv (the table) and outputs.npz (array outputs, by case name)."""
+        folder = folder or self.ws
+        self.table.to_csv(os.path.join(folder, 'scenarios.csv'))
+        arrays = {name: np.asarray(v) for name, v in self.outputs.items()
+                  if np.asarray(v).dtype != object}
+        if arrays:
+            np.savez(os.path.join(folder, 'outputs.npz'), **arrays)
+        return folder
+
+
+class ScenarioRunner:
+    """
+    build: build(name, **params) -> MFSimulation.
+    postprocess: postprocess(sim) -> anything, for the successful runs.
+    n_workers: size of the pool (the number of mf6 running at once).
+    incremental: when running a sweep again in the same ws, only write the
+    package files of each case that changed (tools.simWriter).
+    warm_start: start each case from the heads of the nearest case (by
+    parameters) solved so far (tools.warmStart), the table then has the
+    iterations saved against the nearest cold started case.
+    """
+
+    def __init__(self, build, ws='./working/scenarios/', postprocess=None,
+                 n_workers=None, backend='processes', silent=True, progress=True,
+                 incremental=False, warm_start=False):
+        if backend not in ('processes', 'threads'):
+            raise ValueError("backend should be 'processes' or 'threads'")
+        self.build = build
+        self.ws = ws
+        self.postprocess = postprocess
+        self.n_workers = n_workers or os.cpu_count()
+        self.backend = backend
+        self.silent = silent
+        self.progress = progress
+        self.incremental = incremental
+        self.warm_start = warm_start
+
+    def run(self, parameters):
+        cases = case_table(parameters)
+        names = [name for name, params in cases]
+        if len(set(names)) != len(names):
+            raise ValueError('case names should be unique, they are the workspace folders')
+        os.makedirs(self.ws, exist_ok=True)
+
+        n_workers = min(self.n_workers, len(cases)) or 1
+        if self.backend == 'processes':
+            pool, lock = ProcessPoolExecutor(n_workers), None
+        else:
+            pool, lock = ThreadPoolExecutor(n_workers), threading.Lock()
+        results = {}
+        start = time.time()
+        # with warm_start only n_workers cases are submitted at a time, the
+        # next ones start from the nearest case solved by then
+        scale = parameter_scale(cases) if self.warm_start else None
+        in_flight = n_workers if self.warm_start else len(cases)
+        solved = {}  # name: (params, head files)
+        running = {}
+        todo = iter(cases)
+        with pool:
+            while True:
+                for name, params in todo:
+                    source, warm_start = nearest_case(params, solved, scale) or ('', None)
+                    future = pool.submit(run_case, self.build, name, params,
+                                         os.path.join(self.ws, name), self.postprocess,
+                                         self.silent, lock, self.incremental, warm_start)
+                    running[future] = name, params, source
+                    if len(running) >= in_flight:
+                        break
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, params, source = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:  # e.g. a worker process died
+                        result = {'name': name, 'workspace': os.path.join(self.ws, name),
+                                  'status': 'error', 'error': traceback.format_exc(),
+                                  'seconds': np.nan, 'output': None}
+                    if result.get('warm_from'):
+                        result['warm_from'] = source
+                    if self.warm_start and result['status'] == 'ok' and result['heads']:
+                        solved[name] = params, result['heads']
+                    results[name] = result
+                    if self.progress:
+                        print('scenarios: {}/{} ({:.1f} s) {} {}{}'.format(
+                            len(results), len(cases), time.time() - start, name,
+                            result['status'], ' (from {})'.format(source)
+                            if result.get('warm_from') else ''))
+        return ScenarioResults(results, cases, self.ws)
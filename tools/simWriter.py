@@ -0,0 +1,116 @@
+"""
+Write a flopy MODFLOW 6 simulation, but only the package files whose data
+changed since the last write to the same workspace.
+
+sim.write_simulation() formats every package as text every time. In a
+calibration or ensemble loop usually only NPF k changes, and on a big DISV
+grid the DISV file alone is seconds of text (31k cells: 6 s, NPF k 0.9 s).
+
+    write_changed(sim)   # instead of sim.write_simulation()
+
+Each package's data is fingerprinted (tools.cache.hash_key of its arrays and
+lists, milliseconds) and compared with <sim_ws>/flopyvedo-write.json from the
+last write. Unchanged packages whose file is still there aren't written.
+Numeric arrays of min_external values or more (k, strt, botm ...) are
+written as external binary files (OPEN/CLOSE ... (BINARY)), a copy of the
+numbers instead of text. The vertices/cell2d lists stay in the package
+file, flopy's external list files are slower than its text, but the DISV
+file only gets written when the grid changes.
+
+It works with a new sim object for every run too (the fingerprints are of
+the data, and the manifest is in the workspace), like the build functions
+of tools.scenarioRunner / tools.ensemble make.
+"""
+import json
+import os
+
+import numpy as np
+
+from tools.cache import hash_key
+
+manifest_name = 'flopyvedo-write.json'
+
+
+def sim_packages(sim):
+    """Every package of the simulation, name files included, in write_simulation's order."""
+    packages = [sim.name_file] + list(sim.sim_package_list)
+    for name in sim.model_names:
+        model = sim.get_model(name)
+        packages += [model.name_file] + list(model.packagelist)
+    return packages
+
+
+def _parts(value):
+    # things hash_key can digest: numeric arrays as bytes, the rest as repr
+    if isinstance(value, dict):
+        for key in sorted(value, key=str):
+            yield key
+            yield from _parts(value[key])
+    elif isinstance(value, np.ndarray) and value.dtype.names:
+        for name in value.dtype.names:
+            yield name
+            yield from _parts(value[name])
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        yield np.asarray(value)
+    elif isinstance(value, np.ndarray):
+        yield repr(value.tolist())
+    else:
+        yield repr(value)
+
+
+def datasets(package):
+    for block_name, block in package.blocks.items():
+        for name, dataset in block.datasets.items():
+            yield block_name, name, dataset
+
+
+def fingerprint(package):
+    parts = [type(package).__name__, package.filename]
+    for block_name, name, dataset in datasets(package):
+        if name == 'maxbound':  # flopy sets it from the lists when writing
+            continue
+        parts += [block_name, name] + list(_parts(dataset.get_data()))
+    return hash_key(*parts)
+
+
+def externalize(package, min_external=10000):
+    """Store the big numeric arrays of the package as external binary files."""
+    for block_name, name, dataset in datasets(package):
+        if not hasattr(dataset, 'store_as_external_file') or block_name == 'period':
+            continue
+        data = dataset.get_data()
+        if (isinstance(data, np.ndarray) and not data.dtype.names and
+                data.dtype.kind in 'fiu' and data.size >= min_external):
+            dataset.store_as_external_file('{}.{}.bin'.format(package.filename, name),
+                                           binary=True)
+
+
+def write_changed(sim, min_external=10000, silent=True):
+    """Write the packages that changed (or have no file yet), returns their file names."""
+    ws = sim.simulation_data.mfpath.get_sim_path()
+    os.makedirs(ws, exist_ok=True)
+    manifest_file = os.path.join(ws, manifest_name)
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    written = []
+    for package in sim_packages(sim):
+        key = fingerprint(package)
+        fname = package.filename
+        if manifest.get(fname) == key and os.path.exists(os.path.join(ws, fname)):
+            continue
+        if min_external:
+            externalize(package, min_external)
+        package.write()
+        manifest[fname] = key
+        written.append(fname)
+    sim.simulation_data.mfpath.set_last_accessed_path()
+
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    if not silent:
+        print('wrote {} of {} package files: {}'.format(
+            len(written), len(manifest), ', '.join(written) or 'none'))
+    return written
@@ -0,0 +1,150 @@
+"""
+Light instrumentation for the pipeline stages of a script (load, mesh,
+interpolate, write_simulation, run_simulation, read outputs, render...).
+
+Each stage records wall time, CPU time, peak RSS at the end of the stage and
+the size of any arrays handed to it. A JSON and CSV trace of the run go to
+./working/traces/ when the script exits, and a summary table is printed.
+
+It is off unless FLOPYVEDO_TRACE=1 is set (or enabled=True is passed), and when
+off every call returns straight away. In a script:
+
+    trace = Trace('minetteSite')
+    trace.begin('load')
+    ...
+    trace.begin('mesh')   # ends 'load'
+    ...
+    trace.record(cell2d=cell2d, vertices=vertices)
+    trace.end()
+
+or:
+
+    with trace.stage('interpolate'):
+        ...
+"""
+import atexit
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+out_dir = './working/traces/'
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (None if unknown)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on mac
+        return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024. ** 2
+    except (ImportError, AttributeError):
+        return None
+
+
+def array_info(value):
+    value = np.asarray(value) if isinstance(value, (list, tuple)) else value
+    if hasattr(value, 'shape') and hasattr(value, 'nbytes'):
+        return {'shape': list(value.shape), 'mb': value.nbytes / 1024. ** 2}
+    if hasattr(value, '__len__'):
+        return {'len': len(value)}
+    return {'value': repr(value)}
+
+
+class Trace:
+    """Stage timings of one run of a script, see the module docs."""
+
+    def __init__(self, name, enabled=None, summary=True):
+        if enabled is None:
+            enabled = os.environ.get('FLOPYVEDO_TRACE', '0') not in ('', '0')
+        self.name = name
+        self.enabled = enabled
+        self.stages = []
+        self._current = None
+        if enabled:
+            atexit.register(self.finish, summary)
+
+    def begin(self, stage, **arrays):
+        """Start a stage, ending the one running (if any)."""
+        if not self.enabled:
+            return
+        self.end()
+        self._current = {'stage': stage, 'arrays': {},
+                         '_wall': time.perf_counter(), '_cpu': time.process_time()}
+        self.record(**arrays)
+
+    def record(self, **arrays):
+        """Note the size of arrays (or lists, dataframes...) for the running stage."""
+        if not self.enabled or self._current is None:
+            return
+        for key, value in arrays.items():
+            self._current['arrays'][key] = array_info(value)
+
+    def end(self):
+        if not self.enabled or self._current is None:
+            return
+        st = self._current
+        st['wall_s'] = time.perf_counter() - st.pop('_wall')
+        st['cpu_s'] = time.process_time() - st.pop('_cpu')
+        st['peak_rss_mb'] = peak_rss_mb()
+        self.stages.append(st)
+        self._current = None
+
+    @contextmanager
+    def stage(self, stage, **arrays):
+        self.begin(stage, **arrays)
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def summary(self):
+        lines = ['{:<20}{:>10}{:>10}{:>14}'.format('stage', 'wall s', 'cpu s', 'peak RSS MB')]
+        for st in self.stages:
+            rss = st['peak_rss_mb']
+            lines.append('{:<20}{:>10.2f}{:>10.2f}{:>14}'.format(
+                st['stage'], st['wall_s'], st['cpu_s'],
+                '-' if rss is None else '{:.0f}'.format(rss)))
+        total = sum(st['wall_s'] for st in self.stages)
+        lines.append('{:<20}{:>10.2f}'.format('total', total))
+        return '\n'.join(lines)
+
+    def write(self, folder=out_dir):
+        """Write <name>-<time>.json (everything) and .csv (one row per stage)."""
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, '{}-{}'.format(
+            self.name, datetime.now().strftime('%Y%m%d-%H%M%S')))
+        with open(base + '.json', 'w') as f:
+            json.dump({'name': self.name, 'stages': self.stages}, f, indent=2)
+        with open(base + '.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'arrays'])
+            for st in self.stages:
+                writer.writerow([st['stage'], st['wall_s'], st['cpu_s'],
+                                 st['peak_rss_mb'], json.dumps(st['arrays'])])
+        return base
+
+    def finish(self, summary=True):
+        """End the running stage, write the trace and print the summary."""
+        if not self.enabled:
+            return
+        self.end()
+        if not self.stages:
+            return
+        base = self.write()
+        if summary:
+            print(self.summary())
+        print('trace written to ' + base + '.json/.csv')
+        self.stages = []  # so a second finish() (atexit) doesn't write it again
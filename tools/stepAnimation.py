@@ -0,0 +1,145 @@
+"""
+Animate transport (or head) results over the time steps on a fixed mesh.
+
+The geometry (e.g. the prism grid from tools.prismMesh.to_vtk_grid) is built
+and added to the scene once. Each frame then only copies the next step's
+values into the grid's cell array in place, streamed from the binary output
+(tools.binaryOutput.MappedHeadFile, so one step is read at a time), and
+re-renders. No vedo objects are made per frame.
+
+    conc = MappedHeadFile('./working/gwt-p01-mf6.ucn', text='CONCENTRATION')
+    grid = to_vtk_grid(points, prisms)
+    anim = StepAnimation(plt, grid, conc, vmin=0, vmax=1, hide_below=0.01)
+    anim.play(fps=10)                       # in a window
+    anim.export_frames(fps=24, duration=10)  # or headless, PNGs for a video
+
+The cells have to be in the same order as the output file's values
+(layer by layer, like build_prisms makes them).
+"""
+import os
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from tools.offscreen import SceneExporter
+
+
+def lookup_table(cmap='jet', vmin=0., vmax=1., hide_below=None, n=256):
+    """vtkLookupTable from a matplotlib colormap, values under hide_below transparent."""
+    import matplotlib.pyplot
+    colours = matplotlib.pyplot.get_cmap(cmap)(np.linspace(0, 1, n))
+    lut = vtk.vtkLookupTable()
+    lut.SetNumberOfTableValues(n)
+    for i, c in enumerate(colours):
+        lut.SetTableValue(i, *c)
+    lut.SetTableRange(vmin if hide_below is None else max(vmin, hide_below), vmax)
+    if hide_below is not None:
+        lut.SetBelowRangeColor(0, 0, 0, 0)
+        lut.UseBelowRangeColorOn()
+    lut.Build()
+    return lut
+
+
+class StepAnimation:
+    """
+    plt: a vedo Plotter, grid: a vtkDataSet with one cell per output value,
+    results: a MappedHeadFile (anything with nsteps, times and get_data(step=)).
+    vmin/vmax: fixed colour range, by default from the first and last steps.
+    """
+
+    def __init__(self, plt, grid, results, name='concentration', cmap='jet',
+                 vmin=None, vmax=None, hide_below=None, time_units='days'):
+        self.plt = plt
+        self.grid = grid
+        self.results = results
+        self.time_units = time_units
+        self.step = None
+
+        # the cell array wraps this buffer, every step is copied into it
+        self.values = np.zeros(grid.GetNumberOfCells())
+        if self.values.size != results.get_data(step=0).size:
+            raise ValueError('the grid has {} cells, the output {} values per step'.format(
+                self.values.size, results.get_data(step=0).size))
+        self.array = numpy_support.numpy_to_vtk(self.values, deep=False)
+        self.array.SetName(name)
+        grid.GetCellData().AddArray(self.array)
+        grid.GetCellData().SetActiveScalars(name)
+
+        if vmin is None or vmax is None:
+            ends = np.concatenate([np.ravel(results.get_data(step=i))
+                                   for i in (0, results.nsteps - 1)])
+            vmin = np.nanmin(ends) if vmin is None else vmin
+            vmax = np.nanmax(ends) if vmax is None else vmax
+        mapper = vtk.vtkDataSetMapper()
+        mapper.SetInputData(grid)
+        mapper.SetScalarModeToUseCellData()
+        mapper.SetLookupTable(lookup_table(cmap, vmin, vmax, hide_below))
+        mapper.UseLookupTableScalarRangeOn()
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(mapper)
+
+        self.label = vtk.vtkTextActor()
+        self.label.GetTextProperty().SetFontSize(18)
+        self.label.GetTextProperty().SetColor(0, 0, 0)
+        self.label.SetPosition(10, 10)
+
+        plt.renderer.AddActor(self.actor)
+        plt.renderer.AddActor(self.label)
+        plt.renderer.ResetCamera()
+        self.set_step(0)
+
+    def set_step(self, i):
+        """Show step i: copy its values into the cell array, no new geometry."""
+        if i == self.step:
+            return
+        self.values[:] = np.ravel(self.results.get_data(step=i))
+        self.array.Modified()
+        self.label.SetInput('t = {:g} {}'.format(self.results.times[i], self.time_units))
+        self.step = i
+
+    def frame_steps(self, fps=None, duration=None):
+        """Step shown in each frame: one frame per step, or duration*fps frames evenly in time."""
+        if duration is None:
+            return np.arange(self.results.nsteps)
+        times = np.asarray(self.results.times)
+        t = np.linspace(times[0], times[-1], max(1, int(round(duration * fps))))
+        return np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 1)
+
+    def play(self, fps=10, duration=None, loop=True):
+        """Play in the plotter's window (a repeating timer on the interactor)."""
+        frames = self.frame_steps(fps, duration)
+        state = {'frame': 0}
+
+        def tick(obj, event):
+            if state['frame'] >= len(frames):
+                if not loop:
+                    return
+                state['frame'] = 0
+            self.set_step(frames[state['frame']])
+            state['frame'] += 1
+            self.plt.window.Render()
+
+        self.plt.show(interactive=False)
+        interactor = self.plt.interactor
+        interactor.AddObserver('TimerEvent', tick)
+        interactor.CreateRepeatingTimer(int(1000 / fps))
+        interactor.Start()
+
+    def export_frames(self, fps=24, duration=None, name='animation', folder=None, scale=1):
+        """
+        Numbered PNG frames in ./working/renders/<name>-frames/ (headless works,
+        see tools.offscreen), returns the files. Frames whose step didn't change
+        are just re-grabbed.
+        """
+        exporter = SceneExporter(self.plt, name=name, **({'folder': folder} if folder else {}))
+        out = exporter.path('frames')
+        os.makedirs(out, exist_ok=True)
+        self.plt.show(interactive=False)
+        files = []
+        for n, i in enumerate(self.frame_steps(fps, duration)):
+            self.set_step(i)
+            files.append(exporter.png(os.path.join(out, '{:04d}.png'.format(n)), scale))
+        print('{} frames, make a video with: ffmpeg -framerate {} -i {}/%04d.png {}.mp4'.format(
+            len(files), fps, out, exporter.path()))
+        return files
@@ -0,0 +1,71 @@
+"""
+Sample a scattered x,y,z surface (the Denovian layer, land surface points...)
+at any number of target points, triangulating the source points only once.
+
+scipy's griddata rebuilds the Delaunay triangulation on every call, which is
+most of the run time when the same surface is sampled for cell centres, then
+vertices, etc. Here the triangulation is kept on the object and also pickled
+to ./working/cache/, keyed on a hash of the source points.
+"""
+import pickle
+
+import numpy as np
+from scipy.interpolate import CloughTocher2DInterpolator, LinearNDInterpolator
+from scipy.spatial import Delaunay
+
+from tools.cache import cache_path, hash_key
+
+
+class SurfaceSampler:
+    """
+    xy: (n, 2) source points, z: (n,) or (n, k) values at those points.
+    Points outside the convex hull of the source come back as NaN, same as
+    griddata.
+    """
+
+    def __init__(self, xy, z, use_cache=True):
+        self.xy = np.ascontiguousarray(xy, dtype=float)
+        self.z = np.asarray(z, dtype=float)
+        self.tri = None
+        if use_cache:
+            fname = cache_path('delaunay', hash_key(self.xy), 'pkl')
+            try:
+                with open(fname, 'rb') as f:
+                    self.tri = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                self.tri = None
+        if self.tri is None:
+            self.tri = Delaunay(self.xy)
+            if use_cache:
+                with open(fname, 'wb') as f:
+                    pickle.dump(self.tri, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._interpolators = {}
+
+    @classmethod
+    def from_dataframe(cls, df, x='x', y='y', z='z', **kwargs):
+        return cls(df[[x, y]].values, df[z].values, **kwargs)
+
+    def _interpolator(self, method):
+        if method not in self._interpolators:
+            if method == 'linear':
+                f = LinearNDInterpolator(self.tri, self.z)
+            elif method == 'cubic':
+                f = CloughTocher2DInterpolator(self.tri, self.z)
+            else:
+                raise ValueError("method must be 'linear' or 'cubic'")
+            self._interpolators[method] = f
+        return self._interpolators[method]
+
+    def sample(self, x, y, method='linear'):
+        """Surface value at x, y (any matching shapes, like griddata's xi)."""
+        return self._interpolator(method)(x, y)
+
+    def sample_many(self, targets, method='linear'):
+        """
+        Sample several target point sets in one batched query, e.g.
+        [cell2d[:, 1:3], vertices[:, 1:3]]. Returns a list, one per set.
+        """
+        targets = [np.asarray(t, dtype=float).reshape(-1, 2) for t in targets]
+        values = self._interpolator(method)(np.vstack(targets))
+        splits = np.cumsum([len(t) for t in targets])[:-1]
+        return np.split(values, splits)
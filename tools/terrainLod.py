@@ -0,0 +1,167 @@
+"""
+Level of detail meshes for big terrain and geologic surfaces.
+
+Rendering a fine DEM at full density makes rotating the view sluggish, and
+most of those triangles are smaller than a pixel once the camera is a few km
+away. TerrainLOD keeps a few versions of the surface, each decimated with a
+bounded vertical error (vtkGreedyTerrainDecimation: every point of the
+raster it's given is within `error` metres of the mesh, the outline is
+kept), and before each render shows the coarsest one whose error still
+projects to less than pixel_error pixels from where the camera is.
+
+    lod = TerrainLOD(dem)  # a tools.raster.Raster
+    lod.add_to(plt)
+    ... actors can be scaled for the vertical exaggeration as usual:
+    for a in plt.actors:
+        a.scale([1, 1, v_exag])
+
+The errors are in real metres and the exaggeration is only the actor's
+scale, so changing it needs no re-decimation: the switching just takes the
+exaggerated error into account. The coarse levels are decimated from the
+matching DemPyramid level (the coarser the level, the faster), and all the
+levels are cached in ./working/cache/. A block averaged level is itself off
+the DEM by up to DemPyramid.deviation(factor), so each level's error
+(self.errors, what the switching uses) is its decimation error plus that
+(close to, not strictly, a bound: the decimation is only checked at the
+level's own cell centres).
+"""
+import os
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from tools.cache import cache_path, hash_key
+from tools.demPyramid import DemPyramid
+
+# (pyramid factor, max decimation error in m), finest first
+default_levels = ((1, 1.), (2, 4.), (4, 16.), (8, 64.))
+
+
+def decimate_raster(raster, error):
+    """Points (n, 3) and triangles (m, 3) of the raster, to within error (z units)."""
+    z = np.asarray(raster.z, dtype=float)[::-1]  # row 0 south for vtk
+    nodata = np.isnan(z)
+    if nodata.all():
+        raise ValueError('raster is all NODATA')
+    if nodata.any():  # greedy decimation needs values everywhere, those get cut out below
+        z = np.where(nodata, np.nanmean(z), z)
+
+    image = vtk.vtkImageData()
+    image.SetDimensions(raster.ncols, raster.nrows, 1)
+    image.SetSpacing(raster.cellsize, raster.cellsize, 1)
+    image.SetOrigin(raster.x[0], raster.y[-1], 0)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(z.ravel(), deep=True))
+
+    greedy = vtk.vtkGreedyTerrainDecimation()
+    greedy.SetInputData(image)
+    greedy.SetErrorMeasureToAbsoluteError()
+    greedy.SetAbsoluteError(error)
+    greedy.BoundaryVertexDeletionOff()
+    greedy.Update()
+    out = greedy.GetOutput()
+
+    points = numpy_support.vtk_to_numpy(out.GetPoints().GetData()).astype(float)
+    triangles = numpy_support.vtk_to_numpy(out.GetPolys().GetData()).reshape(-1, 4)[:, 1:]
+    if nodata.any():
+        # drop the triangles with a corner on a NODATA cell
+        col = np.rint((points[:, 0] - raster.x[0]) / raster.cellsize).astype(int)
+        row = np.rint((points[:, 1] - raster.y[-1]) / raster.cellsize).astype(int)
+        triangles = triangles[~nodata[row, col][triangles].any(axis=1)]
+    return points, triangles
+
+
+class TerrainLOD:
+    """
+    levels: (pyramid factor, max vertical error) pairs, finest first.
+    pixel_error: switch to a coarser level while its error is smaller than
+    this many pixels on screen.
+    pyramid: a DemPyramid of raster that has the factors, if there's one already.
+    """
+
+    def __init__(self, raster, levels=default_levels, pixel_error=2.,
+                 cmap='terrain', pyramid=None, use_cache=True):
+        self.raster = raster
+        self.levels = tuple(levels)
+        self.pixel_error = pixel_error
+        self.cmap = cmap
+        self.meshes = []  # (points, triangles) per level
+        self.errors = []  # decimation error + the pyramid level's deviation from the DEM
+        if pyramid is None:
+            pyramid = DemPyramid(raster, factors=[f for f, e in self.levels if f > 1],
+                                 use_cache=use_cache)
+        for factor, error in self.levels:
+            level_raster = pyramid.level(factor)
+            self.errors.append(error + (pyramid.deviation(factor) if factor > 1 else 0.))
+            fname = None
+            if use_cache:
+                key = hash_key(np.asarray(level_raster.z), level_raster.xllcorner,
+                               level_raster.yllcorner, level_raster.cellsize, error)
+                fname = cache_path('terrainlod', key, 'npz')
+            if fname is not None and os.path.exists(fname):
+                with np.load(fname) as f:
+                    mesh = (f['points'], f['triangles'])
+            else:
+                mesh = decimate_raster(level_raster, error)
+                if fname is not None:
+                    np.savez(fname, points=mesh[0], triangles=mesh[1])
+            self.meshes.append(mesh)
+        self.actors = []
+        self.current = None
+
+    def __len__(self):
+        return len(self.levels)
+
+    def build_actors(self):
+        """One vedo Mesh per level, coloured by elevation, all but the finest hidden."""
+        import vedo
+        if not self.actors:
+            for i, (points, triangles) in enumerate(self.meshes):
+                mesh = vedo.Mesh([points, triangles])
+                mesh.cmap(self.cmap, points[:, 2])
+                mesh.name = 'Land Surface LOD {}'.format(i)
+                self.actors.append(mesh)
+            self.show_level(0)
+        return self.actors
+
+    def show_level(self, i):
+        if i == self.current:
+            return
+        for j, actor in enumerate(self.actors):
+            actor.SetVisibility(j == i)
+        self.current = i
+
+    def pick_level(self, renderer):
+        """Coarsest level whose (exaggerated) error is below pixel_error from this camera."""
+        camera = renderer.GetActiveCamera()
+        actor = self.actors[0]
+        bounds = np.reshape(actor.GetBounds(), (3, 2))
+        eye = np.array(camera.GetPosition())
+        # distance to the closest point of the surface's bounding box
+        distance = max(np.linalg.norm(eye - np.clip(eye, bounds[:, 0], bounds[:, 1])), 1e-6)
+        height = renderer.GetSize()[1] or 1
+        if camera.GetParallelProjection():
+            pixels_per_m = height / (2. * camera.GetParallelScale())
+        else:
+            pixels_per_m = height / (2. * distance * np.tan(np.radians(camera.GetViewAngle()) / 2))
+        z_scale = actor.GetScale()[2]
+        level = 0
+        for i, error in enumerate(self.errors):
+            if error * z_scale * pixels_per_m <= self.pixel_error:
+                level = i
+        return level
+
+    def update(self, renderer):
+        if self.actors:
+            self.show_level(self.pick_level(renderer))
+
+    def add_to(self, plt, at=None):
+        """Add the levels to a vedo Plotter and switch them before every render."""
+        for actor in self.build_actors():
+            if at is None:
+                plt += actor
+            else:
+                plt.show(actor, at=at, interactive=False)
+        renderer = plt.renderers[at] if at is not None else plt.renderer
+        renderer.AddObserver('StartEvent', lambda obj, event: self.update(obj))
+        return self.actors
@@ -0,0 +1,242 @@
+"""
+Triangular DISV meshes without the round trip through triangle.exe.
+
+Drop-in for flopy.utils.triangle.Triangle (same add_polygon / add_region /
+add_hole / build / get_cell2d / get_vertices / get_edge_cells / plot), but
+the mesh is made in-process with the `triangle` package (pip install
+triangle, it wraps the same Shewchuk Triangle code) and handed back as arrays,
+no .poly/.node/.ele files. If the package isn't installed it falls back to
+flopy and the executable.
+
+Built meshes are kept in ./working/cache/, keyed on the polygons, holes,
+regions (with their maximum areas), fixed nodes and angle, so a re-run with
+the same geometry doesn't mesh at all.
+
+A SizeFunction (tools.meshSizing) can be passed to refine the mesh around
+boreholes, borings, rivers etc. instead of using one maximum area everywhere.
+
+Boundary markers are the same as flopy's: segment i of the polygons (counting
+on through each polygon added) is marker i + 1. So for the usual domain
+[ll, ul, ur, lr] 1 is the left side, 2 the top, 3 the right, 4 the bottom.
+"""
+import os
+
+import numpy as np
+
+from tools.cache import cache_path, hash_key
+from tools.meshSizing import refine, size_to_area
+
+try:
+    import triangle as triangle_lib
+except ImportError:
+    triangle_lib = None
+
+
+class Triangle:
+    """
+    e.g.
+        tri = Triangle(angle=30)
+        tri.add_polygon(active_domain)
+        tri.add_region((xllcorner+5, yllcorner+5), 0, maximum_area=max_area)
+        tri.build()
+        cell2d = tri.get_cell2d()
+
+    model_ws and exe_name are only used when the triangle package isn't there.
+    size_function: a tools.meshSizing.SizeFunction, the mesh is refined until
+    every triangle is as small as it asks for (needs the triangle package).
+    """
+
+    def __init__(self, model_ws='./working/', exe_name='triangle', maximum_area=None,
+                 angle=20.0, nodes=None, additional_args=None, use_cache=True,
+                 size_function=None):
+        self.model_ws = model_ws
+        self.exe_name = exe_name
+        self.maximum_area = maximum_area
+        self.angle = angle
+        self._nodes = None if nodes is None else np.asarray(nodes, dtype=float)
+        self.additional_args = additional_args
+        self.use_cache = use_cache
+        self.size_function = size_function
+        self._polygons = []
+        self._holes = []
+        self._regions = []
+        self.ncpl = 0
+        self.nvert = 0
+        self.verts = None
+        self.iverts = None
+
+    def add_polygon(self, polygon):
+        """Add a polygon, a list of (x, y) (closing point optional)."""
+        polygon = np.asarray(polygon, dtype=float)[:, :2]
+        if len(polygon) > 1 and np.all(polygon[0] == polygon[-1]):
+            polygon = polygon[:-1]
+        self._polygons.append(polygon)
+
+    def add_hole(self, hole):
+        """Add a point (x, y) inside a polygon that should be left empty."""
+        self._holes.append(tuple(float(v) for v in hole))
+
+    def add_region(self, point, attribute=0, maximum_area=None):
+        """Add a point (x, y) of a region, with its attribute and maximum triangle area."""
+        self._regions.append((float(point[0]), float(point[1]), attribute,
+                              -1. if maximum_area is None else float(maximum_area)))
+
+    #################
+    # meshing
+
+    def _pslg(self):
+        """Vertices, segments (with markers), holes and regions, as arrays."""
+        vertices = np.vstack(self._polygons)
+        segments = []
+        start = 0
+        for p in self._polygons:
+            i = np.arange(len(p)) + start
+            segments.append(np.column_stack((i, np.roll(i, -1))))
+            start += len(p)
+        segments = np.vstack(segments)
+        markers = np.arange(1, len(segments) + 1)
+        if self._nodes is not None:
+            vertices = np.vstack((vertices, self._nodes[:, :2]))
+        return vertices, segments, markers
+
+    def cache_key(self):
+        vertices, segments, _ = self._pslg()
+        return hash_key('triangle-1', vertices, segments, np.array(self._holes),
+                        np.array(self._regions, dtype=float), self.maximum_area,
+                        self.angle, self.additional_args,
+                        None if self.size_function is None else self.size_function.key())
+
+    def _switches(self, maximum_area=None):
+        s = 'pADe'
+        if self.angle is not None:
+            s += 'q{}'.format(self.angle)
+        s += 'a' if maximum_area is None else 'a{}'.format(maximum_area)
+        if self.additional_args:
+            s += ''.join(a.lstrip('-') for a in self.additional_args)
+        return s
+
+    def _mesh_in_process(self, verbose=False):
+        vertices, segments, markers = self._pslg()
+        pslg = dict(vertices=vertices, segments=segments,
+                    segment_markers=markers[:, None])
+        if self._holes:
+            pslg['holes'] = np.array(self._holes)
+        if self._regions:
+            pslg['regions'] = np.array(self._regions, dtype=float)
+        maximum_area = self.maximum_area
+        if maximum_area is None and self.size_function is not None:
+            maximum_area = size_to_area(self.size_function.base_size)
+        out = triangle_lib.triangulate(pslg, self._switches(maximum_area))
+        attributes = out.get('triangle_attributes', np.zeros((len(out['triangles']), 1)))
+        edges = np.column_stack((out['edges'], out['edge_markers'][:, 0]))
+        mesh = dict(vertices=out['vertices'], triangles=out['triangles'],
+                    attributes=attributes[:, 0], edges=edges)
+        if self.size_function is not None:
+            mesh = refine(triangle_lib.triangulate, mesh, self.size_function,
+                          self._switches(), verbose=verbose)
+        return mesh
+
+    def _mesh_with_exe(self):
+        from flopy.utils.triangle import Triangle as FlopyTriangle
+        tri = FlopyTriangle(model_ws=self.model_ws, exe_name=self.exe_name,
+                            maximum_area=self.maximum_area, angle=self.angle,
+                            nodes=self._nodes, additional_args=self.additional_args)
+        for p in self._polygons:
+            tri.add_polygon(p.tolist())
+        for h in self._holes:
+            tri.add_hole(h)
+        for x, y, attribute, area in self._regions:
+            tri.add_region((x, y), attribute, None if area < 0 else area)
+        tri.build()
+        ele = tri.ele
+        return dict(vertices=tri.verts,
+                    triangles=np.column_stack((ele['iv1'], ele['iv2'], ele['iv3'])),
+                    attributes=ele['attribute'],
+                    edges=np.column_stack((tri.edge['endpoint1'], tri.edge['endpoint2'],
+                                           tri.edge['boundary_marker'])))
+
+    def build(self, verbose=False):
+        """Make the mesh (or load it from the cache)."""
+        if not self._polygons:
+            raise ValueError('add_polygon() before build()')
+        fname = cache_path('triangle', self.cache_key(), 'npz') if self.use_cache else None
+        if fname is not None and os.path.exists(fname):
+            with np.load(fname) as f:
+                mesh = dict(f)
+            if verbose:
+                print('mesh loaded from ' + fname)
+        else:
+            if triangle_lib is not None:
+                mesh = self._mesh_in_process(verbose)
+            elif self.size_function is not None:
+                raise ImportError('refining with a size function needs the triangle '
+                                  'package: pip install triangle')
+            else:
+                mesh = self._mesh_with_exe()
+            if fname is not None:
+                np.savez(fname, **mesh)
+        self._set_mesh(**mesh)
+        if verbose:
+            print('{} cells, {} vertices'.format(self.ncpl, self.nvert))
+
+    def _set_mesh(self, vertices, triangles, attributes, edges):
+        self.verts = np.asarray(vertices, dtype=float)
+        self.triangles = np.asarray(triangles, dtype=int)
+        self.attributes = np.asarray(attributes)
+        self.edge = np.asarray(edges, dtype=int)  # endpoint1, endpoint2, boundary marker
+        self.iverts = self.triangles.tolist()
+        self.ncpl = len(self.triangles)
+        self.nvert = len(self.verts)
+
+    #################
+    # same outputs as flopy's Triangle
+
+    def get_xcyc(self):
+        """Cell centres (ncpl, 2), the centroid of each triangle."""
+        return self.verts[self.triangles].mean(axis=1)
+
+    def get_cell2d(self):
+        """[[icell, xc, yc, 3, iv1, iv2, iv3], ...] for the DISV package (clockwise)."""
+        xcyc = self.get_xcyc()
+        return [[i, xc, yc, 3] + iv[::-1]
+                for i, ((xc, yc), iv) in enumerate(zip(xcyc.tolist(), self.iverts))]
+
+    def get_vertices(self):
+        """[[ivert, x, y], ...] for the DISV package."""
+        return [[i, x, y] for i, (x, y) in enumerate(self.verts.tolist())]
+
+    def get_edge_cells(self, ibm):
+        """Zero based cells that have a side on boundary marker ibm."""
+        on_marker = self.edge[self.edge[:, 2] == ibm, :2]
+        if len(on_marker) == 0:
+            return []
+        n = self.nvert
+        wanted = np.sort(on_marker, axis=1) @ [n, 1]
+        sides = np.stack((self.triangles, np.roll(self.triangles, -1, axis=1)), axis=-1)
+        sides = np.sort(sides, axis=-1) @ [n, 1]  # (ncpl, 3)
+        hits = np.isin(sides, wanted).sum(axis=1)
+        return np.repeat(np.arange(self.ncpl), hits).tolist()
+
+    def get_boundary_marker_array(self):
+        iedge = np.zeros(self.ncpl, dtype=int)
+        for ibm in np.unique(self.edge[:, 2]):
+            if ibm != 0:
+                iedge[self.get_edge_cells(ibm)] = ibm
+        return iedge
+
+    def get_attribute_array(self):
+        return self.attributes
+
+    def plot(self, ax=None, layer=0, edgecolor='k', facecolor='none', cmap='Dark2',
+             a=None, masked_values=None, **kwargs):
+        """Plot the grid (or array a on it) with flopy, same as flopy's Triangle.plot."""
+        from flopy.discretization import VertexGrid
+        from flopy.plot import PlotMapView
+
+        modelgrid = VertexGrid(vertices=self.get_vertices(), cell2d=self.get_cell2d(),
+                               ncpl=self.ncpl, nlay=1)
+        pmv = PlotMapView(modelgrid=modelgrid, ax=ax, layer=layer)
+        if a is None:
+            return pmv.plot_grid(facecolor=facecolor, edgecolor=edgecolor, **kwargs)
+        return pmv.plot_array(a, masked_values=masked_values, cmap=cmap,
+                              edgecolor=edgecolor, **kwargs)
@@ -0,0 +1,169 @@
+"""
+Warm starts: the initial heads of a run from the heads of a case already
+solved, instead of a flat strt, so IMS starts close to the answer. In a
+calibration or sweep the last run, or the case with the nearest parameters,
+usually is (unconfined, nonlinear models often take half the iterations).
+
+    seed_heads(sim, ['./working/scenarios/case-0003/gwf.hds'])  # before writing
+    sim.write_simulation()
+    sim.run_simulation()
+    solver_iterations(sim_ws)     # {'outer': 12, 'inner': 230} from mfsim.lst
+
+tools.scenarioRunner.ScenarioRunner(..., warm_start=True) and
+tools.ensemble.Ensemble(..., warm_start=True) do this for you: each case
+starts from the nearest solved one, and their tables have the outer and
+inner iterations of each run and about how many the warm start saved:
+compared with the nearest cold started case (by parameters) for scenarios,
+with the mean of the cold started realizations for an ensemble. Both are
+rough, the case compared with has other parameters (or another K field) as
+well as no warm start, saved_vs says which one it was.
+
+The last saved heads of each GWF model's head file become its IC strt (one
+head file per GWF model, in sim.model_names order). Dry and inactive cells
+(|head| >= 1e29) keep the strt they had. Only for steady state flow: the
+initial heads of a transient model are part of the problem, so models with
+transient STO periods are left alone.
+"""
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from tools.binaryOutput import MappedHeadFile
+
+
+def gwf_models(sim):
+    return [sim.get_model(name) for name in sim.model_names
+            if sim.get_model(name).model_type.startswith('gwf')]
+
+
+def head_files(sim):
+    """Path of the head file of each GWF model (None without one), in the sim's workspace."""
+    ws = sim.simulation_data.mfpath.get_sim_path()
+    files = []
+    for model in gwf_models(sim):
+        oc = model.get_package('oc')
+        record = oc.head_filerecord.get_data() if oc is not None else None
+        files.append(os.path.join(ws, record[0][0]) if record is not None and len(record)
+                     else None)
+    return files
+
+
+def transient(model):
+    sto = model.get_package('sto')
+    return sto is not None and bool(sto.transient.get_data())
+
+
+def seed_heads(sim, sources):
+    """
+    Set the IC strt of each GWF model from the last heads in sources (one
+    head file per GWF model, or True for the head files already in the
+    sim's own workspace, from its last run). Returns the files used, or []
+    if there was nothing to start from (the run starts cold).
+    """
+    if sources is True:
+        sources = head_files(sim)
+    used = []
+    for model, fname in zip(gwf_models(sim), sources or ()):
+        if fname is None or not os.path.exists(fname):
+            continue
+        if transient(model):
+            warnings.warn('{} is transient, not warm started'.format(model.name))
+            continue
+        ic = model.get_package('ic')
+        strt = np.array(ic.strt.get_data(), dtype=float)
+        try:
+            heads = np.array(MappedHeadFile(fname).get_data(), dtype=float)
+        except (OSError, ValueError):  # empty or half written (a run that died)
+            continue
+        if heads.size != strt.size:
+            warnings.warn('{} has {} heads for {} cells, not used'.format(
+                fname, heads.size, strt.size))
+            continue
+        heads = heads.reshape(strt.shape)
+        ic.strt.set_data(np.where(np.abs(heads) < 1e29, heads, strt))
+        used.append(fname)
+    return used
+
+
+def solver_iterations(ws, listing='mfsim.lst'):
+    """Outer and inner (total) IMS iterations of a run, summed over its time steps."""
+    try:
+        with open(os.path.join(ws, listing)) as f:
+            text = f.read()
+    except OSError:
+        return {'outer': np.nan, 'inner': np.nan}
+    return {'outer': sum(map(int, re.findall(r'(\d+) CALLS TO NUMERICAL SOLUTION', text))),
+            'inner': sum(map(int, re.findall(r'(\d+) TOTAL ITERATIONS', text)))}
+
+
+def parameter_scale(cases):
+    """Range of each numeric parameter over the cases ((name, params) pairs), for distances."""
+    table = pd.DataFrame([params for name, params in cases])
+    numeric = table.select_dtypes('number')
+    scale = (numeric.max() - numeric.min()).replace(0, 1.)
+    return scale.to_dict()
+
+
+def distance(a, b, scale):
+    """Between two parameter sets, the numeric ones scaled, the others have to be equal."""
+    if set(a) != set(b):
+        return np.inf
+    d = 0.
+    for key in a:
+        if key in scale:
+            d += ((a[key] - b[key]) / scale[key]) ** 2
+        elif a[key] != b[key]:
+            return np.inf
+    return np.sqrt(d)
+
+
+def nearest_case(params, solved, scale):
+    """
+    The (name, head files) of the solved case nearest to params, or None.
+    solved: {name: (params, head files)}.
+    """
+    best, best_d = None, np.inf
+    for name, (other, files) in solved.items():
+        d = distance(params, other, scale)
+        if d < best_d:
+            best, best_d = (name, files), d
+    return best
+
+
+def iterations_saved(table, cases=None):
+    """
+    Add outer_saved, inner_saved and saved_vs columns to a table with
+    warm_from, outer and inner columns: for each warm started run, the
+    iterations of the cold started case nearest to it (cases: the (name,
+    params) pairs of the table's rows) minus its own, or without cases those
+    of the mean cold started run ('cold mean'). An estimate, not the same
+    case run twice.
+    """
+    table = table.copy()
+    cold = table[table['warm_from'] == '']
+    if 'status' in cold:
+        cold = cold[cold['status'] == 'ok']
+    warm = table['warm_from'] != ''
+    columns = ['outer', 'inner']
+    baseline = pd.DataFrame(np.nan, index=table.index, columns=columns)
+    reference = pd.Series('', index=table.index, dtype=object)
+    if cases is None:
+        if len(cold):
+            baseline.loc[warm, columns] = cold[columns].mean().values
+            reference[warm] = 'cold mean'
+    else:
+        params = dict(cases)
+        scale = parameter_scale(cases)
+        solved = {name: (params[name], None) for name in cold.index}
+        for name in table.index[warm]:
+            best = nearest_case(params[name], solved, scale)
+            if best is not None:
+                baseline.loc[name, columns] = cold.loc[best[0], columns].values
+                reference[name] = best[0]
+    for column in columns:
+        table[column + '_saved'] = np.where(warm, baseline[column] - table[column], np.nan)
+    table['saved_vs'] = reference
+    return table
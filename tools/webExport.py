@@ -0,0 +1,310 @@
+"""
+Compact web export of a vedo scene: binary glTF (.glb) plus a three.js viewer page.
+
+ASCII X3D writes every coordinate as 17 significant digits, every triangle
+with its own vertices and the page inlines it, which is fine for a few
+thousand triangles and hopeless for a regional model. Here each actor is
+written as:
+    - shared, indexed vertices (coincident points merged)
+    - positions quantized to 16 bit integers, each axis over the actor's
+      own extent on it (KHR_mesh_quantization, the node transform scales
+      them back), so the error is at most half of extent / 65535 on each
+      axis: ~0.4 m across a 50 km model, ~4 mm over 500 m of depth. With
+      max_error set, actors that would be off by more are written as 32 bit
+      floats instead (quantized=False for all of them), relative to the
+      actor's corner so real-world coordinates keep their precision too
+    - colours as 8 bit RGBA per vertex (when the actor is coloured by a
+      colormap) or as a material
+    - optionally decimated first (decimate=0.9 keeps ~10% of the triangles)
+Triangles, lines (e.g. borings) and points are all kept.
+
+    export_glb(plt, './working/renders/DyeLIF.glb', decimate=0.5)
+    export_glb(plt, './working/renders/region.glb', max_error=0.05)  # 5 cm
+
+writes DyeLIF.glb and DyeLIF.html (open it through a web server, e.g.
+python -m http.server, since browsers don't fetch files from file://).
+"""
+import json
+import os
+import struct
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+# glTF component types and modes
+FLOAT, UNSIGNED_BYTE, UNSIGNED_SHORT, UNSIGNED_INT = 5126, 5121, 5123, 5125
+POINTS, LINES, TRIANGLES = 0, 1, 4
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+
+viewer_page = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>body {{ margin: 0; background: #dde6f0; }}</style>
+<script type="importmap">
+{{"imports": {{"three": "https://unpkg.com/three@0.160.0/build/three.module.js",
+               "three/addons/": "https://unpkg.com/three@0.160.0/examples/jsm/"}}}}
+</script>
+</head>
+<body>
+<script type="module">
+import * as THREE from 'three';
+import {{ OrbitControls }} from 'three/addons/controls/OrbitControls.js';
+import {{ GLTFLoader }} from 'three/addons/loaders/GLTFLoader.js';
+
+const renderer = new THREE.WebGLRenderer({{ antialias: true }});
+renderer.setSize(window.innerWidth, window.innerHeight);
+document.body.appendChild(renderer.domElement);
+const scene = new THREE.Scene();
+scene.background = new THREE.Color(0xdde6f0);
+scene.add(new THREE.HemisphereLight(0xffffff, 0x666666, 2.5));
+const camera = new THREE.PerspectiveCamera(45, window.innerWidth / window.innerHeight, 1, 1e7);
+const controls = new OrbitControls(camera, renderer.domElement);
+
+new GLTFLoader().load('{glb}', (gltf) => {{
+  scene.add(gltf.scene);
+  const box = new THREE.Box3().setFromObject(gltf.scene);
+  const size = box.getSize(new THREE.Vector3()).length();
+  const centre = box.getCenter(new THREE.Vector3());
+  controls.target.copy(centre);
+  camera.position.copy(centre).add(new THREE.Vector3(0.5, 0.6, 0.8).multiplyScalar(size));
+  camera.near = size / 1000; camera.far = size * 10; camera.updateProjectionMatrix();
+}});
+window.addEventListener('resize', () => {{
+  camera.aspect = window.innerWidth / window.innerHeight; camera.updateProjectionMatrix();
+  renderer.setSize(window.innerWidth, window.innerHeight);
+}});
+renderer.setAnimationLoop(() => {{ controls.update(); renderer.render(scene, camera); }});
+</script>
+</body>
+</html>
+"""
+
+
+def _cells(cell_array, npts):
+    """Connectivity of a vtkCellArray that only has cells of npts points, (n, npts)."""
+    if cell_array.GetNumberOfCells() == 0:
+        return np.zeros((0, npts), dtype=np.uint32)
+    data = numpy_support.vtk_to_numpy(cell_array.GetData())
+    return data.reshape(-1, npts + 1)[:, 1:].astype(np.uint32)
+
+
+def actor_geometry(actor, decimate=0.0):
+    """
+    Points (in world coordinates, so scaling like the vertical exaggeration is
+    kept), triangles, line segments, points and colours of a vtkActor (a vedo
+    Mesh, Points, Lines...), or None if it isn't polygonal data.
+    """
+    mapper = actor.GetMapper()
+    polydata = mapper.GetInput() if mapper is not None else None
+    if not isinstance(polydata, vtk.vtkPolyData) or polydata.GetNumberOfPoints() == 0:
+        return None
+
+    pd = vtk.vtkPolyData()
+    pd.ShallowCopy(polydata)
+    rgba = None
+    if mapper.GetScalarVisibility() and mapper.GetLookupTable() is not None:
+        colours = mapper.MapScalars(1.0)
+        if colours is not None and colours.GetNumberOfTuples() == pd.GetNumberOfPoints():
+            colours.SetName('rgba')
+            pd.GetPointData().AddArray(colours)
+            rgba = 'rgba'
+
+    transform = vtk.vtkTransform()
+    transform.SetMatrix(actor.GetMatrix())
+    tf = vtk.vtkTransformPolyDataFilter()
+    tf.SetTransform(transform)
+    tf.SetInputData(pd)
+    tri = vtk.vtkTriangleFilter()  # strips and polygons to triangles, polylines to segments
+    tri.SetInputConnection(tf.GetOutputPort())
+    clean = vtk.vtkCleanPolyData()  # merge coincident points: shared, indexed vertices
+    clean.SetInputConnection(tri.GetOutputPort())
+    clean.Update()
+    pd = clean.GetOutput()
+
+    if decimate > 0 and pd.GetNumberOfPolys() > 0 and pd.GetNumberOfLines() == 0:
+        # DecimatePro keeps a subset of the original points, so their colours too
+        dec = vtk.vtkDecimatePro()
+        dec.SetInputData(pd)
+        dec.SetTargetReduction(decimate)
+        dec.PreserveTopologyOn()
+        dec.Update()
+        pd = dec.GetOutput()
+
+    prop = actor.GetProperty()
+    geometry = dict(
+        points=numpy_support.vtk_to_numpy(pd.GetPoints().GetData()).astype(float),
+        triangles=_cells(pd.GetPolys(), 3),
+        lines=_cells(pd.GetLines(), 2),
+        verts=_cells(pd.GetVerts(), 1),
+        colours=None if rgba is None else
+        numpy_support.vtk_to_numpy(pd.GetPointData().GetArray(rgba)).astype(np.uint8),
+        colour=list(prop.GetColor()) + [prop.GetOpacity()])
+    return geometry
+
+
+def quantize(points):
+    """
+    points as 16 bit integers over their bounding box (each axis its own
+    step), with the offset and scale back. The error is up to scale / 2.
+    """
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    scale = np.where(hi > lo, (hi - lo) / 65535., 1.)
+    q = np.rint((points - lo) / scale).astype(np.uint16)
+    return q, lo, scale
+
+
+class GlbWriter:
+    """
+    Collects meshes into one glTF 2.0 binary file.
+    max_error: largest position error allowed for a quantized mesh, the
+    ones that need more are written as floats (None: always quantize).
+    """
+
+    def __init__(self, quantized=True, max_error=None):
+        self.quantized = quantized
+        self.max_error = max_error
+        self.buffer = bytearray()
+        self.gltf = dict(asset=dict(version='2.0', generator='flopyVedo'),
+                         scenes=[dict(nodes=[0])], scene=0,
+                         # z up (vtk) to y up (glTF): -90 degrees about x
+                         nodes=[dict(name='z-up', children=[],
+                                     rotation=[-np.sqrt(.5), 0., 0., np.sqrt(.5)])],
+                         meshes=[], materials=[], accessors=[], bufferViews=[],
+                         buffers=[dict(byteLength=0)])
+
+    def _view(self, data, target, stride=None):
+        while len(self.buffer) % 4:
+            self.buffer.append(0)
+        view = dict(buffer=0, byteOffset=len(self.buffer), byteLength=data.nbytes,
+                    target=target)
+        if stride:
+            view['byteStride'] = stride
+        self.gltf['bufferViews'].append(view)
+        self.buffer.extend(data.tobytes())
+        return len(self.gltf['bufferViews']) - 1
+
+    def _accessor(self, data, component_type, kind, target, normalized=False, bounds=False):
+        data = np.ascontiguousarray(data)
+        stride = None
+        if data.ndim == 2 and data.shape[1] == 3 and data.itemsize == 2:
+            # vertex attributes have to be 4 byte aligned: pad 16 bit xyz to xyz_
+            data = np.ascontiguousarray(np.pad(data, ((0, 0), (0, 1))))
+            stride = 8
+        accessor = dict(bufferView=self._view(data, target, stride),
+                        componentType=component_type, count=len(data), type=kind)
+        if normalized:
+            accessor['normalized'] = True
+        if bounds:
+            accessor['min'] = data[:, :3].min(axis=0).tolist()
+            accessor['max'] = data[:, :3].max(axis=0).tolist()
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def _indices(self, cells, nvert):
+        dtype, component = ((np.uint16, UNSIGNED_SHORT) if nvert < 65535 else
+                            (np.uint32, UNSIGNED_INT))
+        return self._accessor(cells.ravel().astype(dtype), component, 'SCALAR',
+                              ELEMENT_ARRAY_BUFFER)
+
+    def add_mesh(self, points, triangles=(), lines=(), verts=(), colours=None,
+                 colour=(0.8, 0.8, 0.8, 1.), name=''):
+        points = np.asarray(points, dtype=float)
+        q, offset, scale = quantize(points)
+        if self.quantized and (self.max_error is None or scale.max() / 2 <= self.max_error):
+            position = self._accessor(q, UNSIGNED_SHORT, 'VEC3', ARRAY_BUFFER, bounds=True)
+            node = dict(mesh=len(self.gltf['meshes']), translation=offset.tolist(),
+                        scale=scale.tolist())
+            self.gltf['extensionsUsed'] = ['KHR_mesh_quantization']
+            self.gltf['extensionsRequired'] = ['KHR_mesh_quantization']
+        else:
+            # float32 has ~7 digits: 0.03 m at UTM eastings, so from the corner
+            position = self._accessor((points - offset).astype(np.float32), FLOAT, 'VEC3',
+                                      ARRAY_BUFFER, bounds=True)
+            node = dict(mesh=len(self.gltf['meshes']), translation=offset.tolist())
+        attributes = dict(POSITION=position)
+        if colours is not None:
+            attributes['COLOR_0'] = self._accessor(colours[:, :4], UNSIGNED_BYTE, 'VEC4',
+                                                   ARRAY_BUFFER, normalized=True)
+
+        r, g, b, a = colour
+        material = dict(pbrMetallicRoughness=dict(
+            baseColorFactor=[1., 1., 1., a] if colours is not None else [r, g, b, a],
+            metallicFactor=0., roughnessFactor=0.8), doubleSided=True)
+        if a < 1:
+            material['alphaMode'] = 'BLEND'
+        self.gltf['materials'].append(material)
+
+        primitives = []
+        for cells, mode in ((triangles, TRIANGLES), (lines, LINES), (verts, POINTS)):
+            if len(cells):
+                primitives.append(dict(attributes=attributes, mode=mode,
+                                       material=len(self.gltf['materials']) - 1,
+                                       indices=self._indices(np.asarray(cells), len(points))))
+        if not primitives:
+            return
+        self.gltf['meshes'].append(dict(name=name, primitives=primitives))
+        node['name'] = name
+        self.gltf['nodes'].append(node)
+        self.gltf['nodes'][0]['children'].append(len(self.gltf['nodes']) - 1)
+
+    def write(self, fname):
+        while len(self.buffer) % 4:
+            self.buffer.append(0)
+        self.gltf['buffers'][0]['byteLength'] = len(self.buffer)
+        js = json.dumps(self.gltf, separators=(',', ':')).encode()
+        js += b' ' * (-len(js) % 4)
+        with open(fname, 'wb') as f:
+            f.write(struct.pack('<III', 0x46546C67, 2, 12 + 8 + len(js) + 8 + len(self.buffer)))
+            f.write(struct.pack('<II', len(js), 0x4E4F534A))  # JSON chunk
+            f.write(js)
+            f.write(struct.pack('<II', len(self.buffer), 0x004E4942))  # BIN chunk
+            f.write(bytes(self.buffer))
+        return fname
+
+
+def scene_actors(scene):
+    """Actors of a vedo Plotter (all sub-windows), or a list of actors as is."""
+    if isinstance(scene, (list, tuple)):
+        return list(scene)
+    actors = []
+    for renderer in (getattr(scene, 'renderers', None) or [scene.renderer]):
+        props = renderer.GetActors()
+        props.InitTraversal()
+        for _ in range(props.GetNumberOfItems()):
+            actors.append(props.GetNextActor())
+    return actors
+
+
+def write_viewer(glb_fname, title=None):
+    """three.js page next to the .glb that loads and orbits it."""
+    fname = os.path.splitext(glb_fname)[0] + '.html'
+    with open(fname, 'w') as f:
+        f.write(viewer_page.format(title=title or os.path.basename(glb_fname),
+                                   glb=os.path.basename(glb_fname)))
+    return fname
+
+
+def export_glb(scene, fname, decimate=0.0, quantized=True, max_error=None, html=True):
+    """
+    Write the visible actors of a Plotter (or a list of actors) to fname (.glb).
+    decimate: fraction of triangles to remove from each surface (0 keeps all).
+    quantized: False writes the positions as 32 bit floats instead.
+    max_error: in model units, actors whose 16 bit positions would be off by
+    more than this (large sites) are written as floats, the rest quantized.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    writer = GlbWriter(quantized, max_error)
+    for i, actor in enumerate(scene_actors(scene)):
+        if not actor.GetVisibility():
+            continue
+        geometry = actor_geometry(actor, decimate)
+        if geometry is not None:
+            writer.add_mesh(name=str(getattr(actor, 'name', None) or 'actor{}'.format(i)),
+                            **geometry)
+    writer.write(fname)
+    if html:
+        write_viewer(fname)
+    return fname
@@ -0,0 +1,221 @@
+"""
+Area weighted statistics of a raster (DEM, recharge, land use...) inside
+each triangle of a DISV grid, instead of the one value at its centroid.
+
+The area of every pixel inside every triangle is worked out once, exactly
+(each triangle clipped to each pixel square of its bounding box, all of them
+at once in numpy), and kept as a sparse (ncells, npixels) matrix. It only
+depends on the mesh and the raster's grid, so it's cached to ./working/cache/
+and every raster on the same grid reuses it:
+
+    zones = ZonalStats(tri.get_cell2d(), tri.get_vertices(), dem)
+    top = zones.mean(dem)                      # (ncpl,)
+    zones.stats(dem, percentiles=(10, 90))     # DataFrame: mean, min, max,
+                                               # p10, p90, coverage
+    zones.mean(recharge_raster)                # same grid, no new weights
+
+NODATA (NaN) pixels are left out. coverage is the part of each cell's area
+with data, a cell with none (or outside the raster) is NaN in every stat.
+min / max are of the pixels that touch the cell, percentiles are area
+weighted (the value below which that percent of the cell's area is).
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from tools.cache import cache_path, hash_key
+from tools.prismMesh import cell_vertices
+
+
+def _clip(poly, count, axis, bound, keep_above):
+    # one Sutherland-Hodgman pass: every polygon (n, m, 2) against its own
+    # axis-aligned line, keeping the side above (or below) bound
+    n = len(poly)
+    ar = np.arange(n)
+    out = np.zeros_like(poly)  # the unused rows past out_count stay 0 for _area
+    out_count = np.zeros(n, dtype=int)
+    for i in range(int(count.max(initial=0))):
+        active = i < count
+        cur = poly[:, i]
+        prev = poly[ar, np.where(i == 0, count - 1, i - 1)]
+        if keep_above:
+            cur_in, prev_in = cur[:, axis] >= bound, prev[:, axis] >= bound
+        else:
+            cur_in, prev_in = cur[:, axis] <= bound, prev[:, axis] <= bound
+        cross = active & (cur_in != prev_in)
+        with np.errstate(all='ignore'):  # t is only used where the edge crosses
+            t = (bound - prev[:, axis]) / (cur[:, axis] - prev[:, axis])
+            point = prev + t[:, None] * (cur - prev)
+        point[:, axis] = bound
+        out[ar[cross], out_count[cross]] = point[cross]
+        out_count += cross
+        keep = active & cur_in
+        out[ar[keep], out_count[keep]] = cur[keep]
+        out_count += keep
+    return out, out_count
+
+
+def _area(poly, count):
+    # shoelace of polygons with count vertices each (the rest of the rows unused)
+    ar = np.arange(len(poly))
+    total = np.zeros(len(poly))
+    for i in range(int(count.max(initial=0))):
+        active = i < count
+        nxt = np.where(i + 1 < count, i + 1, 0)
+        a, b = poly[:, i], poly[ar, nxt]
+        total += np.where(active, a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1], 0.)
+    return np.abs(total) / 2.
+
+
+def coverage_weights(triangles, xy, raster, max_pairs=2000000):
+    """
+    Sparse (ntriangles, nrows * ncols) matrix of the area of each pixel
+    (row major, row 0 north like Raster.z) inside each triangle.
+    """
+    nrows, ncols = raster.nrows, raster.ncols
+    # pixel units: u east from the left edge, v south from the top edge
+    u = (xy[:, 0] - raster.xllcorner) / raster.cellsize
+    v = (raster.yllcorner + raster.total_y - xy[:, 1]) / raster.cellsize
+    tu, tv = u[triangles], v[triangles]
+    c0 = np.maximum(np.floor(tu.min(axis=1)), 0).astype(int)
+    c1 = np.minimum(np.ceil(tu.max(axis=1)) - 1, ncols - 1).astype(int)
+    r0 = np.maximum(np.floor(tv.min(axis=1)), 0).astype(int)
+    r1 = np.minimum(np.ceil(tv.max(axis=1)) - 1, nrows - 1).astype(int)
+    nc = np.maximum(c1 - c0 + 1, 0)
+    npairs = nc * np.maximum(r1 - r0 + 1, 0)
+
+    rows, cols, data = [], [], []
+    ends = np.cumsum(npairs)
+    start = 0
+    while start < len(triangles):
+        # triangles in chunks of about max_pairs (triangle, pixel) pairs
+        first = ends[start] - npairs[start]  # pairs before this chunk
+        stop = max(int(np.searchsorted(ends, first + max_pairs, side='right')), start + 1)
+        t = np.repeat(np.arange(start, stop), npairs[start:stop])
+        # number of each pair within its triangle's bounding box
+        k = first + np.arange(len(t)) - np.repeat(ends[start:stop] - npairs[start:stop],
+                                                  npairs[start:stop])
+        col = c0[t] + k % nc[t]
+        row = r0[t] + k // np.maximum(nc[t], 1)
+
+        poly = np.zeros((len(t), 8, 2))
+        poly[:, :3, 0], poly[:, :3, 1] = tu[t], tv[t]
+        count = np.full(len(t), 3)
+        for axis, bound, above in ((0, col, True), (0, col + 1, False),
+                                   (1, row, True), (1, row + 1, False)):
+            poly, count = _clip(poly, count, axis, bound, above)
+        area = _area(poly, count)
+        keep = area > 1e-12
+        rows.append(t[keep])
+        cols.append(row[keep] * ncols + col[keep])
+        data.append(area[keep] * raster.cellsize ** 2)
+        start = stop
+
+    return sparse.csr_matrix((np.concatenate(data or [[]]),
+                              (np.concatenate(rows or [[]]).astype(int),
+                               np.concatenate(cols or [[]]).astype(int))),
+                             shape=(len(triangles), nrows * ncols))
+
+
+class ZonalStats:
+    """
+    cell2d, vertices: the DISV grid (triangles), raster: a tools.raster.Raster,
+    only its grid is used, the stats can be of any raster on the same grid.
+    """
+
+    def __init__(self, cell2d, vertices, raster, use_cache=True):
+        self.triangles, self.xy = cell_vertices(cell2d, vertices)
+        self.grid = (raster.xllcorner, raster.yllcorner, raster.cellsize,
+                     raster.nrows, raster.ncols)
+        p = self.xy[self.triangles]
+        self.cell_area = np.abs((p[:, 1, 0] - p[:, 0, 0]) * (p[:, 2, 1] - p[:, 0, 1]) -
+                                (p[:, 2, 0] - p[:, 0, 0]) * (p[:, 1, 1] - p[:, 0, 1])) / 2.
+        self.weights = None
+        if use_cache:
+            fname = cache_path('coverage', hash_key(self.triangles, self.xy, self.grid), 'npz')
+            try:
+                self.weights = sparse.load_npz(fname).tocsr()
+            except (OSError, ValueError):
+                self.weights = None
+        if self.weights is None:
+            self.weights = coverage_weights(self.triangles, self.xy, raster)
+            if use_cache:
+                sparse.save_npz(fname, self.weights)
+        # the row of each stored weight, for the per cell reductions
+        self._rows = np.repeat(np.arange(len(self.triangles)), np.diff(self.weights.indptr))
+
+    def _values(self, raster):
+        if hasattr(raster, 'z'):
+            grid = (raster.xllcorner, raster.yllcorner, raster.cellsize,
+                    raster.nrows, raster.ncols)
+            if not np.allclose(grid, self.grid):
+                raise ValueError('the raster is on another grid than the weights')
+            raster = raster.z
+        z = np.asarray(raster, dtype=float)
+        if z.shape != self.grid[3:]:
+            raise ValueError('raster of shape {}, the weights are for {}'.format(
+                z.shape, self.grid[3:]))
+        return z.ravel()
+
+    def covered_area(self, raster):
+        """Area of each cell with data (not NODATA)."""
+        return self.weights @ (~np.isnan(self._values(raster))).astype(float)
+
+    def mean(self, raster):
+        z = self._values(raster)
+        area = self.weights @ (~np.isnan(z)).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(area > 0, (self.weights @ np.nan_to_num(z)) / area, np.nan)
+
+    def _reduce(self, raster, ufunc, empty):
+        w = self.weights
+        z = self._values(raster)[w.indices]
+        z[np.isnan(z)] = empty
+        out = np.full(w.shape[0], np.nan)
+        filled = np.diff(w.indptr) > 0
+        if filled.any():
+            out[filled] = ufunc.reduceat(z, w.indptr[:-1][filled])
+        out[out == empty] = np.nan  # only NODATA in the cell
+        return out
+
+    def min(self, raster):
+        return self._reduce(raster, np.minimum, np.inf)
+
+    def max(self, raster):
+        return self._reduce(raster, np.maximum, -np.inf)
+
+    def percentile(self, raster, q):
+        """Area weighted percentile(s) q (0 to 100) of each cell, (ncells,) or (len(q), ncells)."""
+        qs = np.atleast_1d(np.asarray(q, dtype=float)) / 100.
+        z = self._values(raster)[self.weights.indices]
+        valid = ~np.isnan(z)
+        rows, z, w = self._rows[valid], z[valid], self.weights.data[valid]
+        order = np.lexsort((z, rows))
+        rows, z, w = rows[order], z[order], w[order]
+        ncells = len(self.triangles)
+        total = np.bincount(rows, weights=w, minlength=ncells)
+        counts = np.bincount(rows, minlength=ncells)
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        # cumulative area fraction inside each cell, offset by the cell number
+        # so one searchsorted finds every cell's percentile at once
+        before = np.concatenate(([0.], np.cumsum(total)))[rows]
+        key = rows + (np.cumsum(w) - before) / total[rows]
+        cells = np.arange(ncells)
+        out = np.full((len(qs), ncells), np.nan)
+        has = counts > 0
+        for i, fraction in enumerate(qs):
+            idx = np.searchsorted(key, cells + max(fraction, 1e-9))
+            idx = np.clip(idx, starts, ends - 1)  # round off at the ends of a cell
+            out[i, has] = z[idx[has]]
+        return out[0] if np.ndim(q) == 0 else out
+
+    def stats(self, raster, percentiles=()):
+        """DataFrame of mean, min, max, p<q> for each of percentiles, and coverage."""
+        table = pd.DataFrame({'mean': self.mean(raster), 'min': self.min(raster),
+                              'max': self.max(raster)})
+        if len(percentiles):
+            for q, values in zip(percentiles, self.percentile(raster, list(percentiles))):
+                table['p{:g}'.format(q)] = values
+        table['coverage'] = self.covered_area(raster) / self.cell_area
+        return table